@@ -225,7 +225,15 @@ if __name__ == "__main__":
         'METRICS_PORT': int(config.get('METRICS_PORT', 9090)),
         'LOG_PATH': config.get('LOG_PATH', 'logs'),
         'ALERT_THRESHOLD': int(config.get('ALERT_THRESHOLD', 90)),
-        'REDIS_URL': config.get('REDIS_URL', 'redis://localhost:6379')
+        'REDIS_URL': config.get('REDIS_URL', 'redis://localhost:6379'),
+        'SAMPLE_INTERVAL': float(config.get('SAMPLE_INTERVAL', 1.0)),
+        'SAMPLE_BUCKET': int(config.get('SAMPLE_BUCKET', 10)),
+        'SAMPLE_FLUSH_INTERVAL': float(config.get('SAMPLE_FLUSH_INTERVAL', 60)),
+        'SAMPLE_BUFFER': int(config.get('SAMPLE_BUFFER', 3600)),
+        'METRICS_RETENTION': int(config.get('METRICS_RETENTION', 8640)),
+        'PROFILING': config.get('PROFILING', '0'),
+        'PROFILE_INTERVAL': float(config.get('PROFILE_INTERVAL', 0.01)),
+        'PROFILE_WINDOW': float(config.get('PROFILE_WINDOW', 30))
     }
 
     monitor = EnterpriseMonitor(monitoring_config)
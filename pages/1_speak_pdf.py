@@ -19,6 +19,12 @@ from src.work_nvidia import (
 from src.vector import load_index_from_disk, persist_index_to_disk
 from IPython import embed
 from src.distributed_processor import DistributedPDFProcessor
+from src.rate_limit import make_rate_limiter
+from src.sharding import ClusterMembership
+from src.tracing import instrument_llama_index, trace
+from src.profiler import profile, profiling_settings
+from contextlib import nullcontext
+from redis import Redis
 
 
 # where I am
@@ -203,6 +209,10 @@ def main(
                                 key="pdf_query",
                             )
                             st.session_state["chat_true1"] = "chat activo"
+                            profiling = profiling_settings(config)
+                            profile_answer = profiling["enabled"] and st.checkbox(
+                                "Profile this answer", key="profile_answer1"
+                            )
                             if (
                                 input_prompt
                                 and st.session_state["salir_1"] == False
@@ -214,9 +224,21 @@ def main(
                                             st.session_state["vector_store1"]
                                         )
                                     )
-                                response = st.session_state["llamaindex1"].chat(
-                                    input_prompt
-                                )
+                                with trace(
+                                    "chat",
+                                    log_threshold=float(config.get("TRACE_LOG_THRESHOLD", 1.0)),
+                                ), (
+                                    profile(
+                                        "streamlit-chat",
+                                        profiling["profile_dir"],
+                                        interval=profiling["interval"],
+                                    )
+                                    if profile_answer
+                                    else nullcontext()
+                                ):
+                                    response = st.session_state["llamaindex1"].chat(
+                                        input_prompt
+                                    )
                                 st.session_state["upload_state1"] = str(response)
                                 st.session_state["chat_history1"].append(
                                     (input_prompt, str(response))
@@ -270,6 +292,9 @@ if __name__ == "__main__":
             path = Path(ROOT_DIR)
             config = dotenv_values(os.path.join(path.parent.absolute(), "keys", ".env"))
 
+            # Shared provider quotas (requests/min, tokens/min) across workers
+            if "rate_limiter1" not in st.session_state:
+                st.session_state["rate_limiter1"] = make_rate_limiter(config)
             # Initialize Model
             if "chat1" not in st.session_state:
                 llm_provider = config.get("LLM_PROVIDER", "openai")
@@ -279,6 +304,7 @@ if __name__ == "__main__":
                     st.session_state["chat1"] = get_llm(
                         provider="openai",
                         model=config.get("OPENAI_MODEL"),
+                        rate_limiter=st.session_state["rate_limiter1"],
                     )
                 
                 elif llm_provider == "claude":
@@ -286,24 +312,45 @@ if __name__ == "__main__":
                     st.session_state["chat1"] = get_llm(
                         provider="claude",
                         model=config.get("ANTHROPIC_MODEL"),
+                        rate_limiter=st.session_state["rate_limiter1"],
                     )
                 
                 elif llm_provider == "azure":
                     st.session_state["chat1"] = get_llm(
                         provider="azure",
                         model=config.get("AZURE_OPENAI_MODEL"),
+                        rate_limiter=st.session_state["rate_limiter1"],
                         deployment_name=config.get("AZURE_OPENAI_DEPLOYMENT_NAME"),
                         api_base=config.get("AZURE_OPENAI_API_BASE"),
                         api_key=config.get("AZURE_OPENAI_API_KEY"),
                         api_version=config.get("AZURE_OPENAI_API_VERSION"),
                     )
+                
+                elif llm_provider == "local":
+                    # Offline provider for load tests, no network access needed
+                    st.session_state["chat1"] = get_llm(
+                        provider="local",
+                        model=config.get("LOCAL_MODEL"),
+                        max_tokens=int(config.get("LOCAL_NUM_OUTPUT", 128)),
+                        first_token_latency=float(config.get("LOCAL_FIRST_TOKEN_LATENCY", 0.0)),
+                        tokens_per_second=float(config.get("LOCAL_TOKENS_PER_SECOND", 0.0)),
+                    )
             # Initialize embeddings models
             logging.info(f"Model {config.get('NVIDIA_MODEL')} initialized")
             # Nvidia embeddings model NVIDIA_EMBEDDINGS
             if "embeddings1" not in st.session_state:
-                st.session_state["embeddings1"] = get_embeddings(
-                    model=config["NVIDIA_EMBEDDINGS"],
-                )
+                if config.get("EMBEDDINGS_PROVIDER", "nvidia") == "local":
+                    st.session_state["embeddings1"] = get_embeddings(
+                        model=config.get("NVIDIA_EMBEDDINGS"),
+                        provider="local",
+                        call_latency=float(config.get("LOCAL_EMBED_CALL_LATENCY", 0.0)),
+                        text_latency=float(config.get("LOCAL_EMBED_TEXT_LATENCY", 0.0)),
+                    )
+                else:
+                    st.session_state["embeddings1"] = get_embeddings(
+                        model=config["NVIDIA_EMBEDDINGS"],
+                        rate_limiter=st.session_state["rate_limiter1"],
+                    )
             logging.info(
                 f"Model Embeddings: {config.get('NVIDIA_EMBEDDINGS')} initialized"
             )
@@ -312,6 +359,7 @@ if __name__ == "__main__":
                     model=st.session_state["chat1"],
                     embeddings=st.session_state["embeddings1"],
                 )
+            instrument_llama_index()
             logging.info("LLama Index  initialized")
             # check if we have the index presisted in the folder
             if "db_local_folder1" not in st.session_state:
@@ -351,7 +399,13 @@ if __name__ == "__main__":
                 st.session_state["vector_store1"] = None
 
             if "processor" not in st.session_state:
-                st.session_state.processor = DistributedPDFProcessor()
+                membership = None
+                if str(config.get("SHARDING", "0")).lower() in ("1", "true"):
+                    # Route uploads to the worker node that owns each document
+                    membership = ClusterMembership(
+                        Redis.from_url(config.get("REDIS_URL", "redis://localhost:6379"))
+                    )
+                st.session_state.processor = DistributedPDFProcessor(config, membership=membership)
                 
             # Add batch upload support
             uploaded_files = st.file_uploader(
@@ -1,23 +1,521 @@
-from fastapi import FastAPI, BackgroundTasks
-from typing import List
+"""
+HTTP API for batch ingestion and querying.
 
-app = FastAPI()
-processor = DistributedPDFProcessor()
-monitor = ProcessingMonitor()
+    uvicorn src.api:app --host 0.0.0.0 --port 8000
 
-@app.post("/batch-process")
-async def batch_process_pdfs(
-    pdf_paths: List[str],
-    background_tasks: BackgroundTasks
-):
-    """API endpoint for batch processing"""
-    background_tasks.add_task(
-        processor.process_pdf_batch,
-        pdf_paths
+PDFs are queued on the Redis job queue and processed by src/pdf_worker.py.
+Progress lives in one Redis hash per batch, which workers update after
+every page range; GET /status/{batch_id} reads it once and
+GET /status/{batch_id}/events pushes it as Server-Sent Events whenever
+it changes.
+
+Indexes under saves/<name> are loaded once per process and shared by all
+query requests. A batch query embeds every question in one embedding
+call, then retrieves and answers the questions concurrently.
+
+With SHARDING=1 each worker node keeps its documents in
+saves/<name>/<node id>. Query endpoints then embed the questions once,
+fan retrieval out to every live node's
+POST /indexes/{name}/shards/{node_id}/retrieve (at its SHARD_ADDRESS),
+merge the hits by score and answer from the merged hits. Chat retrieves
+the same way for every message.
+
+WS /indexes/{name}/chat keeps a chat engine and memory per connection.
+Client messages are JSON: {"type": "message", "content": ...},
+{"type": "cancel"} and {"type": "reset"}. The server answers with
+"session", "token", "done", "cancelled", "reset" and "error" messages.
+"""
+from typing import Dict, List, Literal, Optional, Tuple
+import asyncio
+import os
+import urllib.request
+import orjson
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from llama_index.core import QueryBundle, VectorStoreIndex, get_response_synthesizer
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+from pydantic import BaseModel, Field
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from src.chat_sessions import ChatSessionPool
+from src.context_packing import ContextPacker
+from src.distributed_processor import DistributedPDFProcessor
+from src.pdf_worker import ROOT_DIR, load_worker_config
+from src.profiler import install_signal_trigger, profile, profile_window, profiling_settings
+from src.rate_limit import aget_query_embeddings, make_rate_limiter
+from src.sharding import ClusterMembership, ShardRouter
+from src.tracing import instrument_llama_index, span, trace
+from src.vector import load_index_from_disk
+from src.work_nvidia import (
+    CONTEXT_TOKEN_BUDGET,
+    create_chat_engine,
+    get_embeddings,
+    get_llm,
+    setup_index,
+)
+
+# Seconds between keep-alive comments on an idle event stream
+SSE_KEEPALIVE = 15
+
+config = load_worker_config()
+app = FastAPI(default_response_class=ORJSONResponse)
+processor = DistributedPDFProcessor(config)
+async_redis = AsyncRedis.from_url(config.get('REDIS_URL', 'redis://localhost:6379'))
+
+# Questions answered at once across all requests, and per batch request
+QUERY_CONCURRENCY = int(config.get('QUERY_CONCURRENCY', 16))
+MAX_BATCH_QUESTIONS = int(config.get('MAX_BATCH_QUESTIONS', 256))
+# Requests slower than this many seconds log their per-span breakdown
+TRACE_LOG_THRESHOLD = float(config.get('TRACE_LOG_THRESHOLD', 1.0))
+# PROFILING=1 allows X-Profile: 1 requests, POST /debug/profile and kill -USR2
+profiling = profiling_settings(config)
+if profiling['enabled']:
+    install_signal_trigger(profiling['profile_dir'], seconds=profiling['window'])
+# SHARDING=1 fans queries out to every live node; seconds to wait per node
+SHARD_QUERY_TIMEOUT = float(config.get('SHARD_QUERY_TIMEOUT', 30))
+shard_router = None
+if str(config.get('SHARDING', '0')).lower() in ('1', 'true'):
+    shard_router = ShardRouter(ClusterMembership(
+        Redis.from_url(config.get('REDIS_URL', 'redis://localhost:6379')),
+        ttl=int(config.get('SHARD_TTL', 30)),
+    ))
+
+
+def _make_llm(config: Dict, rate_limiter=None):
+    """LLM for LLM_PROVIDER, configured like the Streamlit page"""
+    provider = config.get('LLM_PROVIDER', 'openai')
+    if provider == 'openai':
+        os.environ['OPENAI_API_KEY'] = config.get('OPENAI_API_KEY') or ''
+        return get_llm(provider='openai', model=config.get('OPENAI_MODEL'), rate_limiter=rate_limiter)
+    if provider == 'claude':
+        os.environ['ANTHROPIC_API_KEY'] = config.get('ANTHROPIC_API_KEY') or ''
+        return get_llm(provider='claude', model=config.get('ANTHROPIC_MODEL'), rate_limiter=rate_limiter)
+    if provider == 'azure':
+        return get_llm(
+            provider='azure',
+            model=config.get('AZURE_OPENAI_MODEL'),
+            rate_limiter=rate_limiter,
+            deployment_name=config.get('AZURE_OPENAI_DEPLOYMENT_NAME'),
+            api_base=config.get('AZURE_OPENAI_API_BASE'),
+            api_key=config.get('AZURE_OPENAI_API_KEY'),
+            api_version=config.get('AZURE_OPENAI_API_VERSION'),
+        )
+    if provider == 'local':
+        return get_llm(
+            provider='local',
+            model=config.get('LOCAL_MODEL'),
+            max_tokens=int(config.get('LOCAL_NUM_OUTPUT', 128)),
+            first_token_latency=float(config.get('LOCAL_FIRST_TOKEN_LATENCY', 0.0)),
+            tokens_per_second=float(config.get('LOCAL_TOKENS_PER_SECOND', 0.0)),
+        )
+    raise ValueError(f"Unsupported LLM provider: {provider}")
+
+
+def _make_embeddings(config: Dict, rate_limiter=None):
+    if config.get('EMBEDDINGS_PROVIDER', 'nvidia') == 'local':
+        return get_embeddings(
+            model=config.get('NVIDIA_EMBEDDINGS'),
+            provider='local',
+            call_latency=float(config.get('LOCAL_EMBED_CALL_LATENCY', 0.0)),
+            text_latency=float(config.get('LOCAL_EMBED_TEXT_LATENCY', 0.0)),
+        )
+    return get_embeddings(model=config.get('NVIDIA_EMBEDDINGS'), rate_limiter=rate_limiter)
+
+
+rate_limiter = make_rate_limiter(config)
+llm = _make_llm(config, rate_limiter)
+embed_model = _make_embeddings(config, rate_limiter)
+setup_index(model=llm, embeddings=embed_model)
+instrument_llama_index()
+
+# name or name/shard -> (docstore.json mtime when loaded, index)
+_indexes: Dict[str, Tuple[int, VectorStoreIndex]] = {}
+_index_lock = asyncio.Lock()
+_query_slots = asyncio.Semaphore(QUERY_CONCURRENCY)
+chat_sessions = ChatSessionPool(
+    max_sessions=int(config.get('CHAT_MAX_SESSIONS', 200)),
+    idle_ttl=float(config.get('CHAT_IDLE_TTL', 900)),
+)
+
+
+class QueryRequest(BaseModel):
+    question: str
+    top_k: int = Field(default=4, ge=1, le=50)
+    mode: Literal['answer', 'retrieve'] = 'answer'
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    top_k: int = Field(default=4, ge=1, le=50)
+    mode: Literal['answer', 'retrieve'] = 'answer'
+
+
+class ShardRetrieveRequest(BaseModel):
+    questions: List[str]
+    embeddings: List[List[float]]
+    top_k: int = Field(default=4, ge=1, le=50)
+
+
+def _index_path(name: str, shard: Optional[str] = None) -> str:
+    """saves/<name>[/<shard>], rejecting names that would leave saves/"""
+    parts = (name, shard) if shard else (name,)
+    for part in parts:
+        if not part or part.startswith('.') or os.path.basename(part) != part:
+            raise HTTPException(status_code=400, detail=f"Invalid index name {'/'.join(parts)}")
+    return os.path.join(ROOT_DIR, 'saves', *parts)
+
+
+async def get_index(name: str, shard: Optional[str] = None) -> VectorStoreIndex:
+    """
+    Index saves/<name>, or one node's shard saves/<name>/<shard>, loaded on
+    first use and shared afterwards; reloaded once workers have written to
+    it (docstore.json changed)
+    """
+    key = f"{name}/{shard}" if shard else name
+    path = _index_path(name, shard)
+    try:
+        mtime = os.stat(os.path.join(path, 'docstore.json')).st_mtime_ns
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown index {key}")
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    async with _index_lock:
+        # Another request may have loaded it while we waited
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        # Workers write the index under this lock; while one is writing,
+        # keep serving the copy already loaded rather than a half-written one
+        lock = async_redis.lock(f"index_lock:{path}", timeout=600)
+        if not await lock.acquire(blocking=cached is None, blocking_timeout=60):
+            if cached is None:
+                raise HTTPException(status_code=503, detail=f"Index {key} is being written, retry shortly")
+            return cached[1]
+        try:
+            mtime = os.stat(os.path.join(path, 'docstore.json')).st_mtime_ns
+            index = await asyncio.to_thread(load_index_from_disk, path)
+        finally:
+            await lock.release()
+        _indexes[key] = (mtime, index)
+        return index
+
+
+def _hit(node_with_score) -> Dict:
+    return {
+        'node_id': node_with_score.node.node_id,
+        'score': node_with_score.score,
+        'text': node_with_score.node.get_content(),
+        'metadata': node_with_score.node.metadata,
+    }
+
+
+async def _run_query(index: VectorStoreIndex, question: str, embedding: List[float], top_k: int, mode: str) -> Dict:
+    """Retrieve (and answer) one question whose embedding is already computed"""
+    bundle = QueryBundle(query_str=question, embedding=embedding)
+    async with _query_slots:
+        if mode == 'retrieve':
+            nodes = await index.as_retriever(similarity_top_k=top_k).aretrieve(bundle)
+            return {'question': question, 'hits': [_hit(n) for n in nodes]}
+        engine = index.as_query_engine(
+            llm=llm,
+            similarity_top_k=top_k,
+            node_postprocessors=[ContextPacker(token_budget=CONTEXT_TOKEN_BUDGET)],
+        )
+        response = await engine.aquery(bundle)
+    return {
+        'question': question,
+        'answer': str(response),
+        'hits': [_hit(n) for n in response.source_nodes],
+    }
+
+
+def _shard_retrieve(name: str, questions: List[str], embeddings: List[List[float]], top_k: int) -> List[List[Dict]]:
+    """Retrieve from every live node's shard and keep each question's best top_k hits"""
+    body = orjson.dumps({'questions': questions, 'embeddings': embeddings, 'top_k': top_k})
+
+    def call(node: str, address: str) -> List[Dict]:
+        request = urllib.request.Request(
+            f"{address.rstrip('/')}/indexes/{name}/shards/{node}/retrieve",
+            data=body,
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=SHARD_QUERY_TIMEOUT) as response:
+            return orjson.loads(response.read())['hits']
+
+    ranked: List[List[Dict]] = [[] for _ in questions]
+    # fan_out returns every node's hits sorted by score
+    for hit in shard_router.fan_out(call, timeout=SHARD_QUERY_TIMEOUT):
+        hits = ranked[hit.pop('question')]
+        if len(hits) < top_k:
+            hits.append(hit)
+    return ranked
+
+
+def _node_from_hit(hit: Dict) -> NodeWithScore:
+    return NodeWithScore(
+        node=TextNode(id_=hit['node_id'], text=hit['text'], metadata=hit['metadata']), score=hit['score']
     )
-    return {"status": "processing_started"}
+
+
+class ShardedRetriever(BaseRetriever):
+    """Retriever over every live node's shard of saves/<name>, for chat with SHARDING=1"""
+
+    def __init__(self, name: str, top_k: int = DEFAULT_SIMILARITY_TOP_K):
+        self.name = name
+        self.top_k = top_k
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding or embed_model.get_query_embedding(query_bundle.query_str)
+        hits, = _shard_retrieve(self.name, [query_bundle.query_str], [embedding], self.top_k)
+        return [_node_from_hit(hit) for hit in hits]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding or await embed_model.aget_query_embedding(query_bundle.query_str)
+        with span('shard_fan_out'):
+            hits, = await asyncio.to_thread(
+                _shard_retrieve, self.name, [query_bundle.query_str], [embedding], self.top_k
+            )
+        return [_node_from_hit(hit) for hit in hits]
+
+
+async def _answer_from_hits(question: str, embedding: List[float], hits: List[Dict], mode: str) -> Dict:
+    """Answer one question from hits merged across shards"""
+    if mode == 'retrieve':
+        return {'question': question, 'hits': hits}
+    bundle = QueryBundle(query_str=question, embedding=embedding)
+    nodes = [_node_from_hit(hit) for hit in hits]
+    async with _query_slots:
+        nodes = ContextPacker(token_budget=CONTEXT_TOKEN_BUDGET).postprocess_nodes(nodes, query_bundle=bundle)
+        response = await get_response_synthesizer(llm=llm).asynthesize(bundle, nodes)
+    return {'question': question, 'answer': str(response), 'hits': hits}
+
+
+@app.on_event("startup")
+async def preload_index():
+    """Load INDEX_NAME before the first request, when it exists"""
+    name = config.get('INDEX_NAME')
+    if name and os.path.isfile(os.path.join(ROOT_DIR, 'saves', name, 'docstore.json')):
+        await get_index(name)
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    Profile a request sent with X-Profile: 1. Samples the event loop
+    thread, so concurrent requests on the same loop show up as well.
+    """
+    if not profiling['enabled'] or request.headers.get('x-profile') != '1':
+        return await call_next(request)
+    with profile(
+        f"{request.method}-{request.url.path}", profiling['profile_dir'], interval=profiling['interval']
+    ) as sampler:
+        response = await call_next(request)
+    response.headers['X-Profile-Path'] = sampler.path
+    return response
+
+
+@app.on_event("shutdown")
+async def close_chat_sessions():
+    await chat_sessions.close()
+
+
+@app.post("/batch-process")
+async def batch_process_pdfs(pdf_paths: List[str], tenant: str = 'default'):
+    """Queue PDFs (paths on storage shared with the workers) as one bulk batch billed to tenant"""
+    if not pdf_paths:
+        raise HTTPException(status_code=400, detail="pdf_paths is empty")
+    batch_id = await asyncio.to_thread(processor.process_pdf_batch, pdf_paths, tenant=tenant)
+    return {
+        "batch_id": batch_id,
+        "status": "queued",
+        "total": len(pdf_paths),
+        "status_url": f"/status/{batch_id}",
+        "events_url": f"/status/{batch_id}/events",
+    }
+
 
 @app.get("/status/{batch_id}")
 async def get_batch_status(batch_id: str):
-    """Check processing status"""
-    return await processor.get_batch_status(batch_id) 
\ No newline at end of file
+    """Batch, per-document and per-page progress"""
+    status = await processor.get_batch_status(batch_id)
+    if status['status'] == 'unknown':
+        raise HTTPException(status_code=404, detail=f"Unknown batch {batch_id}")
+    return status
+
+
+@app.get("/status/{batch_id}/events")
+async def batch_events(batch_id: str, request: Request):
+    """Server-Sent Events stream of batch progress; ends when the batch completes"""
+    batch_key = processor.batch_prefix + batch_id
+    if not await async_redis.exists(batch_key):
+        raise HTTPException(status_code=404, detail=f"Unknown batch {batch_id}")
+
+    async def stream():
+        pubsub = async_redis.pubsub()
+        # Subscribe before the first read so no update falls in between
+        await pubsub.subscribe(processor.progress_channel(batch_id))
+        try:
+            last = None
+            while not await request.is_disconnected():
+                status = processor.parse_batch_status(batch_id, await async_redis.hgetall(batch_key))
+                payload = orjson.dumps(status)
+                if payload != last:
+                    yield b"event: progress\ndata: " + payload + b"\n\n"
+                    last = payload
+                if status['status'] != 'processing':
+                    break
+
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_KEEPALIVE)
+                if message is None:
+                    yield b": keep-alive\n\n"
+                    continue
+                # Coalesce a burst of updates into one hash read
+                while await pubsub.get_message(ignore_subscribe_messages=True, timeout=0):
+                    pass
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/indexes/{name}/query")
+async def query_index(name: str, request: QueryRequest):
+    """Answer, or only retrieve for, one question against saves/<name> (every shard with SHARDING=1)"""
+    index = await get_index(name) if shard_router is None else None
+    with trace('query', log_threshold=TRACE_LOG_THRESHOLD, index=name):
+        embedding = await embed_model.aget_query_embedding(request.question)
+        if index is None:
+            with span('shard_fan_out'):
+                hits, = await asyncio.to_thread(_shard_retrieve, name, [request.question], [embedding], request.top_k)
+            return await _answer_from_hits(request.question, embedding, hits, request.mode)
+        return await _run_query(index, request.question, embedding, request.top_k, request.mode)
+
+
+@app.post("/indexes/{name}/query/batch")
+async def query_index_batch(name: str, request: BatchQueryRequest):
+    """Many questions against saves/<name>: one embedding call, concurrent retrieval and answers"""
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="questions is empty")
+    if len(request.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch"
+        )
+    index = await get_index(name) if shard_router is None else None
+    with trace('query_batch', log_threshold=TRACE_LOG_THRESHOLD, index=name, questions=len(request.questions)):
+        with span('embed_questions'):
+            embeddings = await aget_query_embeddings(embed_model, request.questions)
+        if index is None:
+            # One call per node for the whole batch
+            with span('shard_fan_out'):
+                ranked = await asyncio.to_thread(
+                    _shard_retrieve, name, request.questions, embeddings, request.top_k
+                )
+            queries = (
+                _answer_from_hits(question, embedding, hits, request.mode)
+                for question, embedding, hits in zip(request.questions, embeddings, ranked)
+            )
+        else:
+            queries = (
+                _run_query(index, question, embedding, request.top_k, request.mode)
+                for question, embedding in zip(request.questions, embeddings)
+            )
+        results = await asyncio.gather(*queries, return_exceptions=True)
+    return {
+        'index': name,
+        'results': [
+            {'question': q, 'error': str(r)} if isinstance(r, Exception) else r
+            for q, r in zip(request.questions, results)
+        ],
+    }
+
+
+@app.post("/indexes/{name}/shards/{node_id}/retrieve")
+async def retrieve_from_shard(name: str, node_id: str, request: ShardRetrieveRequest):
+    """This node's part of a fanned-out query: retrieval only, questions already embedded"""
+    if len(request.questions) != len(request.embeddings):
+        raise HTTPException(status_code=400, detail="questions and embeddings differ in length")
+    try:
+        index = await get_index(name, shard=node_id)
+    except HTTPException as e:
+        if e.status_code != 404:
+            raise
+        # A node that has not ingested anything yet has no index
+        return {'hits': []}
+    results = await asyncio.gather(*(
+        _run_query(index, question, embedding, request.top_k, 'retrieve')
+        for question, embedding in zip(request.questions, request.embeddings)
+    ))
+    return {
+        'hits': [dict(hit, question=i) for i, result in enumerate(results) for hit in result['hits']]
+    }
+
+
+@app.websocket("/indexes/{name}/chat")
+async def chat(websocket: WebSocket, name: str):
+    """
+    Streaming chat with saves/<name> (every shard with SHARDING=1); one chat
+    engine and memory per connection
+    """
+    try:
+        if shard_router is None:
+            engine = create_chat_engine(await get_index(name))
+        else:
+            _index_path(name)
+            engine = create_chat_engine(retriever=ShardedRetriever(name))
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    await websocket.accept()
+    session = await chat_sessions.open(engine, websocket, trace_log_threshold=TRACE_LOG_THRESHOLD)
+    try:
+        await session.send({'type': 'session', 'session_id': session.session_id})
+        while True:
+            raw = await websocket.receive_text()
+            chat_sessions.touch(session)
+            try:
+                message = orjson.loads(raw)
+                kind = message.get('type')
+            except (orjson.JSONDecodeError, AttributeError):
+                await session.send({'type': 'error', 'detail': 'Messages must be JSON objects'})
+                continue
+
+            if kind == 'message':
+                if session.generating:
+                    await session.send({'type': 'error', 'detail': 'An answer is still streaming; cancel it first'})
+                elif not message.get('content'):
+                    await session.send({'type': 'error', 'detail': 'content is empty'})
+                else:
+                    session.start(message['content'])
+            elif kind == 'cancel':
+                await session.send({'type': 'cancelled', 'generating': await session.cancel()})
+            elif kind == 'reset':
+                await session.cancel()
+                session.engine.reset()
+                await session.send({'type': 'reset'})
+            else:
+                await session.send({'type': 'error', 'detail': f"Unknown message type {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await chat_sessions.release(session)
+
+
+@app.post("/debug/profile")
+async def start_profile_window(seconds: float = 30):
+    """Profile every thread of this API process for `seconds`"""
+    if not profiling['enabled']:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    path = profile_window(min(seconds, 600), profiling['profile_dir'], interval=profiling['interval'])
+    if path is None:
+        raise HTTPException(status_code=409, detail="A profile window is already running")
+    return {'status': 'profiling', 'seconds': min(seconds, 600), 'path': path}
@@ -0,0 +1,347 @@
+"""
+Autoscaling of StagedPipeline worker pools and ScalableThreadPool executors.
+
+    pipeline = build_ingestion_pipeline(embed_model, index_dir)
+    scaler = PipelineAutoscaler(pipeline, {'parse': (2, 16), 'embed': (2, 32)}, monitor=monitor)
+    scaler.start()
+    pipeline.run(page_range_shards(paths))
+    scaler.stop()
+
+Each tick compares, per stage, how full its input queue is and how busy
+its workers were since the last tick. A stage grows when work is waiting
+and workers are saturated. It shrinks when workers sit idle. A change
+needs `patience` consecutive ticks agreeing and is followed by a
+cooldown, so the pool does not flap. Growth is held back when CPU (for
+CPU-bound stages) or memory is above its limit, or when per-item
+latency has risen well above its baseline, which means extra workers
+only add contention or provider throttling.
+
+A ScalableThreadPool is an Executor that reports itself as one stage
+named 'pool', so services that submit work to a thread pool are scaled
+the same way:
+
+    executor = ScalableThreadPool(1)
+    PipelineAutoscaler(executor, {'pool': (1, 8)}).start()
+"""
+from typing import Dict, Optional, Tuple
+from concurrent.futures import Executor, Future
+from datetime import datetime
+import logging
+import queue
+import threading
+import time
+import psutil
+from prometheus_client import Counter, Gauge
+
+# Autoscaler metrics
+pool_workers = Gauge('autoscaler_workers', 'Workers per autoscaled stage', ['stage'])
+scaling_decisions = Counter(
+    'autoscaler_decisions_total', 'Scaling decisions', ['stage', 'direction', 'reason']
+)
+
+
+def parse_autoscale_bounds(spec: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parse AUTOSCALE_BOUNDS, e.g. "parse=1-4;embed=2-16" into
+    {"parse": (1, 4), "embed": (2, 16)}
+    """
+    bounds = {}
+    for entry in filter(None, (e.strip() for e in (spec or "").split(";"))):
+        try:
+            name, values = entry.split("=", 1)
+            low, _, high = values.partition("-")
+            low, high = int(low), int(high or low)
+            if not 1 <= low <= high:
+                raise ValueError(entry)
+            bounds[name.strip()] = (low, high)
+        except ValueError:
+            logging.error(f"Ignoring malformed autoscale bounds entry: {entry}")
+    return bounds
+
+
+_RETIRE = object()
+
+
+class ScalableThreadPool(Executor):
+    """
+    Thread pool whose size can change while it runs. Tasks wait in one
+    unbounded queue; snapshot() reports the pool as a stage named 'pool'
+    whose queue counts as full at one waiting task per worker. Surplus
+    workers retire after their current task, idle ones at once.
+    """
+
+    def __init__(self, workers: int = 1, thread_name_prefix: str = 'scalable-pool'):
+        self.thread_name_prefix = thread_name_prefix
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._target = max(1, workers)
+        self._active = 0
+        self._retiring = 0
+        self._spawned = 0
+        self._threads = set()
+        self._shutdown = False
+        self._stats = {'processed': 0, 'errors': 0, 'busy_seconds': 0.0, 'worker_seconds': 0.0}
+        self._since = time.perf_counter()
+        with self._lock:
+            self._fill()
+
+    def _account(self, now: float):
+        """Add worker-seconds of capacity since the last change (lock held)"""
+        self._stats['worker_seconds'] += self._active * (now - self._since)
+        self._since = now
+
+    def _fill(self):
+        """Start or retire workers until target are left (lock held)"""
+        while self._active - self._retiring < self._target:
+            self._account(time.perf_counter())
+            self._active += 1
+            self._spawned += 1
+            thread = threading.Thread(
+                target=self._worker, name=f"{self.thread_name_prefix}-{self._spawned}", daemon=True
+            )
+            self._threads.add(thread)
+            thread.start()
+        while self._active - self._retiring > self._target:
+            self._retiring += 1
+            self._queue.put(_RETIRE)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                # Shutdown: leave the marker for the other workers
+                self._queue.put(None)
+                break
+            if item is _RETIRE:
+                with self._lock:
+                    self._retiring -= 1
+                break
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                status = 'errors'
+            else:
+                future.set_result(result)
+                status = 'processed'
+            with self._lock:
+                self._stats[status] += 1
+                self._stats['busy_seconds'] += time.perf_counter() - start
+        with self._lock:
+            self._account(time.perf_counter())
+            self._active -= 1
+            self._threads.discard(threading.current_thread())
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            future = Future()
+            self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def resize(self, stage_name: str, workers: int):
+        """Set the worker count (at least 1); stage_name is always 'pool'"""
+        with self._lock:
+            if self._shutdown:
+                return
+            self._target = max(1, workers)
+            self._fill()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """The pool as one stage, in StagedPipeline.snapshot() form"""
+        with self._lock:
+            self._account(time.perf_counter())
+            return {'pool': dict(
+                self._stats,
+                workers=self._target,
+                queue_depth=self._queue.qsize(),
+                queue_size=self._target,
+                done=self._shutdown,
+            )}
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+        if cancel_futures:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, tuple):
+                    item[0].cancel()
+        self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+class PipelineAutoscaler:
+    def __init__(
+        self,
+        pipeline,
+        bounds: Dict[str, Tuple[int, int]],
+        interval: float = 5.0,
+        monitor=None,
+        cpu_bound: Tuple[str, ...] = ('parse', 'chunk'),
+        scale_up_fill: float = 0.5,
+        scale_up_utilization: float = 0.8,
+        scale_down_utilization: float = 0.3,
+        max_cpu: float = 85.0,
+        max_memory: float = 90.0,
+        latency_factor: float = 2.0,
+        patience: int = 2,
+        cooldown: int = 3,
+        step: int = 2,
+    ):
+        """
+        Args:
+            pipeline: StagedPipeline whose stages are resized while it runs,
+                or a ScalableThreadPool (stage 'pool')
+            bounds: {stage name: (min workers, max workers)}
+            interval: seconds between decisions
+            monitor: EnterpriseMonitor whose psutil readings are reused
+                while fresh; psutil is sampled directly otherwise
+            cpu_bound: stages that may not grow while CPU is above max_cpu
+            scale_up_fill: input queue fill ratio that counts as backlog
+            scale_up_utilization: busy share above which workers are saturated
+            scale_down_utilization: busy share below which workers are idle
+            max_cpu: CPU percent above which cpu_bound stages stop growing
+            max_memory: memory percent above which no stage grows and
+                stages shrink
+            latency_factor: per-item latency over baseline x this blocks growth
+            patience: consecutive ticks a decision must hold before acting
+            cooldown: ticks to wait after a change before the next one
+            step: workers added per scale-up
+        """
+        self.pipeline = pipeline
+        self.bounds = bounds
+        self.interval = interval
+        self.monitor = monitor
+        self.cpu_bound = cpu_bound
+        self.scale_up_fill = scale_up_fill
+        self.scale_up_utilization = scale_up_utilization
+        self.scale_down_utilization = scale_down_utilization
+        self.max_cpu = max_cpu
+        self.max_memory = max_memory
+        self.latency_factor = latency_factor
+        self.patience = patience
+        self.cooldown = cooldown
+        self.step = step
+
+        self._previous: Dict[str, Dict] = {}
+        self._baseline_latency: Dict[str, float] = {}
+        self._streak: Dict[str, Tuple[int, int]] = {}
+        self._cooldown: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _system_readings(self) -> Dict[str, float]:
+        """CPU and memory percent, from the monitor when its reading is recent"""
+        readings = getattr(self.monitor, 'latest_readings', None)
+        if readings:
+            age = (datetime.utcnow() - datetime.fromisoformat(readings['timestamp'])).total_seconds()
+            if age <= 2 * self.interval:
+                return {'cpu': readings['cpu'], 'memory': readings['memory']}
+        return {'cpu': psutil.cpu_percent(), 'memory': psutil.virtual_memory().percent}
+
+    def _decide(self, name: str, current: Dict, previous: Dict, system: Dict) -> Tuple[int, str]:
+        """(+1 grow / -1 shrink / 0 hold, reason)"""
+        low, high = self.bounds[name]
+        workers = current['workers']
+        processed = current['processed'] + current['errors'] - previous['processed'] - previous['errors']
+        busy = current['busy_seconds'] - previous['busy_seconds']
+        capacity = current['worker_seconds'] - previous['worker_seconds']
+        utilization = busy / capacity if capacity > 0 else 0.0
+        fill = current['queue_depth'] / current['queue_size'] if current['queue_size'] else 0.0
+
+        latency = busy / processed if processed else None
+        baseline = self._baseline_latency.get(name)
+        if latency is not None:
+            # Slow-moving baseline so a sustained slowdown still stands out
+            self._baseline_latency[name] = latency if baseline is None else 0.9 * baseline + 0.1 * latency
+
+        if system['memory'] > self.max_memory and workers > low:
+            return -1, 'memory'
+        if fill >= self.scale_up_fill and utilization >= self.scale_up_utilization:
+            if workers >= high:
+                return 0, 'max_workers'
+            if system['memory'] > self.max_memory:
+                return 0, 'memory'
+            if name in self.cpu_bound and system['cpu'] > self.max_cpu:
+                return 0, 'cpu'
+            if baseline and latency and latency > baseline * self.latency_factor:
+                return 0, 'latency'
+            return 1, 'backlog'
+        if utilization < self.scale_down_utilization and fill < 0.1 and workers > low:
+            return -1, 'idle'
+        return 0, 'steady'
+
+    def tick(self):
+        snapshot = self.pipeline.snapshot()
+        if not snapshot:
+            self._previous = {}
+            return
+        system = self._system_readings()
+        for name in self.bounds:
+            current = snapshot.get(name)
+            if current is None or current['done']:
+                continue
+            pool_workers.labels(stage=name).set(current['workers'])
+            previous = self._previous.get(name)
+            if previous is None:
+                continue
+            direction, reason = self._decide(name, current, previous, system)
+
+            if self._cooldown.get(name, 0) > 0:
+                self._cooldown[name] -= 1
+                self._streak[name] = (0, 0)
+                continue
+            last_direction, count = self._streak.get(name, (0, 0))
+            count = count + 1 if direction == last_direction else 1
+            self._streak[name] = (direction, count)
+            if direction == 0:
+                if reason != 'steady':
+                    scaling_decisions.labels(stage=name, direction='hold', reason=reason).inc()
+                continue
+            if count < self.patience:
+                continue
+
+            low, high = self.bounds[name]
+            workers = current['workers']
+            target = min(high, workers + self.step) if direction > 0 else max(low, workers - 1)
+            if target == workers:
+                continue
+            self.pipeline.resize(name, target)
+            pool_workers.labels(stage=name).set(target)
+            scaling_decisions.labels(
+                stage=name, direction='up' if direction > 0 else 'down', reason=reason
+            ).inc()
+            logging.info(f"Autoscaler: {name} {workers} -> {target} workers ({reason})")
+            self._cooldown[name] = self.cooldown
+            self._streak[name] = (0, 0)
+        self._previous = snapshot
+
+    def start(self):
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.tick()
+                except Exception as e:
+                    logging.error(f"Autoscaler tick failed: {str(e)}")
+
+        self._thread = threading.Thread(target=loop, name='pipeline-autoscaler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
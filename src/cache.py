@@ -0,0 +1,281 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+from collections import OrderedDict
+import logging
+import threading
+import time
+import uuid
+import orjson
+from prometheus_client import Counter
+from redis import Redis
+
+try:
+    import zstandard
+except ImportError:  # compression is optional
+    zstandard = None
+
+# Cache metrics, per tier ('local' or 'redis'; a miss in 'redis' is a full miss)
+cache_hits = Counter('cache_hits_total', 'Number of cache hits', ['tier'])
+cache_misses = Counter('cache_misses_total', 'Number of cache misses', ['tier'])
+
+# First byte of every cached value
+_RAW = b'\x00'
+_ZSTD = b'\x01'
+
+
+class CacheCodec:
+    """
+    Compact binary encoding for cached results: orjson, zstd-compressed
+    above compress_min_bytes when zstandard is installed. JSON-compatible
+    values (dicts with str keys, lists, str, numbers, bool, None) round-trip
+    unchanged.
+    """
+
+    def __init__(self, compress: bool = True, compress_min_bytes: int = 1024, level: int = 3):
+        self.compress = compress and zstandard is not None
+        self.compress_min_bytes = compress_min_bytes
+        if self.compress:
+            self._compressor = zstandard.ZstdCompressor(level=level)
+            self._decompressor = zstandard.ZstdDecompressor()
+
+    def encode(self, value: Any) -> bytes:
+        payload = orjson.dumps(value)
+        if self.compress and len(payload) >= self.compress_min_bytes:
+            return _ZSTD + self._compressor.compress(payload)
+        return _RAW + payload
+
+    def decode(self, data: bytes) -> Any:
+        """Decoded value; raises ValueError for data this codec did not write"""
+        header, payload = data[:1], data[1:]
+        if header == _RAW:
+            return orjson.loads(payload)
+        if header == _ZSTD:
+            if zstandard is None:
+                raise ValueError("zstd-compressed cache value but zstandard is not installed")
+            return orjson.loads(self._decompressor.decompress(payload))
+        raise ValueError("unknown cache value format")
+
+
+class RedisBatchCache:
+    """
+    Batch get/set over Redis: one MGET for lookups and one pipelined SETEX
+    round trip for writes, however many keys are involved.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: int = 3600,
+        prefix: str = 'doc_result',
+        codec: Optional[CacheCodec] = None,
+    ):
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self.codec = codec or CacheCodec()
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get_many_sized(self, keys: Iterable[str]) -> Dict[str, Tuple[Any, int]]:
+        """Like get_many, with the encoded size of each value"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        found = {}
+        for key, data in zip(keys, self.redis.mget([self._key(k) for k in keys])):
+            if data is None:
+                continue
+            try:
+                found[key] = (self.codec.decode(data), len(data))
+            except Exception as e:
+                # Unreadable entries (e.g. older formats) count as misses
+                logging.warning(f"Ignoring cache entry {self._key(key)}: {str(e)}")
+        return found
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Cached values for the keys that are present; misses are left out"""
+        return {key: value for key, (value, _) in self.get_many_sized(keys).items()}
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None) -> Dict[str, int]:
+        """Store values; returns the encoded size of each"""
+        if not items:
+            return {}
+        sizes = {}
+        pipe = self.redis.pipeline(transaction=False)
+        for key, value in items.items():
+            data = self.codec.encode(value)
+            sizes[key] = len(data)
+            pipe.setex(self._key(key), ttl or self.ttl, data)
+        pipe.execute()
+        return sizes
+
+    def delete_many(self, keys: Iterable[str]):
+        keys = [self._key(k) for k in keys]
+        if keys:
+            self.redis.delete(*keys)
+
+
+class _LocalEntry:
+    __slots__ = ('value', 'expires_at', 'size')
+
+    def __init__(self, value: Any, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class LocalLRUCache:
+    """
+    Bounded in-process LRU with per-entry TTL. Bounded both by entry count
+    and by max_bytes, measured as the encoded size of each value.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, _LocalEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                return default
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[float] = None):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _LocalEntry(value, time.monotonic() + (ttl or self.ttl), size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= evicted.size
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry.size
+
+
+_MISSING = object()
+
+
+class TwoTierCache:
+    """
+    In-process LRU in front of RedisBatchCache. Writes and deletes publish
+    the affected keys on a Redis channel; every other replica drops its
+    local copy, so the local tier never serves a value older than the
+    last write plus message delivery. The local TTL bounds staleness if a
+    message is lost (e.g. while a subscriber reconnects).
+    """
+
+    def __init__(
+        self,
+        remote: RedisBatchCache,
+        local: Optional[LocalLRUCache] = None,
+        channel: str = 'cache_invalidation',
+    ):
+        self.remote = remote
+        self.local = local or LocalLRUCache()
+        self.channel = f"{channel}:{remote.prefix}"
+        self.instance_id = uuid.uuid4().hex
+        self.stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0}
+        self._pubsub = remote.redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: self._on_invalidate})
+        self._listener = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _on_invalidate(self, message: Dict):
+        try:
+            payload = orjson.loads(message['data'])
+        except Exception as e:
+            logging.warning(f"Bad cache invalidation message: {str(e)}")
+            return
+        if payload.get('origin') == self.instance_id:
+            return
+        for key in payload.get('keys', ()):
+            self.local.delete(key)
+
+    def _publish(self, keys):
+        try:
+            self.remote.redis.publish(
+                self.channel,
+                orjson.dumps({'origin': self.instance_id, 'keys': list(keys)})
+            )
+        except Exception as e:
+            logging.error(f"Cache invalidation publish failed: {str(e)}")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self.local.get(key, _MISSING)
+            if value is _MISSING:
+                remote_keys.append(key)
+            else:
+                found[key] = value
+        cache_hits.labels(tier='local').inc(len(found))
+        cache_misses.labels(tier='local').inc(len(remote_keys))
+
+        fetched = self.remote.get_many_sized(remote_keys)
+        for key, (value, size) in fetched.items():
+            self.local.set(key, value, size)
+            found[key] = value
+        cache_hits.labels(tier='redis').inc(len(fetched))
+        cache_misses.labels(tier='redis').inc(len(remote_keys) - len(fetched))
+
+        self.stats['local_hits'] += len(found) - len(fetched)
+        self.stats['redis_hits'] += len(fetched)
+        self.stats['misses'] += len(remote_keys) - len(fetched)
+        return found
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None) -> Dict[str, int]:
+        sizes = self.remote.set_many(items, ttl)
+        for key, value in items.items():
+            self.local.set(key, value, sizes[key])
+        if items:
+            self._publish(items)
+        return sizes
+
+    def delete_many(self, keys: Iterable[str]):
+        keys = list(keys)
+        self.remote.delete_many(keys)
+        for key in keys:
+            self.local.delete(key)
+        if keys:
+            self._publish(keys)
+
+    def hit_rates(self) -> Dict[str, float]:
+        """Share of lookups served by each tier since startup"""
+        total = sum(self.stats.values())
+        if not total:
+            return {'local': 0.0, 'redis': 0.0, 'overall': 0.0}
+        return {
+            'local': self.stats['local_hits'] / total,
+            'redis': self.stats['redis_hits'] / total,
+            'overall': (self.stats['local_hits'] + self.stats['redis_hits']) / total,
+        }
+
+    def close(self):
+        self._listener.stop()
+        self._pubsub.close()
@@ -0,0 +1,180 @@
+"""
+Per-connection chat sessions for the WebSocket chat endpoint.
+
+Each connection owns a chat engine, and with it a chat memory, built over
+an index shared by all connections. Sessions are kept in LRU order:
+opening one past max_sessions closes the least recently active one, and a
+background sweep closes sessions idle for longer than idle_ttl seconds so
+their memory is released.
+
+Answers stream as token messages. Cancelling a generation closes the
+provider stream instead of letting it run to the end unread. A cancelled
+turn is not written to the chat memory.
+"""
+from typing import Dict, Optional
+from collections import OrderedDict
+import asyncio
+import logging
+import time
+import uuid
+import orjson
+from prometheus_client import Counter, Gauge
+from src.tracing import trace
+
+# Chat session metrics
+active_sessions = Gauge('chat_sessions_active', 'Open WebSocket chat sessions')
+evicted_sessions = Counter(
+    'chat_sessions_evicted_total', 'Chat sessions closed by the server',
+    ['reason']  # idle | capacity
+)
+chat_generations = Counter(
+    'chat_generations_total', 'Streamed chat answers',
+    ['status']  # completed | cancelled | error
+)
+
+
+class ChatSession:
+    __slots__ = ('session_id', 'engine', 'websocket', 'last_active', 'task', 'trace_log_threshold')
+
+    def __init__(self, engine, websocket, trace_log_threshold: Optional[float] = None):
+        self.session_id = uuid.uuid4().hex
+        self.engine = engine
+        self.websocket = websocket
+        self.trace_log_threshold = trace_log_threshold
+        self.last_active = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def generating(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def send(self, message: Dict):
+        await self.websocket.send_text(orjson.dumps(message).decode())
+
+    def start(self, message: str):
+        self.task = asyncio.create_task(self._stream_answer(message))
+
+    async def _stream_answer(self, message: str):
+        status = 'error'
+        stream = None
+        try:
+            with trace('chat', log_threshold=self.trace_log_threshold, session=self.session_id):
+                response = await self.engine.astream_chat(message)
+                stream = response.achat_stream
+                async for chunk in stream:
+                    if chunk.delta:
+                        await self.send({'type': 'token', 'delta': chunk.delta})
+            status = 'completed'
+            await self.send({
+                'type': 'done',
+                'sources': [
+                    {'node_id': n.node.node_id, 'score': n.score, 'metadata': n.node.metadata}
+                    for n in response.source_nodes
+                ],
+            })
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            raise
+        except Exception as e:
+            logging.error(f"Chat session {self.session_id} generation failed: {str(e)}")
+            try:
+                await self.send({'type': 'error', 'detail': str(e)})
+            except Exception:
+                pass
+        finally:
+            # Closes the provider stream when we stopped reading part way
+            if stream is not None:
+                await stream.aclose()
+            chat_generations.labels(status=status).inc()
+            self.last_active = time.monotonic()
+
+    async def cancel(self) -> bool:
+        """Stop the running generation; False when nothing was running"""
+        if not self.generating:
+            return False
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    async def close(self, code: int = 1000, reason: str = ''):
+        await self.cancel()
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except RuntimeError:
+            # Already closed by the client
+            pass
+
+
+class ChatSessionPool:
+    """Open chat sessions with LRU and idle-TTL eviction"""
+
+    def __init__(self, max_sessions: int = 200, idle_ttl: float = 900):
+        """
+        Args:
+            max_sessions: open sessions kept; the least recently active is
+                closed to make room for a new one
+            idle_ttl: seconds without messages after which a session that
+                is not generating is closed
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: 'OrderedDict[str, ChatSession]' = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def open(self, engine, websocket, trace_log_threshold: Optional[float] = None) -> ChatSession:
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+        while len(self._sessions) >= self.max_sessions:
+            _, oldest = self._sessions.popitem(last=False)
+            evicted_sessions.labels(reason='capacity').inc()
+            await oldest.close(code=1013, reason='Session evicted, server at capacity')
+        session = ChatSession(engine, websocket, trace_log_threshold)
+        self._sessions[session.session_id] = session
+        active_sessions.set(len(self._sessions))
+        return session
+
+    def touch(self, session: ChatSession):
+        session.last_active = time.monotonic()
+        if session.session_id in self._sessions:
+            self._sessions.move_to_end(session.session_id)
+
+    async def release(self, session: ChatSession):
+        """Forget a session whose connection ended, stopping its generation"""
+        self._sessions.pop(session.session_id, None)
+        active_sessions.set(len(self._sessions))
+        await session.cancel()
+
+    async def sweep(self):
+        now = time.monotonic()
+        idle = [
+            s for s in self._sessions.values()
+            if not s.generating and now - s.last_active > self.idle_ttl
+        ]
+        for session in idle:
+            self._sessions.pop(session.session_id, None)
+            evicted_sessions.labels(reason='idle').inc()
+            await session.close(code=1000, reason='Idle timeout')
+        active_sessions.set(len(self._sessions))
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_ttl / 4))
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error(f"Chat session sweep failed: {str(e)}")
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        active_sessions.set(0)
+        for session in sessions:
+            await session.close(code=1001, reason='Server shutting down')
@@ -0,0 +1,235 @@
+"""
+Page-range checkpoints for ingesting large PDFs.
+
+A PDF is processed in shards of shard_pages pages. After a shard is
+parsed, chunked and embedded its nodes are checkpointed. After they are
+upserted the shard is marked done. A restarted worker, or any other
+worker given the same file, skips done shards and reuses checkpointed
+embeddings, so a crash at page 900 of 1,000 costs at most one shard.
+Node ids are kept in the checkpoint, so re-upserting a shard after a
+crash between upsert and marking it done overwrites rather than
+duplicates.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import shutil
+import orjson
+from prometheus_client import Counter
+from redis import Redis
+from llama_index.core.schema import BaseNode, Document
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from src.pdf_utils import count_pdf_pages, parse_pdf_pages
+
+# Checkpoint metrics
+checkpoint_shards = Counter(
+    'checkpoint_shards_total', 'PDF shards by how they were obtained',
+    ['source']  # processed | resumed | skipped
+)
+
+PROCESSED = 'processed'
+UPSERTED = 'upserted'
+
+
+def file_checkpoint_key(path: str) -> str:
+    """Content hash, so a re-uploaded copy of the same file resumes too"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LocalCheckpointStore:
+    """One JSON file per shard under root/<key>/"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _shard_path(self, key: str, shard: int) -> str:
+        return os.path.join(self.root, key, f"shard_{shard:06d}.json")
+
+    def load(self, key: str) -> Dict[int, Dict]:
+        directory = os.path.join(self.root, key)
+        if not os.path.isdir(directory):
+            return {}
+        shards = {}
+        for name in os.listdir(directory):
+            if name.startswith('shard_') and name.endswith('.json'):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    shards[int(name[6:-5])] = orjson.loads(f.read())
+        return shards
+
+    def save(self, key: str, shard: int, state: Dict):
+        path = self._shard_path(key, shard)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(state, option=orjson.OPT_NON_STR_KEYS))
+        os.replace(tmp_path, path)
+
+    def clear(self, key: str, shards: Optional[List[int]] = None):
+        """Drop the file's checkpoint, or only the given shards of it"""
+        if shards is None:
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            return
+        for shard in shards:
+            try:
+                os.remove(self._shard_path(key, shard))
+            except FileNotFoundError:
+                pass
+        try:
+            # Gone once the last range of the file is cleared
+            os.rmdir(os.path.join(self.root, key))
+        except OSError:
+            pass
+
+
+class RedisCheckpointStore:
+    """One hash per file, one field per shard; expires if the job is abandoned"""
+
+    def __init__(self, redis: Redis, prefix: str = 'ingest_checkpoint', ttl: int = 7 * 24 * 3600):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def load(self, key: str) -> Dict[int, Dict]:
+        return {int(shard): orjson.loads(state) for shard, state in self.redis.hgetall(self._key(key)).items()}
+
+    def save(self, key: str, shard: int, state: Dict):
+        with self.redis.pipeline() as pipe:
+            pipe.hset(self._key(key), shard, orjson.dumps(state, option=orjson.OPT_NON_STR_KEYS))
+            pipe.expire(self._key(key), self.ttl)
+            pipe.execute()
+
+    def clear(self, key: str, shards: Optional[List[int]] = None):
+        """Drop the file's checkpoint, or only the given shards of it"""
+        if shards is None:
+            self.redis.delete(self._key(key))
+        elif shards:
+            self.redis.hdel(self._key(key), *shards)
+
+
+def make_checkpoint_store(config: Dict, root_dir: str, redis: Optional[Redis] = None):
+    """CHECKPOINT_BACKEND=redis|local (default local, under saves/checkpoints)"""
+    if config.get('CHECKPOINT_BACKEND', 'local') == 'redis':
+        return RedisCheckpointStore(redis or Redis.from_url(config.get('REDIS_URL', 'redis://localhost:6379')))
+    return LocalCheckpointStore(os.path.join(root_dir, 'saves', 'checkpoints'))
+
+
+class CheckpointedIngestion:
+    """Run a PDF through process/upsert callbacks shard by shard, resuming from checkpoints"""
+
+    def __init__(self, store, shard_pages: int = 10, parse: Callable = parse_pdf_pages):
+        """
+        Args:
+            store: LocalCheckpointStore or RedisCheckpointStore
+            shard_pages: pages per shard
+            parse: (path, start, end) -> Documents of pages [start, end),
+                raising (or returning None) on failure, e.g. a
+                SharedMemoryPageParser to parse in other processes
+        """
+        self.store = store
+        self.shard_pages = shard_pages
+        self.parse = parse
+
+    def run(
+        self,
+        path: str,
+        process_shard: Callable[[List[Document]], Tuple[List[BaseNode], Dict]],
+        upsert_shard: Optional[Callable[[List[BaseNode]], None]] = None,
+        key: Optional[str] = None,
+        clear_on_success: bool = True,
+        progress: Optional[Callable[[int, int], None]] = None,
+        pages: Optional[Tuple[int, int]] = None,
+        parse: Optional[Callable] = None,
+    ) -> Dict:
+        """
+        Args:
+            path: PDF path
+            process_shard: parsed pages -> (nodes ready to store, JSON-able shard stats)
+            upsert_shard: writes a shard's nodes; without it shards stop at 'processed'
+            key: checkpoint key, the file's content hash by default
+            clear_on_success: drop the checkpoint once every shard is done
+            progress: called with (pages done, total pages) after each shard
+            pages: only the shards starting in this [start, end) page range,
+                a multiple of shard_pages apart, so several jobs can split
+                one PDF; progress then counts pages of the range
+            parse: parse function for this run instead of the one given
+                at construction, e.g. one returning pages parsed ahead
+        Returns:
+            dict with pages, shards (per-shard stats), nodes (processed or
+            resumed in this run; already-upserted shards are not reloaded)
+            and resumed (shards not reprocessed)
+        """
+        key = key or file_checkpoint_key(path)
+        parse = parse or self.parse
+        total_pages = count_pdf_pages(path)
+        first, last = pages or (0, total_pages)
+        last = min(last, total_pages)
+        if first % self.shard_pages:
+            raise ValueError(f"Page range {first}-{last} does not start on a {self.shard_pages}-page shard")
+        shards = [
+            (start // self.shard_pages, start) for start in range(0, total_pages, self.shard_pages)
+            if first <= start < last
+        ]
+        done = self.store.load(key)
+        stats, nodes, resumed = [], [], 0
+
+        for shard, start in shards:
+            state = done.get(shard)
+            end = min(start + self.shard_pages, total_pages)
+            if state and state['stage'] == UPSERTED:
+                checkpoint_shards.labels(source='skipped').inc()
+                stats.append(state['stats'])
+                resumed += 1
+                if progress is not None:
+                    progress(end - first, last - first)
+                continue
+
+            if state:
+                shard_nodes = [json_to_doc(n) for n in state['nodes']]
+                checkpoint_shards.labels(source='resumed').inc()
+                resumed += 1
+            else:
+                docs = parse(path, start, end)
+                if docs is None:
+                    raise RuntimeError(f"Parsing pages {start}-{end} of {path} failed")
+                try:
+                    shard_nodes, shard_stats = process_shard(docs)
+                finally:
+                    # Shared-memory arenas are released as soon as the shard is chunked
+                    if hasattr(docs, 'close'):
+                        docs.close()
+                state = {
+                    'stage': PROCESSED,
+                    'stats': dict(shard_stats, pages=len(docs), start=start, end=end),
+                    'nodes': [doc_to_json(n) for n in shard_nodes],
+                }
+                self.store.save(key, shard, state)
+                checkpoint_shards.labels(source='processed').inc()
+
+            if upsert_shard is not None:
+                if shard_nodes:
+                    upsert_shard(shard_nodes)
+                self.store.save(key, shard, {'stage': UPSERTED, 'stats': state['stats']})
+            stats.append(state['stats'])
+            nodes.extend(shard_nodes)
+            if progress is not None:
+                progress(end - first, last - first)
+
+        if clear_on_success:
+            # Other jobs may still be working on the rest of the file
+            self.store.clear(key, [shard for shard, _ in shards] if pages else None)
+        if resumed:
+            logging.info(f"Resumed {os.path.basename(path)}: {resumed} shards reused from checkpoint")
+        return {
+            'pages': sum(s['pages'] for s in stats),
+            'shards': stats,
+            'nodes': nodes,
+            'resumed': resumed,
+        }
@@ -2,17 +2,13 @@ from typing import Dict, Any
 import os
 from dotenv import load_dotenv
 
-def load_llm_config() -> Dict[str, Any]:
-    """Load LLM configuration from environment variables"""
-    load_dotenv()
-    
-    # Default to OpenAI if no provider specified
-    provider = os.getenv("LLM_PROVIDER", "openai")
-    
-    config = {
+def _provider_configs() -> Dict[str, Dict[str, Any]]:
+    """Per-provider settings read from environment variables"""
+    return {
         "openai": {
             "api_key": os.getenv("OPENAI_API_KEY"),
-            "model": os.getenv("OPENAI_MODEL", "gpt-4")
+            "model": os.getenv("OPENAI_MODEL", "gpt-4"),
+            "api_base": os.getenv("OPENAI_API_BASE") or None
         },
         "anthropic": {
             "api_key": os.getenv("ANTHROPIC_API_KEY"),
@@ -31,7 +27,36 @@ def load_llm_config() -> Dict[str, Any]:
         "nvidia": {
             "api_key": os.getenv("NVIDIA_API_KEY"),
             "model": os.getenv("NVIDIA_MODEL", "microsoft/phi-3-small-128k-instruct")
+        },
+        "local": {
+            "model": os.getenv("LOCAL_MODEL", "local-canned-llm"),
+            "first_token_latency": float(os.getenv("LOCAL_FIRST_TOKEN_LATENCY", 0.0)),
+            "tokens_per_second": float(os.getenv("LOCAL_TOKENS_PER_SECOND", 0.0)),
+            "num_output": int(os.getenv("LOCAL_NUM_OUTPUT", 128))
         }
     }
+
+def load_llm_config() -> Dict[str, Any]:
+    """Load LLM configuration from environment variables"""
+    load_dotenv()
+    
+    # Default to OpenAI if no provider specified
+    provider = os.getenv("LLM_PROVIDER", "openai")
+    config = _provider_configs()
+
+    if provider == "router":
+        # Route across several providers, e.g. LLM_ROUTER_PROVIDERS=openai,anthropic
+        names = [
+            name.strip()
+            for name in os.getenv("LLM_ROUTER_PROVIDERS", "openai").split(",")
+            if name.strip()
+        ]
+        return provider, {
+            "providers": [(name, config[name]) for name in names],
+            "hedge_delay": float(os.getenv("LLM_ROUTER_HEDGE_DELAY", 2.0)),
+            "stats_window": int(os.getenv("LLM_ROUTER_STATS_WINDOW", 200)),
+            "max_error_rate": float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", 0.5)),
+            "cooldown": float(os.getenv("LLM_ROUTER_COOLDOWN", 30))
+        }
     
     return provider, config[provider]
\ No newline at end of file
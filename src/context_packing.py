@@ -0,0 +1,147 @@
+from typing import Callable, List, Optional, Set
+import hashlib
+import logging
+import re
+from prometheus_client import Counter, Histogram
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from src.tracing import traced
+
+# Context packing metrics
+packed_tokens = Histogram('context_packed_tokens', 'Tokens of retrieved context sent to the LLM')
+dropped_tokens = Counter(
+    'context_dropped_tokens_total', 'Context tokens removed before generation', ['reason']
+)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int = 5) -> Set[int]:
+    """Hashed word n-grams used for near-duplicate detection"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {hash(" ".join(words))} if words else set()
+    return {hash(" ".join(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _trim_overlap(text: str, kept: List[str], probe: int = 40) -> str:
+    """
+    Remove a span at the start or end of text that repeats the end or start
+    of an already kept chunk (the splitter overlap between neighbours)
+    """
+    for other in kept:
+        # text continues other: other's tail == text's head
+        head = text[:probe]
+        pos = other.find(head) if len(head) == probe else -1
+        if pos >= 0 and text.startswith(other[pos:]):
+            text = text[len(other) - pos:]
+        # other continues text: text's tail == other's head
+        head = other[:probe]
+        pos = text.find(head) if len(head) == probe else -1
+        if pos >= 0 and other.startswith(text[pos:]):
+            text = text[:pos]
+    return text
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Pack retrieved nodes into a token budget before generation.
+
+    Nodes are taken in score order; splitter overlap with already packed
+    neighbours is trimmed, near-duplicate nodes and repeated boilerplate
+    lines are dropped, and only nodes that still fit in the remaining
+    budget are kept.
+    """
+
+    token_budget: int = Field(default=3000, description="Max context tokens sent to the LLM")
+    near_duplicate_threshold: float = Field(
+        default=0.85, description="Shingle Jaccard similarity above which a node is dropped"
+    )
+    min_line_chars: int = Field(
+        default=20, description="Repeated lines at least this long count as boilerplate"
+    )
+    min_node_tokens: int = Field(
+        default=8, description="Nodes left with fewer tokens after trimming are dropped"
+    )
+
+    _tokenizer: Callable = PrivateAttr()
+
+    def __init__(self, tokenizer: Optional[Callable] = None, **kwargs):
+        super().__init__(**kwargs)
+        self._tokenizer = tokenizer or get_tokenizer()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self._tokenizer(text))
+
+    def _drop_repeated_lines(self, text: str, seen_lines: Set[str]):
+        """Strip boilerplate lines already packed; returns text and its new line digests"""
+        lines = []
+        digests = set()
+        for line in text.splitlines():
+            key = " ".join(line.split()).lower()
+            if len(key) >= self.min_line_chars:
+                digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+                if digest in seen_lines or digest in digests:
+                    continue
+                digests.add(digest)
+            lines.append(line)
+        return "\n".join(lines), digests
+
+    @traced("context_pack")
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        ranked = sorted(nodes, key=lambda n: n.score or 0.0, reverse=True)
+        packed = []
+        kept_texts = []
+        kept_shingles = []
+        seen_lines = set()
+        used = 0
+
+        for item in ranked:
+            original = item.node.get_content()
+            original_tokens = self._count_tokens(original)
+
+            shingles = _shingles(original)
+            if any(_jaccard(shingles, s) >= self.near_duplicate_threshold for s in kept_shingles):
+                dropped_tokens.labels(reason='near_duplicate').inc(original_tokens)
+                continue
+
+            text = _trim_overlap(original, kept_texts)
+            text, digests = self._drop_repeated_lines(text, seen_lines)
+            text = text.strip()
+            tokens = self._count_tokens(text)
+            dropped_tokens.labels(reason='trimmed').inc(max(0, original_tokens - tokens))
+            if tokens < self.min_node_tokens:
+                continue
+
+            if used + tokens > self.token_budget:
+                # Keep trying lower-scored but smaller nodes that still fit
+                dropped_tokens.labels(reason='budget').inc(tokens)
+                continue
+
+            node = item.node.model_copy()
+            node.set_content(text)
+            packed.append(NodeWithScore(node=node, score=item.score))
+            kept_texts.append(original)
+            kept_shingles.append(shingles)
+            seen_lines |= digests
+            used += tokens
+
+        packed_tokens.observe(used)
+        logging.debug(f"Packed {len(packed)}/{len(nodes)} nodes into {used} tokens")
+        return packed
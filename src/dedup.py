@@ -0,0 +1,230 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import defaultdict
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import numpy as np
+from prometheus_client import Counter, Histogram
+from llama_index.core.schema import BaseNode
+
+# Dedup metrics
+chunks_seen = Counter('dedup_chunks_total', 'Chunks checked for near-duplicates', ['result'])
+dedup_ratio = Histogram(
+    'dedup_ratio', 'Share of near-duplicate chunks per batch',
+    buckets=(0.0, 0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9, 1.0)
+)
+
+_WORD_RE = re.compile(r"\w+")
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+class MinHasher:
+    """MinHash signatures over hashed word shingles"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall(text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """(num_perm,) uint32 signature; all permutations in one broadcast"""
+        hashes = self._shingle_hashes(text)
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(self._a, hashes) + self._b[:, None]) & _MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class MinHashLSHIndex:
+    """
+    LSH banding over MinHash signatures. Signatures that agree on every row
+    of at least one band become candidates; candidates are then confirmed
+    with the estimated Jaccard similarity.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, threshold: float = 0.9):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.keys: List[str] = []
+        self.signatures: List[np.ndarray] = []
+        self._key_pos: Dict[str, int] = {}
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def insert(self, key: str, signature: np.ndarray):
+        if key in self._key_pos:
+            return
+        pos = len(self.keys)
+        self._key_pos[key] = pos
+        self.keys.append(key)
+        self.signatures.append(signature)
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band][band_key].append(pos)
+
+    def query(self, signature: np.ndarray) -> Optional[str]:
+        """Most similar indexed key at or above the threshold, if any"""
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        if not candidates:
+            return None
+        positions = np.fromiter(candidates, dtype=np.int64)
+        similarity = (np.stack([self.signatures[p] for p in positions]) == signature).mean(axis=1)
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.threshold:
+            return None
+        return self.keys[positions[best]]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        signatures = np.stack(self.signatures) if self.signatures else np.empty((0, self.num_perm), np.uint32)
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                signatures=signatures,
+                keys=np.array(json.dumps(self.keys)),
+                params=np.array([self.num_perm, self.bands]),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.9) -> "MinHashLSHIndex":
+        with np.load(path) as data:
+            num_perm, bands = (int(v) for v in data["params"])
+            index = cls(num_perm, bands, threshold)
+            for key, signature in zip(json.loads(str(data["keys"])), data["signatures"]):
+                index.insert(key, signature)
+        return index
+
+
+class ChunkDeduplicator:
+    """
+    Flags chunks that are near-identical to chunks already ingested (or to
+    earlier chunks of the same batch) so they can point at the existing
+    node instead of being embedded and stored again. The LSH index is
+    persisted locally at index_path.
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        bands: int = 32,
+    ):
+        self.index_path = index_path
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm)
+        self._lock = threading.Lock()
+        self._uncommitted: Dict[str, np.ndarray] = {}
+        # Committed since the last persist(), merged into the file then
+        self._unsaved: Dict[str, np.ndarray] = {}
+        self.index = self._load(num_perm, bands)
+
+    def _load(self, num_perm: int, bands: int) -> MinHashLSHIndex:
+        if os.path.isfile(self.index_path):
+            try:
+                return MinHashLSHIndex.load(self.index_path, self.threshold)
+            except Exception as e:
+                logging.error(f"Could not load dedup index {self.index_path}: {str(e)}")
+        return MinHashLSHIndex(num_perm, bands, self.threshold)
+
+    def reload(self):
+        """Pick up chunks committed by other processes"""
+        with self._lock:
+            index = self._load(self.index.num_perm, self.index.bands)
+            # Chunks committed here but not yet persisted stay matchable
+            for key, signature in self._unsaved.items():
+                index.insert(key, signature)
+            self.index = index
+
+    def split(self, nodes: List[BaseNode], remember: bool = True) -> Tuple[List[BaseNode], Dict[str, str]]:
+        """
+        Separate new chunks from near-duplicates
+        Args:
+            remember: keep the unique chunks' signatures for commit();
+                False when the caller will not store them
+        Returns:
+            unique nodes, and {duplicate node id: id of the node it repeats}
+        """
+        unique = []
+        duplicates = {}
+        batch = MinHashLSHIndex(self.index.num_perm, self.index.bands, self.threshold)
+        for node in nodes:
+            signature = self.hasher.signature(node.get_content())
+            with self._lock:
+                match = self.index.query(signature)
+            match = match or batch.query(signature)
+            if match is None:
+                batch.insert(node.node_id, signature)
+                unique.append(node)
+            else:
+                duplicates[node.node_id] = match
+        if remember:
+            with self._lock:
+                # Kept until commit() so signatures are computed once per chunk
+                for key, signature in zip(batch.keys, batch.signatures):
+                    self._uncommitted[key] = signature
+
+        chunks_seen.labels(result='unique').inc(len(unique))
+        chunks_seen.labels(result='duplicate').inc(len(duplicates))
+        if nodes:
+            dedup_ratio.observe(len(duplicates) / len(nodes))
+        return unique, duplicates
+
+    def commit(self, nodes: List[BaseNode], persist: bool = True):
+        """
+        Register stored nodes so later chunks can be matched against them
+        Args:
+            persist: write the index file now; with False the nodes are
+                matched in this process and written by the next persist()
+        """
+        with self._lock:
+            for node in nodes:
+                signature = self._uncommitted.pop(node.node_id, None)
+                if signature is None:
+                    signature = self.hasher.signature(node.get_content())
+                self.index.insert(node.node_id, signature)
+                self._unsaved[node.node_id] = signature
+        if persist:
+            self.persist()
+
+    def persist(self):
+        """
+        Merge chunks committed here into the index file, keeping what
+        other processes wrote since we loaded it; hold the index lock
+        """
+        with self._lock:
+            if not self._unsaved:
+                return
+            index = self._load(self.index.num_perm, self.index.bands)
+            for key, signature in self._unsaved.items():
+                index.insert(key, signature)
+            index.save(self.index_path)
+            self.index = index
+            self._unsaved = {}
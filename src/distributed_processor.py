@@ -1,10 +1,31 @@
-from concurrent.futures import ThreadPoolExecutor
 import asyncio
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import pandas as pd
+import hashlib
 import logging
+import os
+import queue
+import threading
+import time
+import uuid
 from redis import Redis
 from motor.motor_asyncio import AsyncIOMotorClient
+from prometheus_client import Counter, Gauge, Histogram
+from src.autoscaler import PipelineAutoscaler, ScalableThreadPool
+from src.checkpoint import (
+    CheckpointedIngestion,
+    LocalCheckpointStore,
+    RedisCheckpointStore,
+    file_checkpoint_key,
+)
+from src.dedup import ChunkDeduplicator
+from src.ingestion import chunk_documents, embed_nodes, upsert_nodes
+from src.pdf_utils import count_pdf_pages, parse_pdf_pages
+from src.write_behind import AsyncWriteBehindBuffer
+from src.rate_limit import BULK, INTERACTIVE
+from src.scheduler import FairShareWeights, queue_wait
+from src.sharding import ClusterMembership
+from src.shared_pages import SharedMemoryPageParser
 
 class EnterpriseDocumentProcessor:
     def __init__(self, config: dict):
@@ -15,10 +36,42 @@ class EnterpriseDocumentProcessor:
                 - redis_url: Redis connection URL
                 - mongodb_url: MongoDB connection URL
                 - max_workers: Maximum number of worker threads
+                - min_workers: threads kept when idle; the pool is
+                  autoscaled between the two (defaults to max_workers)
+                - autoscale_interval: seconds between autoscaling decisions
                 - batch_size: Size of processing batches
+                - max_in_flight: PDFs submitted to the executor at once
+                  (defaults to 2 x max_workers)
+                - dedup_index_path: local MinHash LSH index of ingested chunks
+                - dedup_threshold: estimated Jaccard similarity for near-duplicates
+                - metadata_flush_size: metadata records per bulk insert
+                - metadata_flush_interval: max seconds a record waits before insert
+                - checkpoint_backend: 'local' or 'redis' page-range checkpoints
+                - checkpoint_dir: local checkpoint directory
+                - checkpoint_shard_pages: pages per checkpointed shard
+                - parse_processes: parse pages in this many processes, handing
+                  text back through shared memory (0 parses in the worker thread)
         """
         self.max_workers = config.get('max_workers', 4)
+        self.min_workers = min(config.get('min_workers', self.max_workers), self.max_workers)
         self.batch_size = config.get('batch_size', 100)
+        self.max_in_flight = config.get('max_in_flight', self.max_workers * 2)
+        
+        # Long-lived parse pool shared by every batch; the event loop only
+        # awaits its futures, so it stays free to serve other requests.
+        # It grows towards max_workers while PDFs queue up and shrinks
+        # back to min_workers when they stop
+        self.executor = ScalableThreadPool(self.min_workers, thread_name_prefix='doc-processor')
+        self.autoscaler = None
+        if self.min_workers < self.max_workers:
+            self.autoscaler = PipelineAutoscaler(
+                self.executor,
+                {'pool': (self.min_workers, self.max_workers)},
+                interval=config.get('autoscale_interval', 5.0),
+                cpu_bound=('pool',),
+            )
+            self.autoscaler.start()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
         
         # Initialize Redis for job queue
         self.redis = Redis.from_url(config['redis_url'])
@@ -26,12 +79,46 @@ class EnterpriseDocumentProcessor:
         # Initialize MongoDB for metadata
         self.mongo = AsyncIOMotorClient(config['mongodb_url'])
         self.db = self.mongo.documents
+        # Metadata goes out in bulk inserts instead of one round trip per PDF
+        self.metadata_writer = AsyncWriteBehindBuffer(
+            self.db.metadata,
+            max_batch=config.get('metadata_flush_size', 500),
+            flush_interval=config.get('metadata_flush_interval', 1.0)
+        )
+        
+        # Near-duplicate chunk detection across contract versions/templates
+        self.deduplicator = ChunkDeduplicator(
+            config.get('dedup_index_path', os.path.join('saves', 'minhash_index.npz')),
+            threshold=config.get('dedup_threshold', 0.9)
+        )
+        self._doc_hashes = {}
+        
+        # Page-range checkpoints so a failed PDF resumes where it stopped
+        if config.get('checkpoint_backend', 'local') == 'redis':
+            checkpoint_store = RedisCheckpointStore(self.redis)
+        else:
+            checkpoint_store = LocalCheckpointStore(
+                config.get('checkpoint_dir', os.path.join('saves', 'checkpoints'))
+            )
+        # Parsing is CPU-bound; in processes it escapes the GIL, and page
+        # text comes back through shared memory instead of pickles
+        self.page_parser = None
+        if config.get('parse_processes', 0) > 0:
+            self.page_parser = SharedMemoryPageParser(config['parse_processes'])
+        self.ingestion = CheckpointedIngestion(
+            checkpoint_store,
+            shard_pages=config.get('checkpoint_shard_pages', 10),
+            parse=self.page_parser or parse_pdf_pages
+        )
         
         # Initialize metrics
         self.metrics = {
             'docs_processed': 0,
             'processing_errors': 0,
-            'processing_time': 0
+            'processing_time': 0,
+            'duplicate_documents': 0,
+            'chunks': 0,
+            'duplicate_chunks': 0
         }
 
     async def process_documents(self, documents: List[str]) -> Dict:
@@ -45,15 +132,14 @@ class EnterpriseDocumentProcessor:
             # Duplicate detection
             unique_docs = await self._filter_duplicates(documents, doc_hashes)
             
-            # Batch processing with monitoring
+            # Batch processing with monitoring; metadata is stored per
+            # document as soon as it finishes
             results = await self._batch_process(unique_docs)
             
-            # Store metadata
-            await self._store_metadata(results)
-            
             return {
                 'status': 'success',
                 'processed': len(results),
+                'dedup_ratio': self._dedup_ratio(results),
                 'metrics': self.metrics
             }
             
@@ -61,6 +147,43 @@ class EnterpriseDocumentProcessor:
             logging.error(f"Document processing failed: {str(e)}")
             return {'status': 'error', 'error': str(e)}
 
+    async def _generate_document_hashes(self, documents: List[str]) -> List[str]:
+        """SHA-256 of each file, hashed on the executor"""
+        def file_hash(path: str) -> str:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            return digest.hexdigest()
+
+        loop = asyncio.get_running_loop()
+        hashes = await asyncio.gather(*[
+            loop.run_in_executor(self.executor, file_hash, path) for path in documents
+        ])
+        self._doc_hashes.update(zip(documents, hashes))
+        return hashes
+
+    async def _filter_duplicates(self, documents: List[str], doc_hashes: List[str]) -> List[str]:
+        """
+        Drop exact file duplicates within the call. Nodes are returned,
+        not stored, so files are not remembered across calls.
+        """
+        unique = []
+        batch_hashes = set()
+        for path, doc_hash in zip(documents, doc_hashes):
+            if doc_hash in batch_hashes:
+                self.metrics['duplicate_documents'] += 1
+                continue
+            batch_hashes.add(doc_hash)
+            unique.append(path)
+        return unique
+
+    @staticmethod
+    def _dedup_ratio(results: List[Dict]) -> float:
+        chunks = sum(r.get('chunks', 0) for r in results)
+        duplicates = sum(len(r.get('duplicates', {})) for r in results)
+        return duplicates / chunks if chunks else 0.0
+
     async def _batch_process(self, documents: List[str]) -> List[Dict]:
         """
         Process documents in batches
@@ -69,135 +192,966 @@ class EnterpriseDocumentProcessor:
         for i in range(0, len(documents), self.batch_size):
             batch = documents[i:i + self.batch_size]
             batch_results = await self._process_batch(batch)
+            logging.info(
+                f"Batch of {len(batch)} PDFs: near-duplicate chunk ratio "
+                f"{self._dedup_ratio(batch_results):.2%}"
+            )
             results.extend(batch_results)
         return results
     
-    async def _process_batch(self, pdf_paths: List[str]) -> Dict:
-        """Process a batch of PDFs concurrently"""
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = [
-                executor.submit(self._process_single_pdf, path)
-                for path in pdf_paths
-            ]
-            results = [f.result() for f in futures]
+    async def _process_batch(self, pdf_paths: List[str]) -> List[Dict]:
+        """
+        Process a batch of PDFs concurrently, storing each result's
+        metadata as soon as that PDF completes
+        """
+        loop = asyncio.get_running_loop()
+
+        async def run(path: str) -> Dict:
+            async with self._in_flight:
+                start = time.perf_counter()
+                result = await loop.run_in_executor(
+                    self.executor, self._process_single_pdf, path
+                )
+                self.metrics['processing_time'] += time.perf_counter() - start
+                return result
+
+        results = []
+        for next_done in asyncio.as_completed([run(path) for path in pdf_paths]):
+            result = await next_done
+            if result['status'] == 'success':
+                self.metrics['docs_processed'] += 1
+                self.metrics['chunks'] += result['chunks']
+                self.metrics['duplicate_chunks'] += len(result['duplicates'])
+            else:
+                self.metrics['processing_errors'] += 1
+            await self._store_metadata(result)
+            results.append(result)
         return results
+
+    async def _store_metadata(self, result: Dict):
+        """Persist processing metadata for one PDF"""
+        if result['status'] == 'success':
+            record = dict(
+                result['metadata'],
+                status='success',
+                pages=result['pages'],
+                chunks=result['chunks'],
+                # Duplicate chunks reference the node already stored
+                duplicate_chunks=result['duplicates']
+            )
+        else:
+            record = {
+                'filename': os.path.basename(result['path']),
+                'status': 'error',
+                'error': result['error'],
+                'processed_at': pd.Timestamp.now().isoformat()
+            }
+        self._doc_hashes.pop(result['path'], None)
+        await self.metadata_writer.put(record)
+
+    async def close(self):
+        """Flush buffered metadata and release the parse pools"""
+        await self.metadata_writer.close()
+        if self.autoscaler is not None:
+            self.autoscaler.stop()
+        self.executor.shutdown(wait=True)
+        if self.page_parser is not None:
+            self.page_parser.close()
     
     def _process_single_pdf(self, pdf_path: str):
         """Process individual PDF with error handling"""
         try:
-            docs = docs_from_pymupdf4llm(pdf_path)
+            def process_shard(docs):
+                nodes = chunk_documents(docs)
+                # Flag chunks already stored elsewhere. Nothing is stored
+                # here, so nothing is committed to the dedup index either
+                unique_nodes, duplicates = self.deduplicator.split(nodes, remember=False)
+                return unique_nodes, {'chunks': len(nodes), 'duplicates': duplicates}
+
+            run = self.ingestion.run(
+                pdf_path, process_shard, key=self._doc_hashes.get(pdf_path)
+            )
+            duplicates = {}
+            for shard in run['shards']:
+                duplicates.update(shard['duplicates'])
             metadata = {
                 'filename': os.path.basename(pdf_path),
                 'processed_at': pd.Timestamp.now().isoformat()
             }
-            return {'status': 'success', 'docs': docs, 'metadata': metadata}
+            return {
+                'status': 'success',
+                'path': pdf_path,
+                'pages': run['pages'],
+                'nodes': run['nodes'],
+                'chunks': sum(shard['chunks'] for shard in run['shards']),
+                'duplicates': duplicates,
+                'metadata': metadata
+            }
         except Exception as e:
-            return {'status': 'error', 'path': pdf_path, 'error': str(e)} 
-
-class PerformanceOptimizer:
-    def __init__(self, config: Dict):
-        """Initialize performance optimizer"""
-        self.redis = Redis.from_url(config.get('REDIS_URL', 'redis://localhost:6379'))
-        self.max_workers = config.get('MAX_WORKERS', 4)
-        self.batch_size = config.get('BATCH_SIZE', 100)
-        self.cache_ttl = config.get('CACHE_TTL', 3600)  # 1 hour default
-        self.processing_queue = queue.Queue()
-        self.thread_pool = ThreadPoolExecutor(max_workers=self.max_workers)
-        
-    def batch_process_documents(self, documents: List[str]) -> List[Dict]:
-        """Process documents in optimized batches"""
-        results = []
-        total_docs = len(documents)
-        
-        for i in range(0, total_docs, self.batch_size):
-            batch = documents[i:i + self.batch_size]
-            batch_size_metric.observe(len(batch))
-            
-            with processing_time.time():
-                batch_results = self._process_batch(batch)
-                results.extend(batch_results)
-                
-        return results
-    
-    def _process_batch(self, batch: List[str]) -> List[Dict]:
-        """Process a single batch with optimizations"""
-        futures = []
-        results = []
-        
-        # Check cache first
-        cached_results = self._get_cached_results(batch)
-        results.extend(cached_results['found'])
-        
-        # Process only uncached documents
-        for doc in cached_results['not_found']:
-            future = self.thread_pool.submit(self._process_single_document, doc)
-            futures.append(future)
-            
-        # Collect results
-        for future in futures:
-            try:
-                result = future.result(timeout=30)
-                results.append(result)
-                # Cache the new result
-                self._cache_result(result['id'], result)
-            except Exception as e:
-                logging.error(f"Batch processing error: {str(e)}")
-                
-        return results
-    
-    def _get_cached_results(self, documents: List[str]) -> Dict:
-        """Check cache for existing results"""
-        found = []
-        not_found = []
-        
-        for doc in documents:
-            cache_key = f"doc_result:{doc}"
-            cached = self.redis.get(cache_key)
-            
-            if cached:
-                cache_hits.inc()
-                found.append(cached)
+            return {'status': 'error', 'path': pdf_path, 'error': str(e)}
+
+# Job queue metrics
+pdf_jobs = Counter('pdf_jobs_total', 'PDF ingestion jobs by outcome', ['status'])
+pdf_job_seconds = Histogram('pdf_job_seconds', 'Time spent processing one PDF job')
+
+# Queue a job by weighted fair queuing. Its virtual finish tag is the
+# later of the queue's virtual time and its flow's previous tag, plus
+# cost / weight; pending zsets are ordered by finish tag.
+# KEYS: pending zset, fair-share state hash, job key. ARGV: job id, flow,
+# cost / weight
+_ENQUEUE_SCRIPT = """
+local state = redis.call('HMGET', KEYS[2], 'vtime', ARGV[2])
+local start = tonumber(state[1] or '0')
+local last = tonumber(state[2] or '0')
+if last > start then
+    start = last
+end
+local finish = start + tonumber(ARGV[3])
+redis.call('HSET', KEYS[2], ARGV[2], finish)
+redis.call('HSET', KEYS[3], 'finish', finish, 'share_cost', ARGV[3])
+redis.call('ZADD', KEYS[1], finish, ARGV[1])
+return tostring(finish)
+"""
+
+# Take the job with the lowest finish tag and lease it until ARGV[1]
+# seconds from now. Virtual time moves to the job's start tag; idle flows
+# restart there instead of cashing in credit for the time they were away.
+# KEYS: pending zset, leases zset, job key prefix, fair-share state hash.
+# ARGV: timeout, lease token
+_CLAIM_SCRIPT = """
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then
+    return nil
+end
+local job_id = popped[1]
+local start = tonumber(popped[2]) - tonumber(redis.call('HGET', KEYS[3] .. job_id, 'share_cost') or '0')
+if start > tonumber(redis.call('HGET', KEYS[4], 'vtime') or '0') then
+    redis.call('HSET', KEYS[4], 'vtime', start)
+end
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    -- Queue drained: forget per-flow history, keep the clock
+    local vtime = redis.call('HGET', KEYS[4], 'vtime')
+    redis.call('DEL', KEYS[4])
+    if vtime then
+        redis.call('HSET', KEYS[4], 'vtime', vtime)
+    end
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[1]), job_id)
+redis.call('HSET', KEYS[3] .. job_id, 'status', 'processing', 'lease', ARGV[2], 'claimed_at', now)
+return job_id
+"""
+
+# Extend a lease, only while the caller still holds it.
+# KEYS: leases zset, job key. ARGV: job id, timeout, lease token
+_EXTEND_SCRIPT = """
+if redis.call('HGET', KEYS[2], 'lease') ~= ARGV[3] then
+    return 0
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+return 1
+"""
+
+# Count one page range of a document as done or failed for good. The
+# document counts in its batch once every one of its ranges has. The
+# finished job, and the batch once all of its documents are finished,
+# expire after the retention period. Prepended to the scripts that finish jobs.
+_FINISH_RANGE_LUA = """
+local function finish_range(batch_key, job_key, doc, outcome, retention)
+    redis.call('EXPIRE', job_key, retention)
+    redis.call('HINCRBY', batch_key, doc .. ':ranges_' .. outcome, 1)
+    local counts = redis.call('HMGET', batch_key, doc .. ':ranges', doc .. ':ranges_done', doc .. ':ranges_failed')
+    local done = tonumber(counts[2] or '0')
+    local failed = tonumber(counts[3] or '0')
+    if done + failed < tonumber(counts[1] or '1') then
+        return
+    end
+    if failed > 0 then
+        redis.call('HINCRBY', batch_key, 'failed', 1)
+        redis.call('HSET', batch_key, doc .. ':status', 'failed')
+    else
+        redis.call('HINCRBY', batch_key, 'processed', 1)
+        redis.call('HSET', batch_key, doc .. ':status', 'done')
+    end
+    local batch = redis.call('HMGET', batch_key, 'total', 'processed', 'failed')
+    if tonumber(batch[2] or '0') + tonumber(batch[3] or '0') >= tonumber(batch[1] or '0') then
+        redis.call('EXPIRE', batch_key, retention)
+    end
+end
+"""
+
+# Finish or fail a leased job. A worker whose lease expired and was handed
+# to someone else is ignored, so progress is never counted twice.
+# A retried job keeps its finish tag, so it goes back near the front.
+# KEYS: leases zset, job key, batch key, pending zset, stats key
+# ARGV: job id, lease token, outcome (done|error), error text, max attempts,
+# progress channel, retention seconds
+_FINISH_SCRIPT = _FINISH_RANGE_LUA + """
+if redis.call('HGET', KEYS[2], 'lease') ~= ARGV[2] then
+    return 'stale'
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], 'lease')
+local doc = 'doc:' .. (redis.call('HGET', KEYS[2], 'doc_id') or ARGV[1])
+local result
+if ARGV[3] == 'done' then
+    redis.call('HSET', KEYS[2], 'status', 'done')
+    redis.call('HINCRBY', KEYS[5], 'processed', 1)
+    finish_range(KEYS[3], KEYS[2], doc, 'done', ARGV[7])
+    result = 'done'
+else
+    local attempts = redis.call('HINCRBY', KEYS[2], 'attempts', 1)
+    redis.call('HSET', KEYS[2], 'error', ARGV[4])
+    if attempts >= tonumber(ARGV[5]) then
+        redis.call('HSET', KEYS[2], 'status', 'failed')
+        redis.call('HINCRBY', KEYS[5], 'failed', 1)
+        finish_range(KEYS[3], KEYS[2], doc, 'failed', ARGV[7])
+        result = 'failed'
+    else
+        redis.call('HSET', KEYS[2], 'status', 'pending')
+        redis.call('ZADD', KEYS[4], redis.call('HGET', KEYS[2], 'finish') or 0, ARGV[1])
+        result = 'retry'
+    end
+end
+redis.call('PUBLISH', ARGV[6], ARGV[1])
+return result
+"""
+
+# Requeue jobs whose lease expired (worker died or hung) with their
+# finish tag. KEYS: leases zset, pending zset, stats key. ARGV: job key prefix,
+# batch key prefix, max attempts, progress channel prefix, retention seconds
+_REAP_SCRIPT = _FINISH_RANGE_LUA + """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)
+for _, job_id in ipairs(expired) do
+    local job_key = ARGV[1] .. job_id
+    local batch_id = redis.call('HGET', job_key, 'batch_id')
+    local doc = 'doc:' .. (redis.call('HGET', job_key, 'doc_id') or job_id)
+    redis.call('ZREM', KEYS[1], job_id)
+    redis.call('HDEL', job_key, 'lease')
+    local attempts = redis.call('HINCRBY', job_key, 'attempts', 1)
+    redis.call('HSET', job_key, 'error', 'visibility timeout expired')
+    if attempts >= tonumber(ARGV[3]) then
+        redis.call('HSET', job_key, 'status', 'failed')
+        redis.call('HINCRBY', KEYS[3], 'failed', 1)
+        finish_range(ARGV[2] .. batch_id, job_key, doc, 'failed', ARGV[5])
+    else
+        redis.call('HSET', job_key, 'status', 'pending')
+        redis.call('ZADD', redis.call('HGET', job_key, 'queue') or KEYS[2],
+            redis.call('HGET', job_key, 'finish') or 0, job_id)
+    end
+    redis.call('PUBLISH', ARGV[4] .. batch_id, job_id)
+end
+return #expired
+"""
+
+# Record page progress of one job, added to its document's and batch's
+# totals in the batch hash. A retried job only adds pages beyond what it
+# reported before. KEYS: batch key, job key. ARGV: job id, pages done in
+# the job, total pages of the job, progress channel
+_PROGRESS_SCRIPT = """
+local doc = 'doc:' .. (redis.call('HGET', KEYS[2], 'doc_id') or ARGV[1])
+-- Known at enqueue time unless the PDF could not be read then
+if redis.call('HSETNX', KEYS[1], doc .. ':pages', ARGV[3]) == 1 then
+    redis.call('HINCRBY', KEYS[1], 'pages_total', ARGV[3])
+end
+local previous = tonumber(redis.call('HGET', KEYS[2], 'pages_done') or '0')
+local done = tonumber(ARGV[2])
+if done > previous then
+    redis.call('HSET', KEYS[2], 'pages_done', done)
+    redis.call('HINCRBY', KEYS[1], doc .. ':pages_done', done - previous)
+    redis.call('HINCRBY', KEYS[1], 'pages_done', done - previous)
+end
+redis.call('HSET', KEYS[1], doc .. ':status', 'processing')
+redis.call('PUBLISH', ARGV[4], ARGV[1])
+return 1
+"""
+
+# Move a pending job, with its finish tag, to another node's queue if it
+# is still waiting. KEYS: source zset, destination zset, job key. ARGV: job id
+_MOVE_SCRIPT = """
+local finish = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not finish then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[2], finish, ARGV[1])
+redis.call('HSET', KEYS[3], 'queue', KEYS[2])
+return 1
+"""
+
+
+_DOC_COUNTERS = ('pages', 'pages_done', 'ranges', 'ranges_done', 'ranges_failed')
+
+
+class DistributedPDFProcessor:
+    """
+    Durable Redis job queue for PDF ingestion.
+
+    Producers (the Streamlit page, the API) spool uploads to a shared
+    directory and enqueue one job per page range of each PDF (job_pages
+    pages); any number of worker processes (see src/pdf_worker.py) lease
+    jobs, process them and report back. A job whose lease is not renewed
+    within the visibility timeout goes back to the queue and is retried
+    up to max_retries times. Per-batch progress counters live in one
+    Redis hash per batch, where a document counts as processed once all
+    of its ranges are.
+
+    Pending jobs are claimed in weighted fair queuing order over
+    (priority class, tenant) flows, each job costing its page count (see
+    FairShareWeights): uploads are interactive and path batches bulk by
+    default. A worker holds at most one range at a time, so small uploads
+    queued behind a tenant's 2,000-page backfill wait for one range, not
+    for the whole document.
+
+    With a ClusterMembership, every node has its own pending list and a
+    job goes to the node that owns the document's content hash on the
+    shard ring; rebalance() moves waiting jobs when nodes join or leave.
+    """
+
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        redis: Optional[Redis] = None,
+        membership: Optional[ClusterMembership] = None,
+    ):
+        """
+        Args:
+            config: Configuration dictionary containing:
+                - REDIS_URL: Redis connection URL
+                - SPOOL_DIR: directory shared with workers for uploaded PDFs
+                - VISIBILITY_TIMEOUT: seconds a worker may hold a job without renewing
+                - MAX_RETRIES: attempts before a job is marked failed
+                - JOB_RETENTION: seconds finished jobs and completed batches
+                  stay readable before they expire
+                - CHECKPOINT_SHARD_PAGES: pages per job; longer PDFs are
+                  split into page-range jobs
+                - QUEUE_PREFIX: Redis key prefix
+                - INTERACTIVE_WEIGHT: interactive share relative to bulk
+                - TENANT_WEIGHTS: per-tenant shares, "tenant=weight;..."
+            redis: Redis client to use instead of REDIS_URL (e.g. fakeredis)
+            membership: shard ring membership; jobs are routed to owning
+                nodes and this node (if it has a node_id) claims its own
+        """
+        config = config or {}
+        self.redis = redis or Redis.from_url(
+            config.get('REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379'))
+        )
+        self.spool_dir = config.get('SPOOL_DIR', os.getenv('SPOOL_DIR', 'tmp'))
+        self.visibility_timeout = int(config.get('VISIBILITY_TIMEOUT', 300))
+        self.max_retries = int(config.get('MAX_RETRIES', 3))
+        self.retention = int(config.get('JOB_RETENTION', 24 * 3600))
+        # Workers checkpoint in shards of the same size, so a range is whole shards
+        self.job_pages = int(config.get('CHECKPOINT_SHARD_PAGES', 10))
+        prefix = config.get('QUEUE_PREFIX', 'pdf_jobs')
+        self.weights = FairShareWeights.from_config(config)
+        self.membership = membership
+        self._ring_members = None
+
+        # Unsharded queue; with sharding it holds jobs no live node owns yet
+        self.shared_pending_key = f"{prefix}:pending"
+        self.pending_key = self.shared_pending_key
+        if membership is not None and membership.node_id:
+            self.pending_key = self._node_pending_key(membership.node_id)
+        self.leases_key = f"{prefix}:leases"
+        self.stats_key = f"{prefix}:stats"
+        self.job_prefix = f"{prefix}:job:"
+        self.batch_prefix = f"{prefix}:batch:"
+        self.dedupe_prefix = f"{prefix}:dedupe:"
+        self.progress_prefix = f"{prefix}:progress:"
+        # Virtual time and per-flow finish tags of each pending zset
+        self.fair_prefix = f"{prefix}:fair:"
+
+        self._enqueue = self.redis.register_script(_ENQUEUE_SCRIPT)
+        self._claim = self.redis.register_script(_CLAIM_SCRIPT)
+        self._extend = self.redis.register_script(_EXTEND_SCRIPT)
+        self._finish = self.redis.register_script(_FINISH_SCRIPT)
+        self._reap = self.redis.register_script(_REAP_SCRIPT)
+        self._move = self.redis.register_script(_MOVE_SCRIPT)
+        self._progress = self.redis.register_script(_PROGRESS_SCRIPT)
+
+    def _node_pending_key(self, node_id: str) -> str:
+        return f"{self.shared_pending_key}:{node_id}"
+
+    def _queue_for(self, doc_hash: str, ring=None) -> str:
+        """Pending list of the node that owns doc_hash"""
+        if self.membership is None:
+            return self.pending_key
+        owner = (ring or self.membership.ring()).owner(doc_hash)
+        return self._node_pending_key(owner) if owner else self.shared_pending_key
+
+    def _spool(self, file) -> str:
+        """Write an uploaded file to the spool dir and return its path"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}_{os.path.basename(file.name)}")
+        with open(path, 'wb') as f:
+            f.write(file.getvalue())
+        return path
+
+    def _page_ranges(self, path: str) -> List[Optional[Tuple[int, int]]]:
+        """
+        [start, end) page ranges to queue as separate jobs, job_pages each;
+        [None] (one job for the whole file) for short or unreadable PDFs
+        """
+        try:
+            pages = count_pdf_pages(path)
+        except Exception:
+            return [None]
+        if pages <= self.job_pages:
+            return [(0, pages)] if pages else [None]
+        return [(start, min(start + self.job_pages, pages)) for start in range(0, pages, self.job_pages)]
+
+    def queue_pdf(
+        self,
+        file,
+        batch_id: Optional[str] = None,
+        tenant: str = 'default',
+        priority: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Enqueue one PDF, split into page-range jobs of job_pages pages
+        Args:
+            file: path to a PDF on shared storage, or an uploaded file object
+                with .name and .getvalue()
+            batch_id: batch the job belongs to, whose total its creator set
+                (see process_pdf_batch); a new one-job batch if omitted
+            tenant: fair-share flow the job is billed to
+            priority: INTERACTIVE or BULK; uploads default to interactive,
+                paths to bulk
+        Returns:
+            id of the document's first job, which also keys its progress
+            in the batch; None if the same upload was queued within the hour
+        """
+        if isinstance(file, str):
+            path = file
+            # Shard ownership follows content; unsharded jobs only need an id
+            if self.membership is not None:
+                doc_hash = file_checkpoint_key(file)
             else:
-                cache_misses.inc()
-                not_found.append(doc)
-                
+                doc_hash = hashlib.sha256(os.path.abspath(file).encode()).hexdigest()
+        else:
+            doc_hash = hashlib.sha256(file.getvalue()).hexdigest()
+            # Streamlit reruns the script with the same uploads; queue them once
+            if not self.redis.set(self.dedupe_prefix + doc_hash, 1, nx=True, ex=3600):
+                return None
+            path = self._spool(file)
+
+        priority = priority or (BULK if isinstance(file, str) else INTERACTIVE)
+        weight = self.weights.weight(priority, tenant)
+        new_batch = batch_id is None
+        batch_id = batch_id or uuid.uuid4().hex
+        pending_key = self._queue_for(doc_hash)
+        ranges = self._page_ranges(path)
+        job_ids = [uuid.uuid4().hex for _ in ranges]
+        # The first job's id names the document in its batch
+        doc_id = job_ids[0]
+        document = {
+            f'doc:{doc_id}:filename': os.path.basename(path),
+            f'doc:{doc_id}:status': 'pending',
+            f'doc:{doc_id}:ranges': len(ranges),
+        }
+        if ranges[0] is not None:
+            document[f'doc:{doc_id}:pages'] = ranges[-1][1]
+        with self.redis.pipeline() as pipe:
+            if new_batch:
+                pipe.hset(self.batch_prefix + batch_id, mapping=self._new_batch(1))
+            pipe.hset(self.batch_prefix + batch_id, mapping=document)
+            if ranges[0] is not None:
+                pipe.hincrby(self.batch_prefix + batch_id, 'pages_total', ranges[-1][1])
+            for job_id, pages in zip(job_ids, ranges):
+                job = {
+                    'path': path,
+                    'filename': os.path.basename(path),
+                    'batch_id': batch_id,
+                    'doc_id': doc_id,
+                    'doc_hash': doc_hash,
+                    'queue': pending_key,
+                    'tenant': tenant,
+                    'priority': priority,
+                    'status': 'pending',
+                    'attempts': 0,
+                    'queued_at': time.time(),
+                }
+                if len(ranges) > 1:
+                    job.update(start=pages[0], end=pages[1])
+                pipe.hset(self.job_prefix + job_id, mapping=job)
+                # Each range costs its page count; ranges of one document
+                # follow each other in their flow like separate uploads
+                cost = pages[1] - pages[0] if pages else 1
+                self._enqueue(
+                    keys=[pending_key, self.fair_prefix + pending_key, self.job_prefix + job_id],
+                    args=[job_id, f"flow:{priority}:{tenant}", cost / weight],
+                    client=pipe,
+                )
+            pipe.publish(self.progress_prefix + batch_id, doc_id)
+            pipe.execute()
+        pdf_jobs.labels(status='queued').inc(len(job_ids))
+        return doc_id
+
+    def process_pdf_batch(
+        self,
+        pdf_paths: List[str],
+        batch_id: Optional[str] = None,
+        tenant: str = 'default',
+        priority: Optional[str] = None,
+    ) -> str:
+        """
+        Enqueue a batch of PDFs (paths or uploaded files, see queue_pdf)
+        and return its batch id
+        """
+        batch_id = batch_id or uuid.uuid4().hex
+        # The total is known before the first job is queued, so a worker
+        # finishing early cannot make the batch look complete
+        self.redis.hset(self.batch_prefix + batch_id, mapping=self._new_batch(len(pdf_paths)))
+        for path in pdf_paths:
+            if self.queue_pdf(path, batch_id=batch_id, tenant=tenant, priority=priority) is None:
+                # Upload already queued within the hour: not part of this batch
+                self.redis.hincrby(self.batch_prefix + batch_id, 'total', -1)
+        total, processed, failed = (
+            int(v or 0) for v in self.redis.hmget(self.batch_prefix + batch_id, 'total', 'processed', 'failed')
+        )
+        if processed + failed >= total:
+            # Dropped duplicates left the batch complete; no finishing job will expire it
+            self.redis.expire(self.batch_prefix + batch_id, self.retention)
+        return batch_id
+
+    @staticmethod
+    def _new_batch(total: int) -> Dict:
         return {
-            'found': found,
-            'not_found': not_found
+            'created_at': time.time(),
+            'total': total,
+            'processed': 0,
+            'failed': 0,
+            'pages_total': 0,
+            'pages_done': 0,
         }
-    
-    def _cache_result(self, doc_id: str, result: Dict):
-        """Cache processed result"""
-        cache_key = f"doc_result:{doc_id}"
-        self.redis.setex(cache_key, self.cache_ttl, str(result))
-    
-    def _process_single_document(self, document: str) -> Dict:
-        """Process a single document with optimizations"""
-        try:
-            # Add your document processing logic here
-            # This is just a placeholder
-            result = {
-                'id': document,
-                'status': 'processed',
-                'timestamp': time.time()
-            }
-            return result
-        except Exception as e:
-            logging.error(f"Document processing error: {str(e)}")
-            return {
-                'id': document,
-                'status': 'error',
-                'error': str(e)
-            }
 
-    def optimize_connection_pool(self):
-        """Optimize connection pool settings"""
-        self.redis.connection_pool.max_connections = self.max_workers * 2
-        
-    def get_performance_metrics(self) -> Dict:
-        """Get current performance metrics"""
+    def _pending_keys(self) -> List[str]:
+        if self.membership is None:
+            return [self.pending_key]
+        return [self.shared_pending_key] + [
+            key.decode() for key in self.redis.scan_iter(match=self._node_pending_key('*'))
+        ]
+
+    def get_status(self) -> Dict:
+        """Queue-wide counters"""
+        with self.redis.pipeline() as pipe:
+            pipe.hgetall(self.stats_key)
+            pipe.zcard(self.leases_key)
+            for key in self._pending_keys():
+                pipe.zcard(key)
+            stats, in_flight, *lengths = pipe.execute()
+        pending = sum(lengths)
+        return {
+            'processed': int(stats.get(b'processed', 0)),
+            'failed': int(stats.get(b'failed', 0)),
+            'pending': pending + in_flight,
+            'in_flight': in_flight,
+        }
+
+    async def get_batch_status(self, batch_id: str) -> Dict:
+        """Progress of one batch, per document and per page, from a single hash read"""
+        raw = await asyncio.to_thread(self.redis.hgetall, self.batch_prefix + batch_id)
+        return self.parse_batch_status(batch_id, raw)
+
+    @staticmethod
+    def parse_batch_status(batch_id: str, raw: Dict) -> Dict:
+        if not raw:
+            return {'batch_id': batch_id, 'status': 'unknown'}
+        batch = {k.decode(): v.decode() for k, v in raw.items()}
+        total = int(batch.get('total', 0))
+        processed = int(batch.get('processed', 0))
+        failed = int(batch.get('failed', 0))
+
+        documents = {}
+        for field, value in batch.items():
+            if field.startswith('doc:'):
+                _, job_id, attribute = field.split(':', 2)
+                documents.setdefault(job_id, {'job_id': job_id})[attribute] = (
+                    int(value) if attribute in _DOC_COUNTERS else value
+                )
         return {
-            'cache_hit_rate': cache_hits._value / (cache_hits._value + cache_misses._value) if (cache_hits._value + cache_misses._value) > 0 else 0,
-            'active_workers': threading.active_count(),
-            'queue_size': self.processing_queue.qsize(),
-        }
\ No newline at end of file
+            'batch_id': batch_id,
+            'status': 'completed' if processed + failed >= total else 'processing',
+            'total': total,
+            'processed': processed,
+            'failed': failed,
+            'pages_total': int(batch.get('pages_total', 0)),
+            'pages_done': int(batch.get('pages_done', 0)),
+            'documents': list(documents.values()),
+        }
+
+    def progress_channel(self, batch_id: str) -> str:
+        """Pub/sub channel that gets a message whenever the batch changes"""
+        return self.progress_prefix + batch_id
+
+    # Worker side
+
+    def claim_job(self) -> Optional[Dict]:
+        """Lease the next pending job, or None if the queue is empty"""
+        token = uuid.uuid4().hex
+        job_id = self._claim(
+            keys=[self.pending_key, self.leases_key, self.job_prefix, self.fair_prefix + self.pending_key],
+            args=[self.visibility_timeout, token],
+        )
+        if job_id is None:
+            return None
+        job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+        job = {k.decode(): v.decode() for k, v in self.redis.hgetall(self.job_prefix + job_id).items()}
+        job.update({'job_id': job_id, 'lease': token})
+        if job.get('attempts') == '0' and 'queued_at' in job:
+            queue_wait.labels(priority=job.get('priority', BULK)).observe(
+                max(time.time() - float(job['queued_at']), 0.0)
+            )
+        return job
+
+    def extend_lease(self, job: Dict) -> bool:
+        """Renew the visibility timeout; False if the lease was lost"""
+        return bool(self._extend(
+            keys=[self.leases_key, self.job_prefix + job['job_id']],
+            args=[job['job_id'], self.visibility_timeout, job['lease']],
+        ))
+
+    def complete_job(self, job: Dict) -> str:
+        return self._finish_job(job, 'done')
+
+    def fail_job(self, job: Dict, error: str) -> str:
+        """Requeue the job for retry, or mark it failed after max_retries"""
+        return self._finish_job(job, 'error', error)
+
+    def _finish_job(self, job: Dict, outcome: str, error: str = '') -> str:
+        result = self._finish(
+            keys=[
+                self.leases_key,
+                self.job_prefix + job['job_id'],
+                self.batch_prefix + job['batch_id'],
+                self._queue_for(job['doc_hash']) if 'doc_hash' in job else self.pending_key,
+                self.stats_key,
+            ],
+            args=[
+                job['job_id'], job['lease'], outcome, error, self.max_retries,
+                self.progress_prefix + job['batch_id'], self.retention,
+            ],
+        )
+        result = result.decode() if isinstance(result, bytes) else result
+        pdf_jobs.labels(status=result).inc()
+        return result
+
+    def requeue_expired(self) -> int:
+        """Return jobs with expired leases to the queue; safe to call from every worker"""
+        return int(self._reap(
+            keys=[self.leases_key, self.pending_key, self.stats_key],
+            args=[self.job_prefix, self.batch_prefix, self.max_retries, self.progress_prefix, self.retention],
+        ))
+
+    def report_progress(self, job: Dict, pages_done: int, total_pages: int):
+        """Record how many pages of a leased job (of its page range, if it has one) are done"""
+        self._progress(
+            keys=[self.batch_prefix + job['batch_id'], self.job_prefix + job['job_id']],
+            args=[job['job_id'], pages_done, total_pages, self.progress_prefix + job['batch_id']],
+        )
+
+    def rebalance(self, force: bool = False) -> int:
+        """
+        Move waiting jobs to their owners after membership changed (or
+        when jobs are parked on the shared list); only jobs whose owner
+        changed are touched
+        Returns:
+            number of jobs moved
+        """
+        if self.membership is None:
+            return 0
+        ring = self.membership.ring()
+        members = tuple(sorted(ring.nodes))
+        if not force and members == self._ring_members and not self.redis.zcard(self.shared_pending_key):
+            return 0
+        self._ring_members = members
+        if not members:
+            return 0
+
+        moved = 0
+        for source in self._pending_keys():
+            job_ids = [j.decode() for j in self.redis.zrange(source, 0, -1)]
+            with self.redis.pipeline() as pipe:
+                for job_id in job_ids:
+                    pipe.hget(self.job_prefix + job_id, 'doc_hash')
+                doc_hashes = pipe.execute()
+            for job_id, doc_hash in zip(job_ids, doc_hashes):
+                if doc_hash is None:
+                    continue
+                target = self._queue_for(doc_hash.decode(), ring)
+                if target != source:
+                    moved += self._move(keys=[source, target, self.job_prefix + job_id], args=[job_id])
+        if moved:
+            logging.info(f"Rebalanced {moved} pending jobs across {len(members)} nodes")
+        return moved
+
+
+# Staged pipeline metrics
+stage_queue_depth = Gauge('pipeline_queue_depth', 'Items waiting in front of a stage', ['stage'])
+stage_utilization = Gauge(
+    'pipeline_stage_utilization', 'Share of stage worker time spent busy since the run started', ['stage']
+)
+stage_seconds = Histogram('pipeline_stage_seconds', 'Time a stage spends on one item', ['stage'])
+stage_items = Counter('pipeline_stage_items_total', 'Items handled per stage', ['stage', 'status'])
+
+_STAGE_DONE = object()
+
+
+class PipelineStage:
+    """
+    One step of a StagedPipeline: fn(item) -> output (None drops the item).
+    close, if given, runs once after the stage's last item.
+    """
+
+    def __init__(self, name: str, fn, workers: int = 1, queue_size: int = 8, close=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+        self.close = close
+
+
+class StagedPipeline:
+    """
+    Runs items through stages connected by bounded queues, each stage with
+    its own worker threads. A full queue blocks the stage feeding it, so
+    memory stays bounded by the queue sizes and a slow stage throttles
+    everything upstream instead of letting work pile up. Queue depth and
+    busy time per stage show which stage is the bottleneck.
+
+    Worker counts can change while a run is in progress (see resize and
+    src/autoscaler.py): new workers start at once, surplus workers retire
+    after their current item.
+    """
+
+    def __init__(self, stages: List[PipelineStage]):
+        self.stages = stages
+        self._index = {stage.name: i for i, stage in enumerate(stages)}
+        self._lock = threading.Lock()
+        self._running = False
+
+    def _account(self, index: int, now: float):
+        """Add worker-seconds of capacity since the last change (lock held)"""
+        stage_stats = self._stats[self.stages[index].name]
+        stage_stats['worker_seconds'] += self._active[index] * (now - self._since[index])
+        self._since[index] = now
+
+    def _put(self, index: int, item):
+        if index < len(self._queues):
+            self._queues[index].put(item)
+            stage_queue_depth.labels(stage=self.stages[index].name).set(self._queues[index].qsize())
+
+    def _spawn(self, index: int):
+        """Start one worker for stage index (lock held)"""
+        self._account(index, time.perf_counter())
+        self._active[index] += 1
+        self._spawned[index] += 1
+        stage = self.stages[index]
+        threading.Thread(
+            target=self._worker,
+            args=(index,),
+            name=f"pipeline-{stage.name}-{self._spawned[index]}",
+            daemon=True
+        ).start()
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        stage_stats = self._stats[stage.name]
+        stage_queue = self._queues[index]
+        while True:
+            item = stage_queue.get()
+            stage_queue_depth.labels(stage=stage.name).set(stage_queue.qsize())
+            if item is _STAGE_DONE:
+                # Leave the marker for the stage's other workers; no new
+                # workers are started for a draining stage
+                with self._lock:
+                    self._draining[index] = True
+                stage_queue.put(_STAGE_DONE)
+                break
+            start = time.perf_counter()
+            try:
+                output = stage.fn(item)
+                status = 'processed'
+            except Exception as e:
+                logging.error(f"Pipeline stage {stage.name} failed: {str(e)}")
+                output, status = None, 'error'
+            busy = time.perf_counter() - start
+            stage_seconds.labels(stage=stage.name).observe(busy)
+            stage_items.labels(stage=stage.name, status=status).inc()
+            if output is not None:
+                self._put(index + 1, output)
+            with self._lock:
+                stage_stats['processed' if status == 'processed' else 'errors'] += 1
+                stage_stats['busy_seconds'] += busy
+                now = time.perf_counter()
+                self._account(index, now)
+                if stage_stats['worker_seconds']:
+                    stage_utilization.labels(stage=stage.name).set(
+                        stage_stats['busy_seconds'] / stage_stats['worker_seconds']
+                    )
+                if self._active[index] > self._target[index]:
+                    # Scaled down: retire after this item
+                    self._active[index] -= 1
+                    return
+
+        # The last worker out closes this stage and signals the next one,
+        # exactly once even if a resize raced with the drain
+        with self._lock:
+            self._account(index, time.perf_counter())
+            self._active[index] -= 1
+            last = self._active[index] == 0 and not self._closing[index]
+            if last:
+                self._closing[index] = True
+        if not last:
+            return
+        if stage.close is not None:
+            try:
+                stage.close()
+            except Exception as e:
+                logging.error(f"Pipeline stage {stage.name} close failed: {str(e)}")
+                with self._lock:
+                    stage_stats['errors'] += 1
+        self._put(index + 1, _STAGE_DONE)
+        self._done[index].set()
+
+    def resize(self, stage_name: str, workers: int):
+        """Set a stage's worker count for the current run (at least 1)"""
+        index = self._index[stage_name]
+        with self._lock:
+            if not self._running or self._draining[index]:
+                return
+            self._target[index] = max(1, workers)
+            while self._active[index] < self._target[index]:
+                self._spawn(index)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Per-stage workers, queue fill and cumulative counters of the current run"""
+        if not self._running:
+            return {}
+        with self._lock:
+            now = time.perf_counter()
+            result = {}
+            for index, stage in enumerate(self.stages):
+                self._account(index, now)
+                result[stage.name] = dict(
+                    self._stats[stage.name],
+                    workers=self._target[index],
+                    queue_depth=self._queues[index].qsize(),
+                    queue_size=stage.queue_size,
+                    done=self._done[index].is_set(),
+                )
+            return result
+
+    def run(self, items) -> Dict:
+        """
+        Feed items to the first stage and wait for every stage to drain
+        Returns:
+            per-stage processed/error counts and utilization
+        """
+        now = time.perf_counter()
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self._stats = {
+            stage.name: {'processed': 0, 'errors': 0, 'busy_seconds': 0.0, 'worker_seconds': 0.0}
+            for stage in self.stages
+        }
+        self._active = [0] * len(self.stages)
+        self._spawned = [0] * len(self.stages)
+        self._target = [stage.workers for stage in self.stages]
+        self._since = [now] * len(self.stages)
+        self._done = [threading.Event() for _ in self.stages]
+        self._draining = [False] * len(self.stages)
+        self._closing = [False] * len(self.stages)
+        with self._lock:
+            self._running = True
+            for index, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    self._spawn(index)
+        try:
+            for item in items:
+                self._put(0, item)
+            self._put(0, _STAGE_DONE)
+            for done in self._done:
+                done.wait()
+        finally:
+            with self._lock:
+                self._running = False
+
+        stats = self._stats
+        for stage_stats in stats.values():
+            worker_seconds = stage_stats.pop('worker_seconds')
+            stage_stats['utilization'] = stage_stats['busy_seconds'] / worker_seconds if worker_seconds else 0.0
+        return stats
+
+
+def build_ingestion_pipeline(
+    embed_model,
+    index_dir: str,
+    parse_workers: int = 4,
+    chunk_workers: int = 2,
+    embed_workers: int = 4,
+    queue_size: int = 8,
+    upsert_batch_nodes: int = 2000,
+    lock=None,
+    page_parser=None,
+) -> StagedPipeline:
+    """
+    parse -> chunk -> embed -> upsert over (path, start, end) page ranges.
+    Upsert runs on a single worker and merges every upsert_batch_nodes
+    nodes (and the remainder at the end) instead of rewriting the index
+    per shard; pass a lock (e.g. redis.lock) when other writers share
+    index_dir. A SharedMemoryPageParser as page_parser moves parsing into
+    processes; its page arenas are released once chunked.
+    """
+    parse_pages = page_parser or parse_pdf_pages
+
+    def parse(shard):
+        path, start, end = shard
+        docs = parse_pages(path, start, end)
+        if docs is None:
+            raise RuntimeError(f"Parsing pages {start}-{end} of {path} failed")
+        for doc in docs:
+            doc.metadata['filename'] = os.path.basename(path)
+        return docs
+
+    def chunk(docs):
+        try:
+            return chunk_documents(docs) or None
+        finally:
+            if hasattr(docs, 'close'):
+                docs.close()
+
+    def embed(nodes):
+        return embed_nodes(nodes, embed_model) or None
+
+    pending = []
+
+    def flush():
+        if pending:
+            upsert_nodes(pending, index_dir, embed_model, lock=lock)
+            pending.clear()
+
+    def upsert(nodes):
+        pending.extend(nodes)
+        if len(pending) >= upsert_batch_nodes:
+            flush()
+
+    return StagedPipeline([
+        PipelineStage('parse', parse, parse_workers, queue_size),
+        PipelineStage('chunk', chunk, chunk_workers, queue_size),
+        PipelineStage('embed', embed, embed_workers, queue_size),
+        PipelineStage('upsert', upsert, 1, queue_size, close=flush),
+    ])
+
+
+def page_range_shards(paths: List[str], shard_pages: int = 10):
+    """(path, start, end) items for build_ingestion_pipeline, generated lazily"""
+    for path in paths:
+        total_pages = count_pdf_pages(path)
+        for start in range(0, total_pages, shard_pages):
+            yield path, start, min(start + shard_pages, total_pages)
+
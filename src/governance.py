@@ -7,6 +7,7 @@ from prometheus_client import Counter
 import hashlib
 import json
 from cryptography.fernet import Fernet
+from src.write_behind import AsyncWriteBehindBuffer
 
 # Governance metrics
 data_access_events = Counter('data_access_total', 'Total data access events', ['action'])
@@ -19,6 +20,11 @@ class DataGovernance:
         self.redis = Redis.from_url(config.get('REDIS_URL', 'redis://localhost:6379'))
         self.mongo = AsyncIOMotorClient(config.get('MONGODB_URL', 'mongodb://localhost:27017'))
         self.db = self.mongo.governance
+        self.access_log_writer = AsyncWriteBehindBuffer(
+            self.db.access_logs,
+            max_batch=config.get('ACCESS_LOG_FLUSH_SIZE', 500),
+            flush_interval=config.get('ACCESS_LOG_FLUSH_INTERVAL', 1.0)
+        )
         
         # Initialize encryption
         self.cipher = Fernet(config['ENCRYPTION_KEY'].encode())
@@ -40,9 +46,13 @@ class DataGovernance:
             'ip_address': self._get_client_ip()
         }
         
-        await self.db.access_logs.insert_one(access_event)
+        await self.access_log_writer.put(access_event)
         data_access_events.labels(action=action).inc()
 
+    async def close(self):
+        """Flush buffered access logs"""
+        await self.access_log_writer.close()
+
     async def enforce_retention_policy(self, data_type: str):
         """Enforce data retention policies"""
         retention_days = self.retention_policies.get(data_type)
@@ -0,0 +1,108 @@
+from typing import Dict, List
+import logging
+import os
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+from src.vector import load_index_from_disk, persist_index_to_disk
+from src.work_nvidia import TEXT_SPLITTER_CHUNCK_OVERLAP, TEXT_SPLITTER_CHUNCK_SIZE
+
+
+def chunk_documents(docs: List[Document]) -> List[BaseNode]:
+    """
+    Split parsed pages into nodes
+    Args:
+        docs: list of LlamaIndex Documents (one per page)
+    """
+    splitter = SentenceSplitter(
+        chunk_size=TEXT_SPLITTER_CHUNCK_SIZE,
+        chunk_overlap=TEXT_SPLITTER_CHUNCK_OVERLAP,
+    )
+    return splitter.get_nodes_from_documents(docs)
+
+
+def embed_nodes(nodes: List[BaseNode], embed_model) -> List[BaseNode]:
+    """
+    Embed nodes that have no embedding yet, in one batched call
+    Args:
+        nodes: nodes to embed in place
+        embed_model: LlamaIndex embedding model
+    """
+    missing = [node for node in nodes if node.embedding is None]
+    if missing:
+        embeddings = embed_model.get_text_embedding_batch(
+            [node.get_content(metadata_mode=MetadataMode.EMBED) for node in missing]
+        )
+        for node, embedding in zip(missing, embeddings):
+            node.embedding = embedding
+    return nodes
+
+
+def mark_duplicates(nodes: List[BaseNode], duplicates: Dict[str, str]) -> List[BaseNode]:
+    """
+    Turn near-duplicate chunks into reference nodes
+    Args:
+        nodes: chunks of one shard
+        duplicates: {duplicate node id: id of the node it repeats}, from
+            ChunkDeduplicator.split
+    Returns:
+        the duplicate nodes, with metadata["duplicate_of"] set; they are
+        not embedded, upsert_nodes gives them the original's embedding
+    """
+    references = []
+    for node in nodes:
+        original = duplicates.get(node.node_id)
+        if original is None:
+            continue
+        node.metadata["duplicate_of"] = original
+        node.excluded_embed_metadata_keys.append("duplicate_of")
+        node.excluded_llm_metadata_keys.append("duplicate_of")
+        references.append(node)
+    return references
+
+
+def share_duplicate_embeddings(nodes: List[BaseNode], vector_store=None):
+    """
+    Give reference nodes the embedding of the node they repeat, from the
+    same call or from vector_store; ones whose original is gone keep no
+    embedding and are embedded on insert
+    """
+    embeddings = {node.node_id: node.embedding for node in nodes if node.embedding is not None}
+    for node in nodes:
+        original = node.metadata.get("duplicate_of")
+        if original is None or node.embedding is not None:
+            continue
+        embedding = embeddings.get(original)
+        if embedding is None and vector_store is not None:
+            try:
+                embedding = vector_store.get(original)
+            except KeyError:
+                logging.warning(f"Original {original} of duplicate chunk {node.node_id} is not indexed")
+        node.embedding = embedding
+
+
+def upsert_nodes(nodes: List[BaseNode], index_dir: str, embed_model, lock=None):
+    """
+    Merge embedded nodes into the index persisted at index_dir
+    Args:
+        nodes: nodes with embeddings already set
+        index_dir: persist directory of the index
+        embed_model: embedding model the index is queried with
+        lock: optional lock (e.g. redis.lock) held across load/insert/persist
+            when several workers write the same directory
+    Nodes marked as references (see mark_duplicates) are stored with the
+    embedding of the node they repeat.
+    """
+    if lock is not None:
+        with lock:
+            return upsert_nodes(nodes, index_dir, embed_model)
+    if os.path.isfile(os.path.join(index_dir, "default__vector_store.json")):
+        Settings.embed_model = embed_model
+        index = load_index_from_disk(index_dir)
+        share_duplicate_embeddings(nodes, index.vector_store)
+        index.insert_nodes(nodes)
+    else:
+        share_duplicate_embeddings(nodes)
+        index = VectorStoreIndex(nodes=nodes, embed_model=embed_model)
+    persist_index_to_disk(index, index_dir)
+    return index
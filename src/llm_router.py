@@ -0,0 +1,334 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import asyncio
+import logging
+import threading
+import time
+from prometheus_client import Counter, Histogram
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import (
+    LLM,
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+
+# Router metrics
+provider_latency = Histogram(
+    'llm_provider_latency_seconds', 'LLM provider call latency', ['provider']
+)
+provider_errors = Counter('llm_provider_errors_total', 'LLM provider call errors', ['provider'])
+hedged_requests = Counter('llm_hedged_requests_total', 'Hedged duplicate LLM requests', ['provider'])
+backup_wins = Counter('llm_backup_wins_total', 'Requests answered by a non-primary provider', ['provider'])
+
+
+class ProviderStats:
+    """Rolling latency and error window for a single provider"""
+
+    def __init__(
+        self,
+        window: int = 200,
+        min_samples: int = 10,
+        max_error_rate: float = 0.5,
+        cooldown: float = 30.0,
+    ):
+        """
+        Args:
+            window: number of recent calls kept for percentiles and error rate
+            min_samples: calls needed before percentiles are trusted
+            max_error_rate: error rate above which the provider is unhealthy
+            cooldown: seconds an unhealthy provider is skipped before a retry
+        """
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.unhealthy_since = None
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        """Record the outcome of one call"""
+        with self._lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+            if not ok and self._error_rate() > self.max_error_rate:
+                self.unhealthy_since = time.monotonic()
+            elif ok and self.unhealthy_since is not None:
+                # A successful probe after the cooldown starts a fresh error window
+                self.outcomes.clear()
+                self.outcomes.append(True)
+                self.unhealthy_since = None
+
+    def _error_rate(self) -> float:
+        if len(self.outcomes) < self.min_samples:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile (0-100) or None while warming up"""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self.percentile(50)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self.percentile(95)
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._error_rate()
+
+    def is_healthy(self) -> bool:
+        """Unhealthy providers become eligible again once the cooldown expires"""
+        with self._lock:
+            if self.unhealthy_since is None:
+                return True
+            return time.monotonic() - self.unhealthy_since > self.cooldown
+
+    def snapshot(self) -> Dict:
+        return {
+            'p50': self.p50,
+            'p95': self.p95,
+            'error_rate': self.error_rate,
+            'healthy': self.is_healthy(),
+            'samples': len(self.outcomes),
+        }
+
+
+class RoutingLLM(LLM):
+    """
+    LLM that routes each call to the fastest healthy provider and hedges
+    with a duplicate request to the runner-up when the first call runs past
+    its own p95 latency
+    """
+
+    default_hedge_delay: float = Field(
+        default=2.0, description="Hedge delay used until a provider has enough samples"
+    )
+    max_workers: int = Field(default=16, description="Threads available for in-flight calls")
+
+    _providers: Dict[str, LLM] = PrivateAttr()
+    _stats: Dict[str, ProviderStats] = PrivateAttr()
+    _executor: ThreadPoolExecutor = PrivateAttr()
+
+    def __init__(
+        self,
+        providers: Dict[str, LLM],
+        stats_window: int = 200,
+        min_samples: int = 10,
+        max_error_rate: float = 0.5,
+        cooldown: float = 30.0,
+        **kwargs: Any,
+    ):
+        """
+        Args:
+            providers: ordered mapping of provider name to LLM; order is the
+                preference used while latency stats are warming up
+            stats_window, min_samples, max_error_rate, cooldown: see ProviderStats
+        """
+        if not providers:
+            raise ValueError("RoutingLLM needs at least one provider")
+        super().__init__(**kwargs)
+        self._providers = dict(providers)
+        self._stats = {
+            name: ProviderStats(stats_window, min_samples, max_error_rate, cooldown)
+            for name in self._providers
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="llm-router"
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RoutingLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        # Context window of the smallest provider so prompts fit any of them
+        metas = [llm.metadata for llm in self._providers.values()]
+        primary = metas[0]
+        return LLMMetadata(
+            context_window=min(m.context_window for m in metas),
+            num_output=min(m.num_output for m in metas),
+            is_chat_model=primary.is_chat_model,
+            is_function_calling_model=False,
+            model_name="router:" + ",".join(self._providers),
+        )
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Current latency/health snapshot per provider"""
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def _ranked_providers(self) -> List[str]:
+        """Healthy providers by p50, warming-up ones in configured order after them"""
+        names = list(self._providers)
+        healthy = [n for n in names if self._stats[n].is_healthy()] or names
+
+        def key(name):
+            p50 = self._stats[name].p50
+            return (p50 is None, p50 or 0.0, names.index(name))
+
+        return sorted(healthy, key=key)
+
+    def _timed_call(self, name: str, call: Callable[[LLM], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            result = call(self._providers[name])
+        except Exception:
+            self._stats[name].record(time.perf_counter() - start, ok=False)
+            provider_errors.labels(provider=name).inc()
+            raise
+        latency = time.perf_counter() - start
+        self._stats[name].record(latency, ok=True)
+        provider_latency.labels(provider=name).observe(latency)
+        return result
+
+    def _hedged_call(self, call: Callable[[LLM], Any]) -> Any:
+        """
+        Send to the fastest provider; if it has not answered within its p95,
+        fire one duplicate at the next provider and take whichever finishes
+        first. Failures fall through to the remaining providers.
+        """
+        ranked = self._ranked_providers()
+        backups = iter(ranked[1:])
+        primary = ranked[0]
+        pending = {self._executor.submit(self._timed_call, primary, call): primary}
+        hedge_delay = self._stats[primary].p95 or self.default_hedge_delay
+        hedged = False
+        last_error = None
+
+        while pending:
+            done, _ = wait(
+                pending,
+                timeout=None if hedged else hedge_delay,
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                hedged = True
+                backup = next(backups, None)
+                if backup is not None:
+                    hedged_requests.labels(provider=backup).inc()
+                    pending[self._executor.submit(self._timed_call, backup, call)] = backup
+                continue
+
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    logging.warning(f"LLM provider {name} failed: {str(e)}")
+                    continue
+                if name != primary:
+                    backup_wins.labels(provider=name).inc()
+                # The losing duplicate keeps running; its latency still feeds the stats
+                return result
+
+            if not pending:
+                backup = next(backups, None)
+                if backup is not None:
+                    pending[self._executor.submit(self._timed_call, backup, call)] = backup
+
+        raise last_error
+
+    def _streamed_call(self, call: Callable[[LLM], Any]):
+        """
+        Streams are not hedged; fail over to the next provider only when a
+        provider errors before producing its first chunk
+        """
+        last_error = None
+        for name in self._ranked_providers():
+            start = time.perf_counter()
+            try:
+                stream = call(self._providers[name])
+                first = next(stream)
+            except StopIteration:
+                self._stats[name].record(time.perf_counter() - start, ok=True)
+                return
+            except Exception as e:
+                self._stats[name].record(time.perf_counter() - start, ok=False)
+                provider_errors.labels(provider=name).inc()
+                logging.warning(f"LLM provider {name} failed: {str(e)}")
+                last_error = e
+                continue
+            # Time to first chunk is the latency users feel for streams
+            latency = time.perf_counter() - start
+            self._stats[name].record(latency, ok=True)
+            provider_latency.labels(provider=name).observe(latency)
+            yield first
+            yield from stream
+            return
+        raise last_error
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._hedged_call(lambda llm: llm.chat(messages, **kwargs))
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self._hedged_call(lambda llm: llm.complete(prompt, formatted=formatted, **kwargs))
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        return self._streamed_call(lambda llm: llm.stream_chat(messages, **kwargs))
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        return self._streamed_call(
+            lambda llm: llm.stream_complete(prompt, formatted=formatted, **kwargs)
+        )
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await asyncio.to_thread(
+            self._hedged_call, lambda llm: llm.chat(messages, **kwargs)
+        )
+
+    @llm_completion_callback()
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        return await asyncio.to_thread(
+            self._hedged_call,
+            lambda llm: llm.complete(prompt, formatted=formatted, **kwargs),
+        )
+
+    @llm_chat_callback()
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        return _iterate_in_thread(self.stream_chat(messages, **kwargs))
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        return _iterate_in_thread(self.stream_complete(prompt, formatted=formatted, **kwargs))
+
+
+async def _iterate_in_thread(stream):
+    """Drive a blocking generator from the event loop one chunk at a time"""
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, stream, done)
+        if chunk is done:
+            return
+        yield chunk
@@ -1,4 +1,4 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from abc import ABC, abstractmethod
 import os
 from llama_index.llms.openai import OpenAI
@@ -6,6 +6,8 @@ from llama_index.llms.anthropic import Anthropic
 from llama_index.llms.cohere import Cohere
 from llama_index.llms.azure_openai import AzureOpenAI
 from llama_index.llms.nvidia import NVIDIA
+from src.llm_router import RoutingLLM
+from src.local_provider import LocalLLM
 
 class BaseLLMService(ABC):
     """Abstract base class for LLM services"""
@@ -16,14 +18,16 @@ class BaseLLMService(ABC):
         pass
 
 class OpenAIService(BaseLLMService):
-    def __init__(self, api_key: str, model: str = "gpt-4"):
+    def __init__(self, api_key: str, model: str = "gpt-4", api_base: Optional[str] = None):
         self.api_key = api_key
         self.model = model
+        self.api_base = api_base
 
     def get_llm(self):
         return OpenAI(
             api_key=self.api_key,
             model=self.model,
+            api_base=self.api_base,
             temperature=0.7
         )
 
@@ -70,6 +74,60 @@ class AzureOpenAIService(BaseLLMService):
             deployment_name=self.deployment_name
         )
 
+class LocalLLMService(BaseLLMService):
+    """Offline deterministic LLM for load tests and benchmarks"""
+
+    def __init__(
+        self,
+        model: str = "local-canned-llm",
+        first_token_latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        num_output: int = 128
+    ):
+        self.model = model
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.num_output = num_output
+
+    def get_llm(self):
+        return LocalLLM(
+            model_name=self.model,
+            first_token_latency=self.first_token_latency,
+            tokens_per_second=self.tokens_per_second,
+            num_output=self.num_output
+        )
+
+class RoutingLLMService(BaseLLMService):
+    """Wraps several configured providers behind a latency-aware, hedging router"""
+
+    def __init__(
+        self,
+        providers: List[Tuple[str, Dict[str, Any]]],
+        hedge_delay: float = 2.0,
+        stats_window: int = 200,
+        max_error_rate: float = 0.5,
+        cooldown: float = 30.0
+    ):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.stats_window = stats_window
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+
+    def get_llm(self):
+        llms = {}
+        for name, config in self.providers:
+            service = LLMServiceFactory.create_service(name, config)
+            # The nvidia branch of the factory returns the LLM itself
+            llms[name] = service.get_llm() if isinstance(service, BaseLLMService) else service
+        return RoutingLLM(
+            providers=llms,
+            stats_window=self.stats_window,
+            max_error_rate=self.max_error_rate,
+            cooldown=self.cooldown,
+            default_hedge_delay=self.hedge_delay
+        )
+
 class LLMServiceFactory:
     """Factory for creating LLM services"""
     
@@ -78,7 +136,8 @@ class LLMServiceFactory:
         if provider == "openai":
             return OpenAIService(
                 api_key=config["api_key"],
-                model=config.get("model", "gpt-4")
+                model=config.get("model", "gpt-4"),
+                api_base=config.get("api_base")
             )
         elif provider == "anthropic":
             return AnthropicService(
@@ -102,5 +161,20 @@ class LLMServiceFactory:
                 model=config.get("model", "microsoft/phi-3-small-128k-instruct"),
                 api_key=config["api_key"]
             )
+        elif provider == "local":
+            return LocalLLMService(
+                model=config.get("model", "local-canned-llm"),
+                first_token_latency=config.get("first_token_latency", 0.0),
+                tokens_per_second=config.get("tokens_per_second", 0.0),
+                num_output=config.get("num_output", 128)
+            )
+        elif provider == "router":
+            return RoutingLLMService(
+                providers=config["providers"],
+                hedge_delay=config.get("hedge_delay", 2.0),
+                stats_window=config.get("stats_window", 200),
+                max_error_rate=config.get("max_error_rate", 0.5),
+                cooldown=config.get("cooldown", 30.0)
+            )
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
\ No newline at end of file
@@ -0,0 +1,190 @@
+from typing import Any, List, Sequence
+import asyncio
+import hashlib
+import re
+import time
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.generic_utils import (
+    astream_completion_response_to_chat_response,
+    completion_response_to_chat_response,
+)
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.llms import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+
+_WORD_RE = re.compile(r"\w+")
+
+_CANNED_WORDS = (
+    "the agreement states that the parties shall comply with the obligations "
+    "set out in this section including payment terms termination notice "
+    "confidentiality and liability limits as described in the document"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+class LocalEmbedding(BaseEmbedding):
+    """
+    Offline embedding model for load tests and benchmarks.
+
+    Vectors are signed feature-hashed bags of words, so they are
+    deterministic and texts sharing words still land close together.
+    Latency is simulated per call and per text.
+    """
+
+    dimensions: int = Field(default=1024, description="Embedding size")
+    call_latency: float = Field(default=0.0, description="Seconds added to every call")
+    text_latency: float = Field(default=0.0, description="Seconds added per embedded text")
+
+    def __init__(self, model_name: str = "local-hash-embedding", **kwargs: Any):
+        super().__init__(model_name=model_name, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in _WORD_RE.findall(text.lower()):
+            h = _seed(word)
+            vector[h % self.dimensions] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            # Empty text still gets a stable unit vector
+            vector[_seed(text) % self.dimensions] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.call_latency + self.text_latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        # Simulated latency must not block the event loop of async callers
+        await asyncio.sleep(self.call_latency + self.text_latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_batch([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aembed_batch([query]))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aembed_batch([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed_batch(texts)
+
+    async def _aget_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        return await self._aembed_batch(queries)
+
+
+class LocalLLM(CustomLLM):
+    """
+    Offline LLM returning canned completions for load tests and benchmarks.
+
+    The answer is chosen deterministically from the prompt; timing follows
+    a time-to-first-token plus a fixed token rate, in both streaming and
+    non-streaming calls.
+    """
+
+    model_name: str = Field(default="local-canned-llm")
+    context_window: int = Field(default=8192)
+    num_output: int = Field(default=128, description="Tokens per completion")
+    first_token_latency: float = Field(default=0.0, description="Seconds before the first token")
+    tokens_per_second: float = Field(default=0.0, description="Generation rate, 0 for instant")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.num_output,
+            model_name=self.model_name,
+        )
+
+    def _tokens(self, prompt: str) -> List[str]:
+        rng = np.random.default_rng(_seed(prompt))
+        picks = rng.integers(0, len(_CANNED_WORDS), size=self.num_output)
+        return [_CANNED_WORDS[i] + " " for i in picks]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        tokens = self._tokens(prompt)
+        time.sleep(self.first_token_latency + self._token_delay() * len(tokens))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        tokens = self._tokens(prompt)
+        delay = self._token_delay()
+
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.first_token_latency)
+            text = ""
+            for token in tokens:
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+                time.sleep(delay)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self.first_token_latency + self._token_delay() * len(tokens))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        tokens = self._tokens(prompt)
+        delay = self._token_delay()
+
+        async def gen() -> CompletionResponseAsyncGen:
+            await asyncio.sleep(self.first_token_latency)
+            text = ""
+            for token in tokens:
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+                await asyncio.sleep(delay)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        prompt = self.messages_to_prompt(messages)
+        return completion_response_to_chat_response(await self.acomplete(prompt, formatted=True, **kwargs))
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        prompt = self.messages_to_prompt(messages)
+        return astream_completion_response_to_chat_response(
+            await self.astream_complete(prompt, formatted=True, **kwargs)
+        )
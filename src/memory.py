@@ -0,0 +1,191 @@
+from typing import Any, Callable, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+from prometheus_client import Counter, Histogram
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory.types import BaseMemory
+from llama_index.core.utils import get_tokenizer
+
+# Memory metrics
+compactions = Counter('chat_memory_compactions_total', 'Chat memory compactions', ['status'])
+history_tokens = Histogram('chat_memory_history_tokens', 'Chat history tokens sent per turn')
+
+# Summaries are produced off the request path on a small shared pool
+_compaction_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-compaction")
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and an "
+    "assistant about a document. Keep facts, figures, names and open "
+    "questions; drop pleasantries. Answer with the new summary only, in at "
+    "most {max_tokens} tokens.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New turns:\n{turns}\n"
+)
+
+
+class RollingSummaryMemory(BaseMemory):
+    """
+    Chat memory that keeps recent turns verbatim and folds older turns into
+    a running summary in the background.
+
+    Token counts are computed once per message when it is stored. Once the
+    verbatim window grows past compact_at of the token limit, the oldest
+    turns are summarized on a worker thread and replaced by the summary, so
+    the history sent each turn stays roughly constant in size.
+    """
+
+    token_limit: int = Field(default=4500, description="Max history tokens returned per turn")
+    compact_at: float = Field(default=0.75, description="Window fill ratio that triggers compaction")
+    compact_to: float = Field(default=0.4, description="Window fill ratio left after compaction")
+    summary_max_tokens: int = Field(default=500, description="Target size of the running summary")
+
+    _llm: Any = PrivateAttr(default=None)
+    _tokenizer: Callable = PrivateAttr()
+    _all_messages: List[ChatMessage] = PrivateAttr(default_factory=list)
+    _window: deque = PrivateAttr(default_factory=deque)
+    _window_tokens: int = PrivateAttr(default=0)
+    _summary: str = PrivateAttr(default="")
+    _summary_tokens: int = PrivateAttr(default=0)
+    _pending: Optional[Future] = PrivateAttr(default=None)
+    _generation: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, llm=None, tokenizer: Optional[Callable] = None, **kwargs):
+        """
+        Args:
+            llm: LLM used for summaries, defaults to Settings.llm at compaction time
+            tokenizer: callable returning tokens for a string
+        """
+        super().__init__(**kwargs)
+        self._llm = llm
+        self._tokenizer = tokenizer or get_tokenizer()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RollingSummaryMemory"
+
+    @classmethod
+    def from_defaults(cls, **kwargs: Any) -> "RollingSummaryMemory":
+        return cls(**kwargs)
+
+    def _count_tokens(self, message: ChatMessage) -> int:
+        return len(self._tokenizer(message.content or "")) + 4  # role/format overhead
+
+    def _summary_message(self) -> ChatMessage:
+        return ChatMessage(
+            role=MessageRole.SYSTEM,
+            content=f"Summary of the earlier conversation:\n{self._summary}",
+        )
+
+    def get(self, input: Optional[str] = None, **kwargs: Any) -> List[ChatMessage]:
+        """Summary plus the most recent turns that fit in token_limit"""
+        with self._lock:
+            budget = self.token_limit - self._summary_tokens
+            recent = []
+            used = 0
+            # Compaction may lag behind a burst of turns; trim using cached counts
+            for message, tokens in reversed(self._window):
+                if used + tokens > budget:
+                    break
+                recent.append((message, tokens))
+                used += tokens
+            recent.reverse()
+            while recent and recent[0][0].role != MessageRole.USER:
+                used -= recent.pop(0)[1]
+            history = [message for message, _ in recent]
+            if self._summary:
+                history.insert(0, self._summary_message())
+            history_tokens.observe(used + self._summary_tokens)
+            return history
+
+    def get_all(self) -> List[ChatMessage]:
+        with self._lock:
+            return list(self._all_messages)
+
+    def put(self, message: ChatMessage) -> None:
+        tokens = self._count_tokens(message)
+        with self._lock:
+            self._all_messages.append(message)
+            self._window.append((message, tokens))
+            self._window_tokens += tokens
+            self._schedule_compaction()
+
+    def _schedule_compaction(self):
+        """Start a background compaction if the window is full; call with the lock held"""
+        if self._pending is None and self._window_tokens > self.token_limit * self.compact_at:
+            self._pending = _compaction_pool.submit(self._compact)
+
+    def set(self, messages: List[ChatMessage]) -> None:
+        self.reset()
+        for message in messages:
+            self.put(message)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._all_messages = []
+            self._window = deque()
+            self._window_tokens = 0
+            self._summary = ""
+            self._summary_tokens = 0
+            self._generation += 1
+
+    def _oldest_turns(self) -> Tuple[List[ChatMessage], int]:
+        """
+        Oldest window entries to fold so the window drops to compact_to.
+        Whole user/assistant exchanges are folded, so the window never
+        starts with a reply whose question was summarized away.
+        """
+        target = self.token_limit * self.compact_to
+        remaining = self._window_tokens
+        turns = []
+        for message, tokens in self._window:
+            if remaining <= target and message.role == MessageRole.USER:
+                break
+            turns.append(message)
+            remaining -= tokens
+        return turns, self._window_tokens - remaining
+
+    def _compact(self):
+        compacted = False
+        try:
+            with self._lock:
+                turns, folded_tokens = self._oldest_turns()
+                summary = self._summary
+                generation = self._generation
+            if not turns:
+                return
+
+            llm = self._llm or Settings.llm
+            prompt = SUMMARY_PROMPT.format(
+                max_tokens=self.summary_max_tokens,
+                summary=summary or "(none)",
+                turns="\n".join(f"{m.role.value}: {m.content}" for m in turns),
+            )
+            new_summary = str(llm.complete(prompt)).strip()
+            new_summary_tokens = len(self._tokenizer(new_summary))
+
+            with self._lock:
+                if generation != self._generation:
+                    return  # reset() while summarizing
+                # Only put() appends, so the folded turns are still at the front
+                for _ in turns:
+                    self._window.popleft()
+                self._window_tokens -= folded_tokens
+                self._summary = new_summary
+                self._summary_tokens = new_summary_tokens
+            compacted = True
+            compactions.labels(status='success').inc()
+        except Exception as e:
+            compactions.labels(status='error').inc()
+            logging.error(f"Chat memory compaction failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending = None
+                # Turns may have arrived while the summary was being written;
+                # after a failure wait for the next put() instead of retrying hot
+                if compacted:
+                    self._schedule_compaction()
@@ -1,12 +1,15 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 import logging
 from datetime import datetime
+import time
+import numpy as np
+import orjson
 import psutil
 import os
 from prometheus_client import Counter, Gauge, Histogram, start_http_server
 import threading
 from redis import Redis
-import json
+from src.profiler import install_signal_trigger, profile_window, profiling_settings
 
 # System Metrics
 cpu_usage = Gauge('system_cpu_usage_percent', 'CPU usage percentage')
@@ -18,6 +21,57 @@ api_requests = Counter('api_requests_total', 'Total API requests', ['endpoint',
 error_count = Counter('error_count_total', 'Total errors', ['type'])
 request_duration = Histogram('request_duration_seconds', 'Request duration in seconds')
 
+class SystemSampler:
+    """
+    psutil readings, each taken once per sample(), in a fixed-size NumPy
+    ring buffer. Older samples are overwritten once capacity is reached.
+    """
+
+    COLUMNS = ('timestamp', 'cpu', 'memory', 'memory_used', 'disk', 'threads')
+
+    def __init__(self, capacity: int = 3600, disk_path: str = '/'):
+        self.capacity = capacity
+        self.disk_path = disk_path
+        self.buffer = np.zeros((capacity, len(self.COLUMNS)), dtype=np.float64)
+        # Samples taken since start; the write position is count % capacity
+        self.count = 0
+        self._lock = threading.Lock()
+        # The first cpu_percent() call has no previous reading to compare with
+        psutil.cpu_percent(interval=None)
+
+    def sample(self) -> Dict[str, float]:
+        memory = psutil.virtual_memory()
+        row = (
+            time.time(),
+            psutil.cpu_percent(interval=None),
+            memory.percent,
+            memory.used,
+            psutil.disk_usage(self.disk_path).percent,
+            threading.active_count(),
+        )
+        with self._lock:
+            self.buffer[self.count % self.capacity] = row
+            self.count += 1
+        return dict(zip(self.COLUMNS, row))
+
+    def since(self, start: int) -> Tuple[np.ndarray, int]:
+        """Samples taken after the start-th, oldest first (those overwritten are lost), and the new count"""
+        with self._lock:
+            end = self.count
+            start = max(start, end - self.capacity)
+            rows = self.buffer[np.arange(start, end) % self.capacity]
+        return rows, end
+
+    @staticmethod
+    def downsample(rows: np.ndarray, bucket: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per-bucket means, maxima and sample counts of every `bucket` consecutive samples"""
+        starts = np.arange(0, len(rows), bucket)
+        sizes = np.diff(np.append(starts, len(rows)))
+        means = np.add.reduceat(rows, starts, axis=0) / sizes[:, None]
+        maxima = np.maximum.reduceat(rows, starts, axis=0)
+        return means, maxima, sizes
+
+
 class EnterpriseMonitor:
     def __init__(self, config: Dict):
         """Initialize monitoring system"""
@@ -25,6 +79,23 @@ class EnterpriseMonitor:
         self.log_path = config.get('LOG_PATH', 'logs')
         self.metrics_port = config.get('METRICS_PORT', 9090)
         self.alert_threshold = config.get('ALERT_THRESHOLD', 90)
+        # Seconds between samples, samples per stored point, seconds between Redis flushes
+        self.sample_interval = float(config.get('SAMPLE_INTERVAL', 1.0))
+        self.sample_bucket = max(1, int(config.get('SAMPLE_BUCKET', 10)))
+        self.flush_interval = float(config.get('SAMPLE_FLUSH_INTERVAL', 60))
+        # Downsampled points kept in Redis
+        self.metrics_retention = int(config.get('METRICS_RETENTION', 8640))
+        # Ring buffer holds at least two flushes worth of samples
+        self.sampler = SystemSampler(
+            capacity=max(int(config.get('SAMPLE_BUFFER', 3600)), int(2 * self.flush_interval / self.sample_interval))
+        )
+        self._flushed = 0
+        self._stop = threading.Event()
+        # Last system reading, shared with the pool autoscaler
+        self.latest_readings = None
+        # Sampling profiles are written to LOG_PATH/profiles
+        self.profiling = profiling_settings(config)
+        self.profile_dir = self.profiling['profile_dir']
         
         # Setup logging
         self.setup_logging()
@@ -35,6 +106,9 @@ class EnterpriseMonitor:
         # Start monitoring thread
         self.start_monitoring()
 
+        if self.profiling['enabled']:
+            install_signal_trigger(self.profile_dir, seconds=self.profiling['window'])
+
     def setup_logging(self):
         """Configure logging handlers"""
         # Application logger
@@ -74,31 +148,42 @@ class EnterpriseMonitor:
     def start_monitoring(self):
         """Start system monitoring thread"""
         def monitor_system():
-            while True:
+            next_tick = time.monotonic()
+            next_flush = next_tick + self.flush_interval
+            while not self._stop.is_set():
                 try:
-                    # Update system metrics
-                    cpu_usage.set(psutil.cpu_percent())
-                    memory = psutil.virtual_memory()
-                    memory_usage.set(memory.used)
-                    disk = psutil.disk_usage('/')
-                    disk_usage.set(disk.percent)
-                    
-                    # Check thresholds and alert if necessary
-                    self._check_alerts({
-                        'cpu': psutil.cpu_percent(),
-                        'memory': memory.percent,
-                        'disk': disk.percent
-                    })
-                    
-                    # Store metrics in Redis
-                    self._store_metrics()
-                    
+                    sample = self.sampler.sample()
+                    cpu_usage.set(sample['cpu'])
+                    memory_usage.set(sample['memory_used'])
+                    disk_usage.set(sample['disk'])
+                    self.latest_readings = {
+                        'cpu': sample['cpu'],
+                        'memory': sample['memory'],
+                        'disk': sample['disk'],
+                        'timestamp': datetime.utcnow().isoformat(),
+                    }
+
+                    if time.monotonic() >= next_flush:
+                        next_flush += self.flush_interval
+                        latest = self._store_metrics()
+                        # Alert on the latest bucket's averages, not single spikes
+                        if latest is not None:
+                            self._check_alerts(latest)
+
                 except Exception as e:
                     self.error_logger.error(f"Monitoring error: {str(e)}")
-                
-                time.sleep(60)  # Update every minute
-        
-        threading.Thread(target=monitor_system, daemon=True).start()
+
+                # Fixed-rate ticks; skip ticks missed while we were busy
+                next_tick += self.sample_interval
+                now = time.monotonic()
+                if next_tick < now:
+                    next_tick = now
+                self._stop.wait(next_tick - now)
+
+        threading.Thread(target=monitor_system, name='system-sampler', daemon=True).start()
+
+    def stop_monitoring(self):
+        self._stop.set()
 
     def _check_alerts(self, metrics: Dict):
         """Check metrics against thresholds"""
@@ -109,19 +194,37 @@ class EnterpriseMonitor:
                 )
                 self._send_alert(metric, value)
 
-    def _store_metrics(self):
-        """Store current metrics in Redis"""
-        current_metrics = {
-            'timestamp': datetime.utcnow().isoformat(),
-            'cpu_usage': psutil.cpu_percent(),
-            'memory_usage': psutil.virtual_memory().percent,
-            'disk_usage': psutil.disk_usage('/').percent,
-            'active_threads': threading.active_count()
-        }
-        
-        self.redis.lpush('system_metrics', json.dumps(current_metrics))
-        # Keep only last 24 hours of metrics
-        self.redis.ltrim('system_metrics', 0, 1440)
+    def _store_metrics(self) -> Optional[Dict[str, float]]:
+        """
+        Push samples taken since the last flush to Redis as downsampled
+        points, in one pipeline
+        Returns:
+            the newest point's averages for alerting, None if nothing was sampled
+        """
+        rows, count = self.sampler.since(self._flushed)
+        if not len(rows):
+            return None
+        means, maxima, sizes = SystemSampler.downsample(rows, self.sample_bucket)
+        points = [
+            orjson.dumps({
+                'timestamp': datetime.utcfromtimestamp(peak[0]).isoformat(),
+                'cpu_usage': round(mean[1], 2),
+                'cpu_max': round(peak[1], 2),
+                'memory_usage': round(mean[2], 2),
+                'memory_max': round(peak[2], 2),
+                'disk_usage': round(mean[4], 2),
+                'active_threads': int(peak[5]),
+                'samples': int(size),
+            })
+            for mean, peak, size in zip(means, maxima, sizes)
+        ]
+        # Newest first, as readers of system_metrics expect
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.lpush('system_metrics', *points)
+            pipe.ltrim('system_metrics', 0, self.metrics_retention - 1)
+            pipe.execute()
+        self._flushed = count
+        return {'cpu': means[-1][1], 'memory': means[-1][2], 'disk': means[-1][4]}
 
     def log_request(self, endpoint: str, method: str, duration: float):
         """Log API request"""
@@ -132,6 +235,12 @@ class EnterpriseMonitor:
             f"Request: {method} {endpoint} - Duration: {duration:.2f}s"
         )
 
+    def profile_for(self, seconds: Optional[float] = None) -> Optional[str]:
+        """Profile every thread for a window; returns the flamegraph file path"""
+        return profile_window(
+            seconds or self.profiling['window'], self.profile_dir, interval=self.profiling['interval']
+        )
+
     def log_error(self, error_type: str, error_message: str):
         """Log error with details"""
         error_count.labels(type=error_type).inc()
@@ -139,6 +248,15 @@ class EnterpriseMonitor:
 
     def get_system_health(self) -> Dict:
         """Get current system health metrics"""
+        readings = self.latest_readings
+        if readings:
+            return {
+                'cpu_usage': readings['cpu'],
+                'memory_usage': readings['memory'],
+                'disk_usage': readings['disk'],
+                'active_threads': threading.active_count(),
+                'timestamp': readings['timestamp']
+            }
         return {
             'cpu_usage': psutil.cpu_percent(),
             'memory_usage': psutil.virtual_memory().percent,
@@ -7,18 +7,47 @@ import pymupdf
 from streamlit import session_state as ss
 from concurrent.futures import ThreadPoolExecutor
 import logging
+from llama_index.core.schema import Document
+from src.tracing import traced
+
+def parse_pdf_pages(path: str, start: int, end: int) -> List[Document]:
+    """
+    Parse pages [start, end) of a pdf to one markdown Document per page,
+    with the metadata LlamaMarkdownReader sets (page is 1-based)
+    Args:
+        path: path to pdf file
+        start: first page, 0-based
+        end: page after the last one
+    """
+    pages = list(range(start, end))
+    chunks = pymupdf4llm.to_markdown(path, pages=pages, page_chunks=True)
+    docs = []
+    for page, chunk in zip(pages, chunks):
+        metadata = {
+            k: v for k, v in chunk["metadata"].items()
+            if k not in ("page", "page_number", "page_count")
+        }
+        metadata["page"] = page + 1
+        metadata["total_pages"] = chunk["metadata"].get("page_count")
+        metadata["file_path"] = str(path)
+        docs.append(Document(text=chunk["text"], metadata=metadata))
+    return docs
 
 def process_pdf_chunk(chunk_data):
     """
     Process a chunk of PDF data
+    Args:
+        chunk_data: (path, start page, end page)
+    Returns:
+        Documents, or None if parsing failed
     """
     try:
-        md_read = pymupdf4llm.LlamaMarkdownReader()
-        return md_read.load_data(chunk_data)
+        return parse_pdf_pages(*chunk_data)
     except Exception as e:
         logging.error(f"Error processing PDF chunk: {str(e)}")
         return None
 
+@traced("parse_pdf")
 def docs_from_pymupdf4llm(path: str, chunk_size: int = 10):
     """
     Process PDF in chunks using parallel processing
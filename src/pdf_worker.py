@@ -0,0 +1,420 @@
+"""
+Standalone PDF ingestion worker.
+
+Run one or more on any host that can reach Redis and the spool/index
+directories:
+
+    python -m src.pdf_worker --processes 4
+
+With SHARDING=1 each process joins the shard ring as its own node
+(SHARD_NODE_ID, suffixed per process), claims only the PDFs it owns and
+keeps them in its own index under saves/<INDEX_NAME>/<node id>.
+
+Each process keeps several jobs in flight: leased jobs are parsed,
+embedded and merged into the index by separate worker pools, sized
+within AUTOSCALE_BOUNDS from queue depth, stage latency and CPU/memory
+load.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from pathlib import Path
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from dotenv import dotenv_values
+from redis import Redis
+from src.autoscaler import PipelineAutoscaler, parse_autoscale_bounds
+from src.checkpoint import CheckpointedIngestion, make_checkpoint_store
+from src.dedup import ChunkDeduplicator
+from src.distributed_processor import (
+    DistributedPDFProcessor,
+    PipelineStage,
+    StagedPipeline,
+    pdf_job_seconds,
+)
+from src.ingestion import chunk_documents, embed_nodes, mark_duplicates, upsert_nodes
+from src.pdf_utils import count_pdf_pages
+from src.profiler import install_signal_trigger, profiling_settings
+from src.rate_limit import make_rate_limiter
+from src.sharding import ClusterMembership
+from src.tracing import instrument_llama_index
+from src.work_nvidia import get_embeddings
+
+ROOT_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent
+# Worker pool bounds per pipeline stage; AUTOSCALE_BOUNDS= runs one job at a time
+DEFAULT_AUTOSCALE_BOUNDS = "parse=1-4;embed=1-8"
+
+
+def load_worker_config() -> Dict:
+    """Same keys/.env the Streamlit app reads, overridable from the environment"""
+    config = dotenv_values(os.path.join(ROOT_DIR, "keys", ".env"))
+    for key in list(config):
+        if key in os.environ:
+            config[key] = os.environ[key]
+    return config
+
+
+class IndexJobHandler:
+    """
+    Default job handler: parse, chunk and embed the PDF, then merge the
+    nodes into the index under saves/<INDEX_NAME>. Only the merge holds the
+    Redis lock, so workers embed in parallel without overwriting each
+    other's writes. Work is checkpointed per page range, so a retried job
+    resumes after the last shard that was embedded or merged; a job for
+    one page range of a long PDF processes only that range. A sharded
+    node (node_id set) keeps its own index directory. With a processor,
+    page progress is reported to the job's batch after every shard.
+
+    Called with a job it runs the job start to finish. A worker running
+    jobs through a pipeline calls parse, embed and upsert instead, so
+    parsing, embedding and index writes of different jobs overlap.
+    """
+
+    def __init__(
+        self,
+        config: Dict,
+        node_id: Optional[str] = None,
+        processor: Optional[DistributedPDFProcessor] = None,
+    ):
+        index_dir = os.path.join(ROOT_DIR, "saves", config.get("INDEX_NAME", "default"))
+        if node_id:
+            index_dir = os.path.join(index_dir, node_id)
+        self.index_dir = index_dir
+        self.processor = processor
+        self.redis = Redis.from_url(config.get("REDIS_URL", "redis://localhost:6379"))
+        # Same provider quota as the API; document embeddings are bulk traffic
+        self.embed_model = get_embeddings(
+            model=config.get("NVIDIA_EMBEDDINGS"),
+            provider=config.get("EMBEDDINGS_PROVIDER", "nvidia"),
+            rate_limiter=make_rate_limiter(config, self.redis),
+        )
+        self.deduplicator = ChunkDeduplicator(
+            os.path.join(index_dir, "minhash_index.npz"),
+            threshold=float(config.get("DEDUP_THRESHOLD", 0.9)),
+        )
+        self.ingestion = CheckpointedIngestion(
+            make_checkpoint_store(config, ROOT_DIR, self.redis),
+            shard_pages=int(config.get("CHECKPOINT_SHARD_PAGES", 10)),
+        )
+
+    def _index_lock(self):
+        return self.redis.lock(f"index_lock:{self.index_dir}", timeout=600)
+
+    @staticmethod
+    def _pages(job: Dict) -> Optional[Tuple[int, int]]:
+        # Long PDFs are queued as several page-range jobs
+        return (int(job["start"]), int(job["end"])) if "start" in job else None
+
+    def _process_shard(self, job: Dict, docs) -> Tuple[List, Dict]:
+        for doc in docs:
+            doc.metadata["filename"] = job["filename"]
+        nodes = chunk_documents(docs)
+        # Near-duplicates of stored chunks are not embedded again; they
+        # are stored as references sharing the original's embedding
+        unique_nodes, duplicates = self.deduplicator.split(nodes)
+        embed_nodes(unique_nodes, self.embed_model)
+        references = mark_duplicates(nodes, duplicates)
+        return unique_nodes + references, {"chunks": len(nodes), "duplicate_chunks": len(duplicates)}
+
+    def _upsert_shard(self, nodes: List):
+        with self._index_lock():
+            upsert_nodes(nodes, self.index_dir, self.embed_model)
+        # Matched by later shards now, written to disk once per document;
+        # later duplicates point at the original, not at a reference
+        self.deduplicator.commit(
+            [node for node in nodes if "duplicate_of" not in node.metadata], persist=False
+        )
+
+    def _ingest(self, job: Dict, upsert: bool = True, parse: Optional[Callable] = None) -> Dict:
+        def progress(pages_done, total_pages):
+            try:
+                self.processor.report_progress(job, pages_done, total_pages)
+            except Exception as e:
+                logging.warning(f"Progress update for job {job['job_id']} failed: {str(e)}")
+
+        if not upsert:
+            # Shards stop at 'processed'; upsert() merges them from the checkpoint
+            return self.ingestion.run(
+                job["path"], lambda docs: self._process_shard(job, docs),
+                clear_on_success=False, pages=self._pages(job), parse=parse,
+            )
+        try:
+            return self.ingestion.run(
+                job["path"], lambda docs: self._process_shard(job, docs), self._upsert_shard,
+                progress=progress if self.processor is not None else None,
+                pages=self._pages(job), parse=parse,
+            )
+        finally:
+            # Shards upserted before a failure are registered too
+            with self._index_lock():
+                self.deduplicator.persist()
+
+    @staticmethod
+    def _summary(result: Dict, resumed: int) -> Dict:
+        chunks = sum(s["chunks"] for s in result["shards"])
+        duplicates = sum(s["duplicate_chunks"] for s in result["shards"])
+        return {
+            "pages": result["pages"],
+            "nodes": chunks,
+            "duplicate_chunks": duplicates,
+            "dedup_ratio": round(duplicates / chunks, 3) if chunks else 0.0,
+            "resumed_shards": resumed,
+        }
+
+    def __call__(self, job: Dict) -> Dict:
+        # Chunks other workers stored since the last job, loaded once per job
+        self.deduplicator.reload()
+        result = self._ingest(job)
+        return self._summary(result, result["resumed"])
+
+    def parse(self, job: Dict) -> Dict[Tuple[int, int], List]:
+        """{(start, end): pages} of a job that fits one checkpoint shard, else {}"""
+        start, end = self._pages(job) or (0, count_pdf_pages(job["path"]))
+        if end - start > self.ingestion.shard_pages:
+            return {}
+        docs = self.ingestion.parse(job["path"], start, end)
+        if docs is None:
+            raise RuntimeError(f"Parsing pages {start}-{end} of {job['path']} failed")
+        return {(start, end): docs}
+
+    def embed(self, job: Dict, parsed: Optional[Dict[Tuple[int, int], List]] = None) -> Dict:
+        """Chunk and embed the job's shards into checkpoints, using pages from parse()"""
+        parsed = dict(parsed or {})
+
+        def parse(path, start, end):
+            docs = parsed.pop((start, end), None)
+            return docs if docs is not None else self.ingestion.parse(path, start, end)
+
+        self.deduplicator.reload()
+        try:
+            return self._ingest(job, upsert=False, parse=parse)
+        finally:
+            # Pages of a shard resumed from its checkpoint were not used
+            for docs in parsed.values():
+                if hasattr(docs, "close"):
+                    docs.close()
+
+    def upsert(self, job: Dict, embedded: Optional[Dict] = None) -> Dict:
+        """Merge the shards embed() checkpointed into the index; the job's result"""
+        result = self._ingest(job)
+        return self._summary(result, embedded["resumed"] if embedded else result["resumed"])
+
+
+def make_index_handler(
+    config: Dict,
+    node_id: Optional[str] = None,
+    processor: Optional[DistributedPDFProcessor] = None,
+) -> IndexJobHandler:
+    """IndexJobHandler for a worker process; see its docstring"""
+    return IndexJobHandler(config, node_id, processor)
+
+
+class PDFWorker:
+    """
+    Lease jobs from DistributedPDFProcessor and run them through a handler.
+
+    With autoscale bounds and an IndexJobHandler, run() feeds leased jobs
+    through a StagedPipeline: parse workers, embed workers and one upsert
+    worker, so several jobs are in flight and each stage's pool is grown
+    and shrunk by a PipelineAutoscaler within its bounds. Otherwise jobs
+    run one at a time.
+    """
+
+    def __init__(
+        self,
+        processor: DistributedPDFProcessor,
+        handler: Callable[[Dict], Dict],
+        poll_interval: float = 1.0,
+        bounds: Optional[Dict[str, Tuple[int, int]]] = None,
+        autoscale_interval: float = 5.0,
+    ):
+        """
+        Args:
+            bounds: {'parse': (min, max), 'embed': (min, max)} workers
+            autoscale_interval: seconds between autoscaling decisions
+        """
+        self.processor = processor
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.bounds = bounds or {}
+        self.autoscale_interval = autoscale_interval
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def _heartbeat(self, job: Dict, done: threading.Event):
+        """Renew the lease while a long PDF is being processed"""
+        interval = max(1, self.processor.visibility_timeout // 3)
+        while not done.wait(interval):
+            if not self.processor.extend_lease(job):
+                logging.warning(f"Lost lease on job {job['job_id']}")
+                return
+
+    def _claim(self) -> Optional[Dict]:
+        """Lease the next job and keep renewing the lease until _finish()"""
+        self.processor.requeue_expired()
+        self.processor.rebalance()
+        job = self.processor.claim_job()
+        if job is None:
+            return None
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job, done), daemon=True).start()
+        return {"job": job, "done": done, "start": time.perf_counter()}
+
+    def _finish(self, claim: Dict, result: Optional[Dict] = None, error: Optional[Exception] = None):
+        """Report a claimed job's outcome and stop renewing its lease"""
+        job = claim["job"]
+        try:
+            if error is None:
+                try:
+                    outcome = self.processor.complete_job(job)
+                    logging.info(f"Job {job['job_id']} ({job['filename']}) {outcome}: {result}")
+                    return
+                except Exception as e:
+                    error = e
+            outcome = self.processor.fail_job(job, str(error))
+            logging.error(f"Job {job['job_id']} ({job['filename']}) {outcome}: {str(error)}")
+        finally:
+            claim["done"].set()
+            pdf_job_seconds.observe(time.perf_counter() - claim["start"])
+
+    def run_once(self) -> bool:
+        """Process a single job; False if the queue was empty"""
+        claim = self._claim()
+        if claim is None:
+            return False
+        try:
+            result = self.handler(claim["job"])
+        except Exception as e:
+            self._finish(claim, error=e)
+        else:
+            self._finish(claim, result)
+        return True
+
+    def _claims(self):
+        """Leased jobs until stop(); not called again while the parse queue is full"""
+        while not self._stop.is_set():
+            claim = self._claim()
+            if claim is None:
+                self._stop.wait(self.poll_interval)
+            else:
+                yield claim
+
+    def build_pipeline(self) -> StagedPipeline:
+        """parse -> embed -> upsert over claims; a failed step fails its job"""
+        def step(fn):
+            def run(claim):
+                try:
+                    return fn(claim)
+                except Exception as e:
+                    self._finish(claim, error=e)
+                    return None
+            return run
+
+        def parse(claim):
+            claim["parsed"] = self.handler.parse(claim["job"])
+            return claim
+
+        def embed(claim):
+            claim["embedded"] = self.handler.embed(claim["job"], claim.pop("parsed"))
+            return claim
+
+        def upsert(claim):
+            self._finish(claim, self.handler.upsert(claim["job"], claim.pop("embedded")))
+
+        parse_workers = self.bounds.get("parse", (1, 1))
+        embed_workers = self.bounds.get("embed", (1, 1))
+        # A queue holds at most one claimed job per worker the next stage may have
+        return StagedPipeline([
+            PipelineStage("parse", step(parse), parse_workers[0], parse_workers[1]),
+            PipelineStage("embed", step(embed), embed_workers[0], embed_workers[1]),
+            PipelineStage("upsert", step(upsert), 1, embed_workers[1]),
+        ])
+
+    def run(self):
+        """Process jobs until stop() is called or SIGTERM/SIGINT arrives"""
+        logging.info(f"PDF worker {os.getpid()} started")
+        if self.bounds and isinstance(self.handler, IndexJobHandler):
+            pipeline = self.build_pipeline()
+            autoscaler = PipelineAutoscaler(pipeline, self.bounds, interval=self.autoscale_interval)
+            autoscaler.start()
+            try:
+                # Jobs already leased are finished before run() returns
+                pipeline.run(self._claims())
+            finally:
+                autoscaler.stop()
+        else:
+            while not self._stop.is_set():
+                if not self.run_once():
+                    self._stop.wait(self.poll_interval)
+        logging.info(f"PDF worker {os.getpid()} stopped")
+
+
+def _run_worker(config: Dict, process_index: int = 0):
+    instrument_llama_index()
+    profiling = profiling_settings(config)
+    if profiling["enabled"]:
+        # kill -USR2 <worker pid> profiles it for PROFILE_WINDOW seconds
+        install_signal_trigger(profiling["profile_dir"], seconds=profiling["window"])
+    membership = None
+    node_id = None
+    if str(config.get("SHARDING", "0")).lower() in ("1", "true"):
+        base_id = config.get("SHARD_NODE_ID") or socket.gethostname()
+        node_id = f"{base_id}-{process_index}"
+        membership = ClusterMembership(
+            Redis.from_url(config.get("REDIS_URL", "redis://localhost:6379")),
+            node_id=node_id,
+            address=config.get("SHARD_ADDRESS", ""),
+            ttl=int(config.get("SHARD_TTL", 30)),
+        )
+        membership.join()
+
+    processor = DistributedPDFProcessor(config, membership=membership)
+    worker = PDFWorker(
+        processor,
+        make_index_handler(config, node_id, processor),
+        bounds=parse_autoscale_bounds(config.get("AUTOSCALE_BOUNDS", DEFAULT_AUTOSCALE_BOUNDS)),
+        autoscale_interval=float(config.get("AUTOSCALE_INTERVAL", 5)),
+    )
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    try:
+        worker.run()
+    finally:
+        if membership is not None:
+            # Hand waiting jobs to the remaining nodes right away
+            membership.leave()
+            processor.rebalance(force=True)
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="PDF ingestion worker")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes on this host")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] [%(processName)s] [%(levelname)-8s] %(message)s",
+    )
+    config = load_worker_config()
+    if args.processes == 1:
+        _run_worker(config)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(config, i), name=f"pdf-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
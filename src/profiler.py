@@ -0,0 +1,240 @@
+"""
+Opt-in sampling profiler with flamegraph output.
+
+    with profile('slow-query', profile_dir) as p:
+        engine.chat(question)
+    p.path   # <profile_dir>/slow-query-<timestamp>.folded
+
+Stacks are sampled every `interval` seconds and aggregated as collapsed
+stacks, one "frame;frame;frame count" line per distinct stack, which
+flamegraph.pl, speedscope and inferno read directly. Nothing is sampled
+unless a profile is started, so the cost when idle is zero.
+
+Two samplers:
+- ThreadStackSampler, the default: a timer thread reads
+  sys._current_frames() for the chosen threads. Wall-clock, so time
+  blocked on the network or a lock shows up too.
+- SignalStackSampler: SIGPROF from setitimer(ITIMER_PROF) interrupts the
+  main thread on CPU time. Unix only, main thread only, CPU time only.
+
+profile_window() profiles every thread of a running process for a time
+window, and install_signal_trigger() starts one on SIGUSR2
+(kill -USR2 <pid>).
+"""
+from typing import Dict, Iterable, Optional
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+import os
+import re
+import signal
+import sys
+import threading
+from prometheus_client import Counter
+
+# Profiler metrics
+profiles_written = Counter(
+    'profiler_profiles_total', 'Sampling profiles written',
+    ['trigger']  # request | window
+)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # ';' separates frames; readers split the count off at the last space
+    name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+    return name.replace(';', ':')
+
+
+class _StackAggregator:
+    def __init__(self, interval: float = 0.01, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: StackCounter = StackCounter()
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def _record(self, frame, prefix: Optional[str] = None):
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        if prefix:
+            labels.append(prefix)
+        key = ';'.join(reversed(labels))
+        with self._lock:
+            self.stacks[key] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            items = sorted(self.stacks.items())
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+
+
+class ThreadStackSampler(_StackAggregator):
+    """Wall-clock sampler of the given threads (every thread when None)"""
+
+    def __init__(self, interval: float = 0.01, thread_ids: Optional[Iterable[int]] = None, max_depth: int = 128):
+        super().__init__(interval, max_depth)
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            # Thread name as the root frame keeps threads apart in the flamegraph
+            prefix = names.get(thread_id, str(thread_id)) if self.thread_ids is None else None
+            self._record(frame, prefix)
+
+    def start(self):
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                self._sample()
+
+        self._thread = threading.Thread(target=loop, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class SignalStackSampler(_StackAggregator):
+    """CPU-time sampler of the main thread driven by SIGPROF"""
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 128):
+        super().__init__(interval, max_depth)
+        self._previous_handler = None
+
+    def _handle(self, signum, frame):
+        self._record(frame)
+
+    def start(self):
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("SignalStackSampler must be started from the main thread")
+        self._previous_handler = signal.signal(signal.SIGPROF, self._handle)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+
+def profile_path(profile_dir: str, name: str) -> str:
+    safe = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'profile'
+    return os.path.join(profile_dir, f"{safe}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.folded")
+
+
+@contextmanager
+def profile(
+    name: str,
+    profile_dir: str,
+    interval: float = 0.01,
+    thread_ids: Optional[Iterable[int]] = None,
+    use_signal: bool = False,
+    trigger: str = 'request',
+):
+    """
+    Sample stacks while the block runs and write them to
+    <profile_dir>/<name>-<timestamp>.folded; the path is set on the
+    yielded sampler as .path once the block exits
+    Args:
+        thread_ids: threads to sample, the calling thread by default
+        use_signal: SIGPROF CPU-time sampling of the main thread instead
+    """
+    if use_signal:
+        sampler = SignalStackSampler(interval)
+    else:
+        sampler = ThreadStackSampler(
+            interval, thread_ids if thread_ids is not None else [threading.get_ident()]
+        )
+    sampler.path = None
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        sampler.path = profile_path(profile_dir, name)
+        try:
+            sampler.write(sampler.path)
+            profiles_written.labels(trigger=trigger).inc()
+            logging.info(f"Profile {name}: {sampler.samples} samples written to {sampler.path}")
+        except OSError as e:
+            logging.error(f"Writing profile {sampler.path} failed: {str(e)}")
+
+
+_window_lock = threading.Lock()
+
+
+def profile_window(
+    seconds: float,
+    profile_dir: str,
+    name: str = 'window',
+    interval: float = 0.01,
+) -> Optional[str]:
+    """
+    Profile every thread of this process for `seconds` in the background
+    Returns:
+        the output path, or None when a window profile is already running
+    """
+    if not _window_lock.acquire(blocking=False):
+        return None
+    path = profile_path(profile_dir, name)
+    sampler = ThreadStackSampler(interval)
+
+    def run():
+        try:
+            sampler.start()
+            threading.Event().wait(seconds)
+            sampler.stop()
+            sampler.write(path)
+            profiles_written.labels(trigger='window').inc()
+            logging.info(f"Profile window: {sampler.samples} samples over {seconds}s written to {path}")
+        except Exception as e:
+            logging.error(f"Profile window failed: {str(e)}")
+        finally:
+            _window_lock.release()
+
+    threading.Thread(target=run, name='profile-window', daemon=True).start()
+    return path
+
+
+def install_signal_trigger(profile_dir: str, seconds: float = 30, signum: int = getattr(signal, 'SIGUSR2', 0)) -> bool:
+    """
+    Start a profile_window on `signum` (SIGUSR2). Only possible from the
+    main thread on platforms with SIGUSR2.
+    Returns:
+        whether the handler was installed
+    """
+    if not signum:
+        return False
+    try:
+        signal.signal(signum, lambda *_: profile_window(seconds, profile_dir, name='signal'))
+    except ValueError:
+        # Not the main thread, e.g. inside a Streamlit script run
+        return False
+    return True
+
+
+def profiling_settings(config: Dict) -> Dict:
+    """PROFILING switch, output directory under LOG_PATH, interval and window length"""
+    return {
+        'enabled': str(config.get('PROFILING', '0')).lower() in ('1', 'true'),
+        'profile_dir': os.path.join(config.get('LOG_PATH') or 'logs', 'profiles'),
+        'interval': float(config.get('PROFILE_INTERVAL', 0.01)),
+        'window': float(config.get('PROFILE_WINDOW', 30)),
+    }
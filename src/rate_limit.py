@@ -0,0 +1,387 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import random
+import time
+from redis import Redis
+from prometheus_client import Counter, Histogram
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import (
+    LLM,
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+
+# Rate limiting metrics
+rate_limit_wait = Histogram(
+    'rate_limit_wait_seconds', 'Time spent waiting for provider quota', ['provider', 'priority']
+)
+rate_limit_throttled = Counter(
+    'rate_limit_throttled_total', 'Calls that had to wait for provider quota', ['provider', 'priority']
+)
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+# Refill every bucket to "now" (Redis server clock, so hosts can disagree),
+# then take the requested amount from all of them or from none.
+# KEYS: bucket keys. ARGV: capacity, refill/s, amount per bucket, then
+# reserve fraction and force flag. Returns seconds to wait, "0" when granted.
+_TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local reserve = tonumber(ARGV[#KEYS * 3 + 1])
+local force = ARGV[#KEYS * 3 + 2] == '1'
+local levels = {}
+local wait = 0
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local amount = tonumber(ARGV[i * 3])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local level = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    levels[i] = level
+    local required = math.min(amount + capacity * reserve, capacity)
+    if not force and level < required then
+        wait = math.max(wait, (required - level) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    redis.call('HSET', KEYS[i], 'tokens', levels[i] - tonumber(ARGV[i * 3]), 'ts', now)
+    redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 60)
+end
+return '0'
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for quota accounting"""
+    return max(1, len(text) // 4)
+
+
+class TokenBucketRateLimiter:
+    """
+    Requests/min and tokens/min token buckets per provider and model, shared
+    by every thread and process through Redis.
+
+    Callers block until quota is available instead of failing. Bulk callers
+    (ingestion embeddings) must leave bulk_reserve of each bucket untouched,
+    so interactive chat still gets through while a large batch is running.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        limits: Dict[str, Tuple[Optional[int], Optional[int]]],
+        bulk_reserve: float = 0.2,
+        key_prefix: str = 'ratelimit',
+    ):
+        """
+        Args:
+            redis: Redis client shared by all limiter instances
+            limits: "provider:model" or "provider" -> (requests/min, tokens/min);
+                None disables that bucket
+            bulk_reserve: fraction of each bucket bulk callers may not use
+            key_prefix: Redis key prefix for the buckets
+        """
+        self.redis = redis
+        self.limits = limits
+        self.bulk_reserve = bulk_reserve
+        self.key_prefix = key_prefix
+        self._script = redis.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def _buckets(self, provider: str, model: str, tokens: int) -> List[Tuple[str, float, float, int]]:
+        # A provider-wide limit is one bucket shared by all of its models
+        name = f"{provider}:{model}"
+        if name not in self.limits:
+            name = provider
+        rpm, tpm = self.limits.get(name) or (None, None)
+        buckets = []
+        if rpm:
+            buckets.append((f"{self.key_prefix}:{name}:rpm", rpm, rpm / 60.0, 1))
+        if tpm:
+            buckets.append((f"{self.key_prefix}:{name}:tpm", tpm, tpm / 60.0, tokens))
+        return buckets
+
+    def _try_acquire(self, buckets, priority: str, force: bool = False) -> float:
+        args = []
+        for _, capacity, rate, amount in buckets:
+            args.extend([capacity, rate, amount])
+        reserve = self.bulk_reserve if priority == BULK else 0.0
+        args.extend([reserve, '1' if force else '0'])
+        return float(self._script(keys=[b[0] for b in buckets], args=args))
+
+    def acquire(self, provider: str, model: str, tokens: int = 1, priority: str = INTERACTIVE):
+        """Block until one request and `tokens` tokens of quota are granted"""
+        buckets = self._buckets(provider, model, tokens)
+        if not buckets:
+            return
+        start = time.monotonic()
+        wait = self._try_acquire(buckets, priority)
+        if wait > 0:
+            rate_limit_throttled.labels(provider=provider, priority=priority).inc()
+        while wait > 0:
+            # Jitter keeps waiting workers from retrying in lockstep
+            time.sleep(wait * random.uniform(1.0, 1.2))
+            wait = self._try_acquire(buckets, priority)
+        rate_limit_wait.labels(provider=provider, priority=priority).observe(time.monotonic() - start)
+
+    async def aacquire(self, provider: str, model: str, tokens: int = 1, priority: str = INTERACTIVE):
+        """Async version of acquire that waits without blocking the event loop"""
+        buckets = self._buckets(provider, model, tokens)
+        if not buckets:
+            return
+        start = time.monotonic()
+        wait = await asyncio.to_thread(self._try_acquire, buckets, priority)
+        if wait > 0:
+            rate_limit_throttled.labels(provider=provider, priority=priority).inc()
+        while wait > 0:
+            await asyncio.sleep(wait * random.uniform(1.0, 1.2))
+            wait = await asyncio.to_thread(self._try_acquire, buckets, priority)
+        rate_limit_wait.labels(provider=provider, priority=priority).observe(time.monotonic() - start)
+
+    def debit(self, provider: str, model: str, tokens: int):
+        """Charge tokens only known after the call (e.g. completion tokens)"""
+        buckets = [b for b in self._buckets(provider, model, tokens) if b[0].endswith(':tpm')]
+        if buckets and tokens > 0:
+            self._try_acquire(buckets, INTERACTIVE, force=True)
+
+
+async def aget_query_embeddings(embed_model: BaseEmbedding, queries: List[str]) -> List[List[float]]:
+    """
+    Query embeddings for many questions, one request per embed_batch_size
+    questions when the model has a batched query path (_aget_query_embeddings),
+    else one request per question
+    """
+    if not hasattr(embed_model, '_aget_query_embeddings'):
+        return list(await asyncio.gather(*(embed_model.aget_query_embedding(q) for q in queries)))
+    size = embed_model.embed_batch_size
+    batches = await asyncio.gather(*(
+        embed_model._aget_query_embeddings(queries[i:i + size]) for i in range(0, len(queries), size)
+    ))
+    return [embedding for batch in batches for embedding in batch]
+
+
+class RateLimitedEmbedding(BaseEmbedding):
+    """
+    Embedding model wrapper that takes quota before every call. Document
+    embeddings are bulk traffic, query embeddings are interactive.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _limiter: TokenBucketRateLimiter = PrivateAttr()
+    _provider: str = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, limiter: TokenBucketRateLimiter, provider: str, **kwargs):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._limiter = limiter
+        self._provider = provider
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RateLimitedEmbedding"
+
+    def _acquire(self, texts: List[str], priority: str):
+        tokens = sum(estimate_tokens(t) for t in texts)
+        self._limiter.acquire(self._provider, self.model_name, tokens, priority)
+
+    async def _aacquire(self, texts: List[str], priority: str):
+        tokens = sum(estimate_tokens(t) for t in texts)
+        await self._limiter.aacquire(self._provider, self.model_name, tokens, priority)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self._acquire([query], INTERACTIVE)
+        return self._embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        await self._aacquire([query], INTERACTIVE)
+        return await self._embed_model._aget_query_embedding(query)
+
+    async def _aget_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        await self._aacquire(queries, INTERACTIVE)
+        return await aget_query_embeddings(self._embed_model, queries)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        self._acquire([text], BULK)
+        return self._embed_model._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        await self._aacquire([text], BULK)
+        return await self._embed_model._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._acquire(texts, BULK)
+        return self._embed_model._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        await self._aacquire(texts, BULK)
+        return await self._embed_model._aget_text_embeddings(texts)
+
+
+class RateLimitedLLM(LLM):
+    """LLM wrapper that takes provider quota before every call"""
+
+    _llm: LLM = PrivateAttr()
+    _limiter: TokenBucketRateLimiter = PrivateAttr()
+    _provider: str = PrivateAttr()
+    _priority: str = PrivateAttr()
+
+    def __init__(
+        self,
+        llm: LLM,
+        limiter: TokenBucketRateLimiter,
+        provider: str,
+        priority: str = INTERACTIVE,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._llm = llm
+        self._limiter = limiter
+        self._provider = provider
+        self._priority = priority
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RateLimitedLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._llm.metadata
+
+    def _model(self) -> str:
+        return self._llm.metadata.model_name
+
+    def _prompt_tokens(self, messages: Sequence[ChatMessage] = (), prompt: str = "") -> int:
+        return estimate_tokens(prompt + "".join(m.content or "" for m in messages))
+
+    def _charge_output(self, text: str):
+        self._limiter.debit(self._provider, self._model(), estimate_tokens(text))
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        self._limiter.acquire(self._provider, self._model(), self._prompt_tokens(messages), self._priority)
+        response = self._llm.chat(messages, **kwargs)
+        self._charge_output(response.message.content or "")
+        return response
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._limiter.acquire(self._provider, self._model(), self._prompt_tokens(prompt=prompt), self._priority)
+        response = self._llm.complete(prompt, formatted=formatted, **kwargs)
+        self._charge_output(response.text)
+        return response
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        self._limiter.acquire(self._provider, self._model(), self._prompt_tokens(messages), self._priority)
+
+        def gen() -> ChatResponseGen:
+            response = None
+            for response in self._llm.stream_chat(messages, **kwargs):
+                yield response
+            if response is not None:
+                self._charge_output(response.message.content or "")
+
+        return gen()
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        self._limiter.acquire(self._provider, self._model(), self._prompt_tokens(prompt=prompt), self._priority)
+
+        def gen() -> CompletionResponseGen:
+            response = None
+            for response in self._llm.stream_complete(prompt, formatted=formatted, **kwargs):
+                yield response
+            if response is not None:
+                self._charge_output(response.text)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        await self._limiter.aacquire(self._provider, self._model(), self._prompt_tokens(messages), self._priority)
+        response = await self._llm.achat(messages, **kwargs)
+        await asyncio.to_thread(self._charge_output, response.message.content or "")
+        return response
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await self._limiter.aacquire(self._provider, self._model(), self._prompt_tokens(prompt=prompt), self._priority)
+        response = await self._llm.acomplete(prompt, formatted=formatted, **kwargs)
+        await asyncio.to_thread(self._charge_output, response.text)
+        return response
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        await self._limiter.aacquire(self._provider, self._model(), self._prompt_tokens(messages), self._priority)
+        stream = await self._llm.astream_chat(messages, **kwargs)
+
+        async def gen() -> ChatResponseAsyncGen:
+            response = None
+            async for response in stream:
+                yield response
+            if response is not None:
+                await asyncio.to_thread(self._charge_output, response.message.content or "")
+
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        await self._limiter.aacquire(self._provider, self._model(), self._prompt_tokens(prompt=prompt), self._priority)
+        stream = await self._llm.astream_complete(prompt, formatted=formatted, **kwargs)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            response = None
+            async for response in stream:
+                yield response
+            if response is not None:
+                await asyncio.to_thread(self._charge_output, response.text)
+
+        return gen()
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """
+    Parse RATE_LIMITS, e.g. "openai:gpt-4=500/300000;nvidia=60/" into
+    {"openai:gpt-4": (500, 300000), "nvidia": (60, None)}
+    """
+    limits = {}
+    for entry in filter(None, (e.strip() for e in (spec or "").split(";"))):
+        try:
+            name, values = entry.split("=", 1)
+            rpm, _, tpm = values.partition("/")
+            limits[name.strip()] = (int(rpm) if rpm else None, int(tpm) if tpm else None)
+        except ValueError:
+            logging.error(f"Ignoring malformed rate limit entry: {entry}")
+    return limits
+
+
+def make_rate_limiter(config: Dict, redis: Optional[Redis] = None) -> Optional[TokenBucketRateLimiter]:
+    """RATE_LIMITS shared through REDIS_URL, None when no limits are set"""
+    if not config.get('RATE_LIMITS'):
+        return None
+    return TokenBucketRateLimiter(
+        redis or Redis.from_url(config.get('REDIS_URL', 'redis://localhost:6379')),
+        parse_rate_limits(config.get('RATE_LIMITS')),
+        bulk_reserve=float(config.get('RATE_LIMIT_BULK_RESERVE', 0.2)),
+    )
@@ -0,0 +1,128 @@
+from typing import Any, List, Optional
+import logging
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from src.tracing import traced
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mmr_select(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    top_n: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Maximal marginal relevance selection
+    Args:
+        query_embedding: (d,) query vector
+        candidate_embeddings: (n, d) candidate vectors
+        top_n: number of candidates to select
+        lambda_mult: 1.0 is pure relevance, 0.0 is pure diversity
+    Returns:
+        indices of the selected candidates in selection order
+    """
+    candidates = _normalize(np.asarray(candidate_embeddings, dtype=np.float32))
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    n = candidates.shape[0]
+    k = min(top_n, n)
+    if k == 0:
+        return []
+
+    relevance = candidates @ query
+    # Highest similarity of every candidate to anything already selected,
+    # updated with one matrix-vector product per pick
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected = []
+
+    for step in range(k):
+        if step == 0:
+            scores = relevance.copy()
+        else:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, candidates @ candidates[pick], out=redundancy)
+
+    return selected
+
+
+class MMRReranker(BaseNodePostprocessor):
+    """
+    Diversity reranking of an over-fetched candidate set with maximal
+    marginal relevance on the stored node embeddings
+    """
+
+    top_n: int = Field(default=4, description="Nodes kept after reranking")
+    lambda_mult: float = Field(default=0.5, description="Relevance/diversity trade-off")
+
+    _embed_model: Any = PrivateAttr()
+    _vector_store: Any = PrivateAttr()
+
+    def __init__(self, embed_model, vector_store=None, **kwargs):
+        """
+        Args:
+            embed_model: embedding model used for the query and for nodes
+                whose vectors cannot be read back from the store
+            vector_store: index vector store holding the node embeddings
+        """
+        super().__init__(**kwargs)
+        self._embed_model = embed_model
+        self._vector_store = vector_store
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MMRReranker"
+
+    def _stored_embedding(self, node_id: str) -> Optional[List[float]]:
+        if self._vector_store is None:
+            return None
+        try:
+            return self._vector_store.get(node_id)
+        except Exception:
+            # Not every vector store supports reading vectors back
+            return None
+
+    def _node_embeddings(self, nodes: List[NodeWithScore]) -> np.ndarray:
+        embeddings = [
+            n.node.embedding or self._stored_embedding(n.node.node_id) for n in nodes
+        ]
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if missing:
+            logging.debug(f"MMR re-embedding {len(missing)} nodes without stored vectors")
+            fresh = self._embed_model.get_text_embedding_batch(
+                [nodes[i].node.get_content() for i in missing]
+            )
+            for i, emb in zip(missing, fresh):
+                embeddings[i] = emb
+        return np.asarray(embeddings, dtype=np.float32)
+
+    @traced("mmr_rerank")
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None or len(nodes) <= 1:
+            return nodes[:self.top_n]
+
+        query_embedding = query_bundle.embedding or self._embed_model.get_query_embedding(
+            query_bundle.query_str
+        )
+        selected = mmr_select(
+            np.asarray(query_embedding, dtype=np.float32),
+            self._node_embeddings(nodes),
+            self.top_n,
+            self.lambda_mult,
+        )
+        return [nodes[i] for i in selected]
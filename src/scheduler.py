@@ -0,0 +1,67 @@
+from typing import Dict, Optional
+import logging
+from prometheus_client import Histogram
+from src.rate_limit import BULK, INTERACTIVE
+
+# Scheduler metrics
+queue_wait = Histogram(
+    'scheduler_queue_wait_seconds', 'Time jobs wait before dispatch', ['priority'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+)
+
+DEFAULT_CLASS_WEIGHTS = {INTERACTIVE: 16.0, BULK: 1.0}
+
+
+def parse_tenant_weights(spec: str) -> Dict[str, float]:
+    """
+    Parse TENANT_WEIGHTS, e.g. "acme=4;trial=0.5" into
+    {"acme": 4.0, "trial": 0.5}; unlisted tenants weigh 1
+    """
+    weights = {}
+    for entry in filter(None, (e.strip() for e in (spec or "").split(";"))):
+        try:
+            name, value = entry.split("=", 1)
+            weight = float(value)
+            if weight <= 0:
+                raise ValueError
+            weights[name.strip()] = weight
+        except ValueError:
+            logging.error(f"Ignoring malformed tenant weight entry: {entry}")
+    return weights
+
+
+class FairShareWeights:
+    """
+    Share of queue dispatches per (priority class, tenant) flow.
+
+    Jobs are ordered by weighted fair queuing: a job's virtual finish tag
+    is its flow's previous tag (or the queue's virtual time, if later)
+    plus cost / weight, with cost the page count. A flow's share of pages
+    dispatched is then proportional to class weight x tenant weight, so
+    interactive uploads overtake bulk backfills without starving them and
+    one tenant's large upload cannot hold back everyone else's.
+    """
+
+    def __init__(
+        self,
+        class_weights: Optional[Dict[str, float]] = None,
+        tenant_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.class_weights = class_weights or dict(DEFAULT_CLASS_WEIGHTS)
+        self.tenant_weights = tenant_weights or {}
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'FairShareWeights':
+        """INTERACTIVE_WEIGHT (bulk weighs 1) and TENANT_WEIGHTS"""
+        return cls(
+            class_weights={
+                INTERACTIVE: float(config.get('INTERACTIVE_WEIGHT', DEFAULT_CLASS_WEIGHTS[INTERACTIVE])),
+                BULK: 1.0
+            },
+            tenant_weights=parse_tenant_weights(config.get('TENANT_WEIGHTS', '')),
+        )
+
+    def weight(self, priority: str, tenant: str) -> float:
+        if priority not in self.class_weights:
+            raise ValueError(f"Unknown priority class: {priority}")
+        return self.class_weights[priority] * self.tenant_weights.get(tenant, 1.0)
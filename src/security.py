@@ -1,11 +1,13 @@
 from typing import Dict, Optional, List
 import jwt
 from datetime import datetime, timedelta
+import asyncio
 import hashlib
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
 from redis import Redis
 from cryptography.fernet import Fernet
+from src.write_behind import AsyncWriteBehindBuffer
 
 class EnterpriseSecurityManager:
     def __init__(self, config: Dict):
@@ -25,6 +27,8 @@ class EnterpriseSecurityManager:
         
         # Initialize audit logging
         self.audit_logger = logging.getLogger('audit')
+        self.audit_writer = AsyncWriteBehindBuffer(self.mongo.security.audit_logs)
+        self._pending_audit = set()
         
     async def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
         """
@@ -125,5 +129,17 @@ class EnterpriseSecurityManager:
         }
         self.audit_logger.info(str(log_entry))
         
-        # Store in MongoDB for compliance
-        self.mongo.audit_logs.insert_one(log_entry)
+        # Store in MongoDB for compliance; buffered and written in bulk
+        try:
+            task = asyncio.get_running_loop().create_task(self.audit_writer.put(log_entry))
+        except RuntimeError:
+            logging.error(f"Audit log not persisted, no running event loop: {action}")
+            return
+        self._pending_audit.add(task)
+        task.add_done_callback(self._pending_audit.discard)
+
+    async def close(self):
+        """Flush buffered audit logs"""
+        if self._pending_audit:
+            await asyncio.gather(*self._pending_audit)
+        await self.audit_writer.close()
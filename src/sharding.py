@@ -0,0 +1,209 @@
+"""
+Consistent-hash sharding of documents across worker nodes.
+
+Every node heartbeats into a Redis sorted set. The live members form a
+hash ring with virtual nodes; a document's content hash picks the node
+that ingests it and holds it in its index. When a node joins or leaves
+only the keys between it and its ring neighbours change owner.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+import hashlib
+import logging
+import threading
+from prometheus_client import Counter, Gauge
+from redis import Redis
+
+# Sharding metrics
+ring_members = Gauge('shard_ring_members', 'Live nodes in the shard ring')
+fan_out_errors = Counter('shard_fan_out_errors_total', 'Failed calls to shard nodes during fan-out', ['node'])
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent-hash ring with vnodes points per node"""
+
+    def __init__(self, nodes: Sequence[str] = (), vnodes: int = 128):
+        self.vnodes = vnodes
+        self.nodes = set()
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            pos = bisect.bisect(self._points, point)
+            self._points.insert(pos, point)
+            self._owners.insert(pos, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def owners(self, key: str, replicas: int = 1) -> List[str]:
+        """First `replicas` distinct nodes clockwise from the key"""
+        if not self._points:
+            return []
+        found = []
+        pos = bisect.bisect(self._points, _hash(key))
+        for i in range(len(self._points)):
+            node = self._owners[(pos + i) % len(self._points)]
+            if node not in found:
+                found.append(node)
+                if len(found) == replicas:
+                    break
+        return found
+
+    def owner(self, key: str) -> Optional[str]:
+        owners = self.owners(key)
+        return owners[0] if owners else None
+
+
+class ClusterMembership:
+    """
+    Node liveness in Redis. Nodes call join() and then keep heartbeating;
+    a node that misses heartbeats for ttl seconds drops out of the ring.
+    Producers that only route work create it without a node_id.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        node_id: Optional[str] = None,
+        address: str = '',
+        ttl: int = 30,
+        prefix: str = 'shard_ring',
+        vnodes: int = 128,
+    ):
+        self.redis = redis
+        self.node_id = node_id
+        self.address = address
+        self.ttl = ttl
+        self.vnodes = vnodes
+        self.members_key = f"{prefix}:members"
+        self.addresses_key = f"{prefix}:addresses"
+        self._ring = HashRing(vnodes=vnodes)
+        self._ring_members: Tuple[str, ...] = ()
+        self._stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def _now(self) -> float:
+        # Redis server time, so nodes with skewed clocks agree on liveness
+        seconds, micros = self.redis.time()
+        return seconds + micros / 1e6
+
+    def heartbeat(self):
+        with self.redis.pipeline() as pipe:
+            pipe.zadd(self.members_key, {self.node_id: self._now() + self.ttl})
+            pipe.hset(self.addresses_key, self.node_id, self.address)
+            pipe.execute()
+
+    def join(self):
+        """Register this node and heartbeat every ttl/3 seconds in the background"""
+        if self.node_id is None:
+            raise ValueError("Only nodes with a node_id can join the ring")
+        self.heartbeat()
+        self._stop.clear()
+
+        def beat():
+            while not self._stop.wait(max(1, self.ttl // 3)):
+                try:
+                    self.heartbeat()
+                except Exception as e:
+                    logging.error(f"Shard heartbeat failed: {str(e)}")
+
+        self._heartbeat_thread = threading.Thread(target=beat, name='shard-heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+        logging.info(f"Node {self.node_id} joined the shard ring")
+
+    def leave(self):
+        self._stop.set()
+        if self.node_id is not None:
+            with self.redis.pipeline() as pipe:
+                pipe.zrem(self.members_key, self.node_id)
+                pipe.hdel(self.addresses_key, self.node_id)
+                pipe.execute()
+
+    def members(self) -> List[str]:
+        """Live node ids, sorted"""
+        with self.redis.pipeline() as pipe:
+            pipe.zremrangebyscore(self.members_key, '-inf', self._now())
+            pipe.zrange(self.members_key, 0, -1)
+            _, members = pipe.execute()
+        members = sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+        ring_members.set(len(members))
+        return members
+
+    def addresses(self) -> Dict[str, str]:
+        return {
+            k.decode(): v.decode()
+            for k, v in self.redis.hgetall(self.addresses_key).items()
+        }
+
+    def ring(self) -> HashRing:
+        """Ring over the current members; rebuilt only when membership changed"""
+        members = tuple(self.members())
+        if members != self._ring_members:
+            ring = HashRing(vnodes=self.vnodes)
+            for node in members:
+                ring.add(node)
+            self._ring, self._ring_members = ring, members
+        return self._ring
+
+
+class ShardRouter:
+    """Send document-scoped requests to the owning node, or fan out to all of them"""
+
+    def __init__(self, membership: ClusterMembership, max_workers: int = 8):
+        self.membership = membership
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard-router')
+
+    def owner(self, doc_hash: str) -> Optional[str]:
+        return self.membership.ring().owner(doc_hash)
+
+    def owner_address(self, doc_hash: str) -> Optional[str]:
+        node = self.owner(doc_hash)
+        return self.membership.addresses().get(node) if node else None
+
+    def fan_out(
+        self,
+        call: Callable[[str, str], List[Dict]],
+        top_k: Optional[int] = None,
+        timeout: float = 30,
+    ) -> List[Dict]:
+        """
+        Call every live node and merge the hits by 'score'
+        Args:
+            call: (node id, address) -> list of hit dicts with a 'score'; a
+                host running several nodes serves each node's shard'
+            top_k: keep the best top_k hits overall
+            timeout: seconds to wait for each node; late or failed nodes are skipped
+        """
+        addresses = self.membership.addresses()
+        futures = {
+            node: self.executor.submit(call, node, addresses[node])
+            for node in self.membership.members() if node in addresses
+        }
+        hits = []
+        for node, future in futures.items():
+            try:
+                for hit in future.result(timeout=timeout):
+                    hits.append(dict(hit, node=node))
+            except Exception as e:
+                fan_out_errors.labels(node=node).inc()
+                logging.error(f"Shard {node} query failed: {str(e)}")
+        hits.sort(key=lambda hit: hit.get('score') or 0.0, reverse=True)
+        return hits[:top_k] if top_k else hits
@@ -0,0 +1,114 @@
+"""
+Shared-memory handoff of parsed pages from parsing processes.
+
+A parsing process writes every page's markdown into one
+multiprocessing.shared_memory block and returns only the block name,
+per-page (offset, length) pairs and the small metadata dicts. The parent
+decodes each page straight out of the shared buffer when the Document is
+first used, so page text is neither pickled back nor copied into
+intermediate bytes objects.
+"""
+from typing import Dict, List, Optional, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import logging
+from llama_index.core.schema import Document
+from src.pdf_utils import parse_pdf_pages
+
+
+def write_pages_to_shared_memory(path: str, start: int, end: int) -> Dict:
+    """
+    Parse pages [start, end) of path in a worker process and place page
+    text in shared memory; parsing errors propagate to the caller
+    Returns:
+        handle with name, offsets, metadata and ids
+    """
+    docs = parse_pdf_pages(path, start, end)
+    encoded = [doc.text.encode('utf-8') for doc in docs]
+    block = shared_memory.SharedMemory(create=True, size=max(1, sum(len(e) for e in encoded)))
+    offsets = []
+    position = 0
+    for data in encoded:
+        block.buf[position:position + len(data)] = data
+        offsets.append((position, len(data)))
+        position += len(data)
+    handle = {
+        'name': block.name,
+        'offsets': offsets,
+        'metadata': [doc.metadata for doc in docs],
+        'ids': [doc.id_ for doc in docs],
+    }
+    # The parent owns the block from here on and unlinks it
+    block.close()
+    return handle
+
+
+class SharedPageArena(Sequence):
+    """
+    Parent-side view of one shard's pages. Documents are built on first
+    access and kept, so metadata set by callers sticks. close() (or
+    leaving the with-block) releases and unlinks the shared block.
+    """
+
+    def __init__(self, handle: Dict):
+        self._block = shared_memory.SharedMemory(name=handle['name'])
+        self._offsets = handle['offsets']
+        self._metadata = handle['metadata']
+        self._ids = handle['ids']
+        self._docs: List[Optional[Document]] = [None] * len(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def text_view(self, i: int) -> memoryview:
+        """Page i's UTF-8 bytes, without copying"""
+        start, length = self._offsets[i]
+        return self._block.buf[start:start + length]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if self._docs[i] is None:
+            with self.text_view(i) as view:
+                text = str(view, 'utf-8')
+            self._docs[i] = Document(id_=self._ids[i], text=text, metadata=self._metadata[i])
+        return self._docs[i]
+
+    def close(self):
+        if self._block is None:
+            return
+        self._block.close()
+        try:
+            self._block.unlink()
+        except FileNotFoundError:
+            pass
+        self._block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception as e:
+            logging.error(f"Releasing shared page arena failed: {str(e)}")
+
+
+class SharedMemoryPageParser:
+    """
+    Drop-in for parse_pdf_pages(path, start, end) that parses in a process
+    pool and hands pages back through shared memory. Returns a
+    SharedPageArena (a sequence of Documents); parsing errors raise here.
+    """
+
+    def __init__(self, processes: int = 4):
+        self.pool = ProcessPoolExecutor(max_workers=processes)
+
+    def __call__(self, path: str, start: int, end: int) -> SharedPageArena:
+        return SharedPageArena(self.pool.submit(write_pages_to_shared_memory, path, start, end).result())
+
+    def close(self):
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,147 @@
+"""
+Celery task graph for PDF ingestion: parse -> chunk -> embed -> upsert.
+
+Each PDF is split into page shards that run the whole chain in parallel;
+a chord merges the staged shards into the index once all of them are
+done. Stages route to their own queues so CPU-bound parsing and I/O-bound
+embedding workers scale independently. Upsert workers stage shards next
+to the index, so they need the index directory on shared storage:
+
+    celery -A src.tasks worker -Q parse -c 8
+    celery -A src.tasks worker -Q embed -c 32 -P threads
+    celery -A src.tasks worker -Q upsert -c 2
+
+Set CELERY_EAGER=1 to run the graph in-process with an in-memory broker.
+"""
+from typing import Dict, List, Optional
+import json
+import logging
+import os
+import shutil
+import uuid
+from celery import Celery, chain, chord
+from redis import Redis
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from src.ingestion import chunk_documents, embed_nodes, upsert_nodes
+from src.pdf_utils import count_pdf_pages, parse_pdf_pages
+from src.pdf_worker import ROOT_DIR, load_worker_config
+from src.work_nvidia import get_embeddings
+
+config = load_worker_config()
+EAGER = str(config.get("CELERY_EAGER", os.getenv("CELERY_EAGER", "0"))).lower() in ("1", "true")
+REDIS_URL = config.get("REDIS_URL", "redis://localhost:6379")
+
+celery_app = Celery("rag_ingestion")
+celery_app.conf.update(
+    broker_url="memory://" if EAGER else config.get("CELERY_BROKER_URL", REDIS_URL),
+    result_backend="cache+memory://" if EAGER else config.get("CELERY_RESULT_BACKEND", REDIS_URL),
+    task_always_eager=EAGER,
+    task_eager_propagates=True,
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    # Long parse/embed tasks: take one at a time and ack after completion
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_routes={
+        "ingest.parse_shard": {"queue": "parse"},
+        "ingest.chunk_shard": {"queue": "parse"},
+        "ingest.embed_shard": {"queue": "embed"},
+        "ingest.upsert_shard": {"queue": "upsert"},
+        "ingest.finalize_index": {"queue": "upsert"},
+    },
+)
+
+_embed_model = None
+
+
+def _get_embed_model():
+    """One embedding client per worker process"""
+    global _embed_model
+    if _embed_model is None:
+        _embed_model = get_embeddings(
+            model=config.get("NVIDIA_EMBEDDINGS"),
+            provider=config.get("EMBEDDINGS_PROVIDER", "nvidia"),
+        )
+    return _embed_model
+
+
+@celery_app.task(name="ingest.parse_shard")
+def parse_shard(path: str, start: int, end: int, filename: str) -> List[Dict]:
+    """Parse pages [start, end) of a PDF into Documents; a parse error fails the task"""
+    docs = parse_pdf_pages(path, start, end)
+    for doc in docs:
+        doc.metadata["filename"] = filename
+    return [doc_to_json(doc) for doc in docs]
+
+
+@celery_app.task(name="ingest.chunk_shard")
+def chunk_shard(docs: List[Dict]) -> List[Dict]:
+    return [doc_to_json(node) for node in chunk_documents([json_to_doc(d) for d in docs])]
+
+
+@celery_app.task(
+    name="ingest.embed_shard",
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def embed_shard(nodes: List[Dict]) -> List[Dict]:
+    embedded = embed_nodes([json_to_doc(n) for n in nodes], _get_embed_model())
+    return [doc_to_json(node) for node in embedded]
+
+
+@celery_app.task(name="ingest.upsert_shard")
+def upsert_shard(nodes: List[Dict], staging_dir: str, shard: int) -> Dict:
+    """Stage a shard's embedded nodes; finalize_index merges them in one write"""
+    os.makedirs(staging_dir, exist_ok=True)
+    tmp_path = os.path.join(staging_dir, f"{shard:06d}.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(nodes, f)
+    os.replace(tmp_path, os.path.join(staging_dir, f"{shard:06d}.json"))
+    return {"shard": shard, "nodes": len(nodes)}
+
+
+@celery_app.task(name="ingest.finalize_index")
+def finalize_index(shards: List[Dict], staging_dir: str, index_dir: str) -> Dict:
+    """Chord callback: merge every staged shard into the index"""
+    nodes = []
+    names = sorted(os.listdir(staging_dir)) if os.path.isdir(staging_dir) else []
+    for name in names:
+        if name.endswith(".json"):
+            with open(os.path.join(staging_dir, name), encoding="utf-8") as f:
+                nodes.extend(json_to_doc(n) for n in json.load(f))
+
+    lock = None if EAGER else Redis.from_url(REDIS_URL).lock(f"index_lock:{index_dir}", timeout=600)
+    if nodes:
+        upsert_nodes(nodes, index_dir, _get_embed_model(), lock=lock)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    logging.info(f"Merged {len(nodes)} nodes from {len(shards)} shards into {index_dir}")
+    return {"shards": len(shards), "nodes": len(nodes), "index_dir": index_dir}
+
+
+def ingest_pdf(path: str, index_dir: Optional[str] = None, shard_pages: int = 10):
+    """
+    Build and launch the task graph for one PDF
+    Args:
+        path: PDF path readable by the parse workers
+        index_dir: index persist directory, saves/<INDEX_NAME> by default
+        shard_pages: pages per parse shard
+    Returns:
+        celery AsyncResult of the finalize step
+    """
+    index_dir = index_dir or os.path.join(ROOT_DIR, "saves", config.get("INDEX_NAME", "default"))
+    staging_dir = os.path.join(index_dir, "_staging", uuid.uuid4().hex)
+    filename = os.path.basename(path)
+    total_pages = count_pdf_pages(path)
+
+    shards = [
+        chain(
+            parse_shard.s(path, start, min(start + shard_pages, total_pages), filename),
+            chunk_shard.s(),
+            embed_shard.s(),
+            upsert_shard.s(staging_dir, shard),
+        )
+        for shard, start in enumerate(range(0, total_pages, shard_pages))
+    ]
+    return chord(shards)(finalize_index.s(staging_dir, index_dir))
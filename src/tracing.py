@@ -0,0 +1,305 @@
+"""
+Lightweight in-process tracing.
+
+    with trace('chat') as t:
+        response = chat_engine.chat(question)
+    t.breakdown()   # per-span timings for this request
+
+span() and @traced open child spans of whatever span is current in the
+calling context (contextvars, so asyncio tasks inherit it). Every
+finished span is observed in the trace_span_seconds histogram, whether
+or not a trace is active; inside a trace it is also recorded with its
+parent id so the request can be broken down.
+
+instrument_llama_index() turns LlamaIndex's own instrumentation events
+into spans: embed, retrieve, rerank, synthesize, llm.complete and
+llm.chat. In CondensePlusContextChatEngine llm.complete is the question
+condensing call and llm.chat the answer generation; the context_pack
+and mmr_rerank spans cover context assembly.
+"""
+from typing import Any, Callable, Dict, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import inspect
+import logging
+import threading
+import time
+import uuid
+import orjson
+from prometheus_client import Histogram
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events import BaseEvent
+from llama_index.core.instrumentation.events.embedding import EmbeddingEndEvent, EmbeddingStartEvent
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatEndEvent,
+    LLMChatStartEvent,
+    LLMCompletionEndEvent,
+    LLMCompletionStartEvent,
+)
+from llama_index.core.instrumentation.events.rerank import ReRankEndEvent, ReRankStartEvent
+from llama_index.core.instrumentation.events.retrieval import RetrievalEndEvent, RetrievalStartEvent
+from llama_index.core.instrumentation.events.synthesis import SynthesizeEndEvent, SynthesizeStartEvent
+
+# Tracing metrics
+span_seconds = Histogram(
+    'trace_span_seconds', 'Duration of traced spans', ['span'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('current_trace', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'trace', 'start', 'end', 'attrs')
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, trace: Optional['Trace'] = None, **attrs):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace = trace
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attrs = attrs
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def finish(self):
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        span_seconds.labels(span=self.name).observe(self.end - self.start)
+        if self.trace is not None:
+            self.trace.record(self)
+
+    def abandon(self):
+        """End a span whose end will never come; kept out of span_seconds"""
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        self.attrs['unfinished'] = True
+        if self.trace is not None:
+            self.trace.record(self)
+
+
+class Trace:
+    """Finished spans of one request"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._on_close: List[Callable[[], None]] = []
+
+    def record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def on_close(self, callback: Callable[[], None]):
+        """Run callback when the request ends, e.g. to end spans left open"""
+        with self._lock:
+            self._on_close.append(callback)
+
+    def close(self):
+        with self._lock:
+            callbacks, self._on_close = self._on_close, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Trace {self.name} close callback failed: {str(e)}")
+
+    def breakdown(self) -> Dict[str, Any]:
+        """Total and per-span milliseconds, plus seconds summed per span name"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        root = next((s for s in spans if s.parent_id is None and s.name == self.name), None)
+        by_name: Dict[str, float] = {}
+        for s in spans:
+            by_name[s.name] = by_name.get(s.name, 0.0) + s.duration
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'total_ms': round(root.duration * 1000, 2) if root else None,
+            'by_name_ms': {k: round(v * 1000, 2) for k, v in by_name.items()},
+            'spans': [
+                {
+                    'name': s.name,
+                    'span_id': s.span_id,
+                    'parent_id': s.parent_id,
+                    'ms': round(s.duration * 1000, 2),
+                    **({'attrs': s.attrs} if s.attrs else {}),
+                }
+                for s in spans
+            ],
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Child span of the current span; nests through with-blocks and awaits"""
+    current = Span(name, parent=_current_span.get(), trace=_current_trace.get(), **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+@contextmanager
+def trace(name: str, log_threshold: Optional[float] = None, **attrs):
+    """
+    Root span for one request
+    Args:
+        name: root span name
+        log_threshold: log the breakdown when the request took at least
+            this many seconds; None never logs
+    """
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        with span(name, **attrs):
+            yield current
+    finally:
+        _current_trace.reset(token)
+        current.close()
+        root = next((s for s in current.spans if s.parent_id is None), None)
+        if log_threshold is not None and root is not None and root.duration >= log_threshold:
+            logging.info(f"Trace {name}: {orjson.dumps(current.breakdown()).decode()}")
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator running a sync or async function inside span(name)"""
+
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+_EVENT_SPANS = {
+    EmbeddingStartEvent: ('embed', True),
+    EmbeddingEndEvent: ('embed', False),
+    RetrievalStartEvent: ('retrieve', True),
+    RetrievalEndEvent: ('retrieve', False),
+    ReRankStartEvent: ('rerank', True),
+    ReRankEndEvent: ('rerank', False),
+    SynthesizeStartEvent: ('synthesize', True),
+    SynthesizeEndEvent: ('synthesize', False),
+    LLMCompletionStartEvent: ('llm.complete', True),
+    LLMCompletionEndEvent: ('llm.complete', False),
+    LLMChatStartEvent: ('llm.chat', True),
+    LLMChatEndEvent: ('llm.chat', False),
+}
+
+
+class LlamaIndexSpanHandler(BaseEventHandler):
+    """
+    Pairs LlamaIndex start/end events (by event type and LlamaIndex span
+    id) into spans. Start and end can arrive from different tasks, e.g. a
+    streamed answer ends where it is consumed, so these spans are parented
+    to the span current at start but never become current themselves.
+
+    Some starts never get their end, e.g. a streamed llm.chat cancelled
+    mid-answer. Such spans are abandoned when their trace ends, and
+    spans opened outside a trace are dropped after max_age seconds.
+    """
+
+    max_age: float = Field(default=600.0, description="Seconds before an unmatched span is dropped")
+    _open: Dict = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _next_sweep: float = PrivateAttr(default=0.0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LlamaIndexSpanHandler"
+
+    def handle(self, event: BaseEvent, **kwargs: Any) -> None:
+        kind = _EVENT_SPANS.get(type(event))
+        if kind is None:
+            return
+        name, is_start = kind
+        key = (name, event.span_id)
+        if is_start:
+            opened = Span(name, parent=_current_span.get(), trace=_current_trace.get())
+            with self._lock:
+                self._open.setdefault(key, []).append(opened)
+            if opened.trace is not None:
+                opened.trace.on_close(functools.partial(self._abandon, key, opened))
+            self._sweep(opened.start)
+            return
+        with self._lock:
+            stack = self._open.get(key)
+            if not stack:
+                return
+            opened = stack.pop()
+            if not stack:
+                del self._open[key]
+        opened.finish()
+
+    def _remove(self, key, opened: Span) -> bool:
+        """Take one open span off its stack (lock held); False if it already ended"""
+        stack = self._open.get(key)
+        if not stack or opened not in stack:
+            return False
+        stack.remove(opened)
+        if not stack:
+            del self._open[key]
+        return True
+
+    def _abandon(self, key, opened: Span):
+        with self._lock:
+            removed = self._remove(key, opened)
+        if removed:
+            opened.abandon()
+
+    def _sweep(self, now: float):
+        """Drop spans older than max_age, at most once per max_age"""
+        if now < self._next_sweep:
+            return
+        with self._lock:
+            self._next_sweep = now + self.max_age
+            stale = [
+                (key, opened) for key, stack in self._open.items() for opened in stack
+                if now - opened.start > self.max_age
+            ]
+            for key, opened in stale:
+                self._remove(key, opened)
+        if stale:
+            logging.warning(f"Dropped {len(stale)} LlamaIndex spans with no end event")
+
+
+_instrumented = False
+
+
+def instrument_llama_index():
+    """Register LlamaIndexSpanHandler on the root dispatcher, once per process"""
+    global _instrumented
+    if _instrumented:
+        return
+    get_dispatcher().add_event_handler(LlamaIndexSpanHandler())
+    _instrumented = True
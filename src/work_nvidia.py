@@ -11,21 +11,57 @@ from llama_index.core import Settings
 from llama_index.llms.openai import OpenAI
 from llama_index.llms.anthropic import Anthropic
 from llama_index.llms.azure_openai import AzureOpenAI
-from typing import Literal
+from typing import List, Literal, Optional
+from src.context_packing import ContextPacker
+from src.reranking import MMRReranker
+from src.memory import RollingSummaryMemory
+from src.rate_limit import RateLimitedEmbedding, RateLimitedLLM
+from src.local_provider import LocalEmbedding, LocalLLM
 
 TEXT_SPLITTER_CHUNCK_SIZE = 200
 TEXT_SPLITTER_CHUNCK_OVERLAP = 50
+CONTEXT_TOKEN_BUDGET = 3000
+MMR_FETCH_MULTIPLIER = 4
 
-LLMTypes = Literal["openai", "claude", "azure"]
+LLMTypes = Literal["openai", "claude", "azure", "local"]
+# Texts per embedding request; NVIDIA accepts at most 259
+EMBED_BATCH_SIZE = 256
 
-def get_llm(provider: LLMTypes, model: str = None, **kwargs):
+
+class NVIDIABatchEmbedding(NVIDIAEmbedding):
+    """NVIDIAEmbedding that also embeds many questions in one request, as queries"""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NVIDIABatchEmbedding"
+
+    async def _aget_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        data = (
+            await self._aclient.embeddings.create(
+                input=queries,
+                model=self.model,
+                extra_body={"input_type": "query", "truncate": self.truncate},
+            )
+        ).data
+        return [d.embedding for d in data]
+
+
+def get_llm(provider: LLMTypes, model: str = None, rate_limiter=None, **kwargs):
     """
     Get LLM based on provider
     Args:
-        provider: LLM provider (openai, claude, azure)
+        provider: LLM provider (openai, claude, azure, local)
         model: Model name (optional)
+        rate_limiter: TokenBucketRateLimiter shared with other callers (optional)
         **kwargs: Additional arguments for the LLM
     """
+    llm = _create_llm(provider, model, **kwargs)
+    if rate_limiter is not None:
+        return RateLimitedLLM(llm, rate_limiter, provider=provider)
+    return llm
+
+
+def _create_llm(provider: LLMTypes, model: str = None, **kwargs):
     if provider == "openai":
         return OpenAI(
             model=model or "gpt-4-turbo-preview",
@@ -51,11 +87,38 @@ def get_llm(provider: LLMTypes, model: str = None, **kwargs):
             max_tokens=kwargs.get('max_tokens', 1024)
         )
     
+    elif provider == "local":
+        # Offline canned completions with synthetic timing for benchmarks
+        return LocalLLM(
+            model_name=model or "local-canned-llm",
+            num_output=kwargs.get('max_tokens', 128),
+            first_token_latency=kwargs.get('first_token_latency', 0.0),
+            tokens_per_second=kwargs.get('tokens_per_second', 0.0)
+        )
+    
     raise ValueError(f"Unsupported LLM provider: {provider}")
 
 
-def get_embeddings(model):
-    return NVIDIAEmbedding(model=model, truncate="END")
+def get_embeddings(model, rate_limiter=None, provider: str = "nvidia", **kwargs):
+    """
+    Args:
+        model: embedding model name
+        rate_limiter: TokenBucketRateLimiter shared with other callers (optional)
+        provider: nvidia, or local for offline hash-based embeddings
+        **kwargs: local provider timing (call_latency, text_latency, dimensions)
+    """
+    # A batch of texts (or questions) goes out as one request
+    if provider == "local":
+        embed_model = LocalEmbedding(
+            model_name=model or "local-hash-embedding", embed_batch_size=EMBED_BATCH_SIZE, **kwargs
+        )
+    elif provider == "nvidia":
+        embed_model = NVIDIABatchEmbedding(model=model, truncate="END", embed_batch_size=EMBED_BATCH_SIZE)
+    else:
+        raise ValueError(f"Unsupported embeddings provider: {provider}")
+    if rate_limiter is not None:
+        return RateLimitedEmbedding(embed_model, rate_limiter, provider=provider)
+    return embed_model
 
 
 def setup_index(model, embeddings):
@@ -78,23 +141,60 @@ def vectorindex_from_data(data, embed_model):
     return index
 
 
-def create_memory_buffer(token_limit: int = 4500):
+def create_memory_buffer(token_limit: int = 4500, summarize: bool = True, llm=None):
     """
     Create a memory buffer
     args:
         token_limit: int
+        summarize: fold old turns into a background running summary instead
+            of dropping them once token_limit is reached
+        llm: LLM used for summaries, defaults to Settings.llm
 
     """
+    if summarize:
+        return RollingSummaryMemory.from_defaults(token_limit=token_limit, llm=llm)
     return ChatMemoryBuffer.from_defaults(token_limit=token_limit)
 
 
-def create_chat_engine(index):
+def create_chat_engine(
+    index=None,
+    context_token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+    node_postprocessors: Optional[List] = None,
+    diversity_top_k: Optional[int] = None,
+    diversity_lambda: float = 0.5,
+    retriever=None,
+):
     """
     create a chat engine
     Args:
         index: llama_index.core.VectorStoreIndex
+        context_token_budget: max tokens of retrieved context per answer,
+            None disables context packing
+        node_postprocessors: extra postprocessors run before packing
+        diversity_top_k: when set, over-fetch MMR_FETCH_MULTIPLIER times as
+            many candidates and keep this many diverse nodes with MMR
+        diversity_lambda: MMR relevance/diversity trade-off
+        retriever: retrieve with this instead of the index, e.g. one merging
+            every shard's hits; diversity_top_k still needs the index
     """
     memory = create_memory_buffer()
+    postprocessors = []
+    retriever_kwargs = {}
+    if diversity_top_k:
+        retriever_kwargs["similarity_top_k"] = diversity_top_k * MMR_FETCH_MULTIPLIER
+        postprocessors.append(
+            MMRReranker(
+                embed_model=index._embed_model,
+                vector_store=index.vector_store,
+                top_n=diversity_top_k,
+                lambda_mult=diversity_lambda,
+            )
+        )
+    postprocessors.extend(node_postprocessors or [])
+    if context_token_budget:
+        postprocessors.append(ContextPacker(token_budget=context_token_budget))
     return CondensePlusContextChatEngine.from_defaults(
-        index.as_retriever(), memory=memory
+        retriever or index.as_retriever(**retriever_kwargs),
+        memory=memory,
+        node_postprocessors=postprocessors,
     )
@@ -0,0 +1,139 @@
+from typing import Dict, List, Optional
+import asyncio
+import logging
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from prometheus_client import Counter, Gauge, Histogram
+
+# Write-behind metrics
+write_behind_docs = Counter(
+    'mongo_write_behind_docs_total', 'Documents written by the write-behind buffer',
+    ['collection', 'status']
+)
+write_behind_batch = Histogram(
+    'mongo_write_behind_batch_size', 'Documents per bulk write',
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 5000)
+)
+write_behind_queue = Gauge('mongo_write_behind_queue_depth', 'Buffered documents', ['collection'])
+
+
+class AsyncWriteBehindBuffer:
+    """
+    Buffers MongoDB writes and flushes them as one insert_many(ordered=False)
+    or one bulk upsert whenever max_batch documents are waiting or
+    flush_interval seconds have passed since the first one arrived.
+
+    The queue is bounded: put() waits when max_queue documents are pending,
+    which pushes back on producers instead of growing memory. close() (or
+    flush()) drains everything before shutdown.
+    """
+
+    def __init__(
+        self,
+        collection,
+        max_batch: int = 500,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        upsert_key: Optional[str] = None,
+        is_async: Optional[bool] = None,
+    ):
+        """
+        Args:
+            collection: motor collection, or a sync pymongo/mongomock collection
+            max_batch: documents per bulk write
+            flush_interval: max seconds a document waits in the buffer
+            max_queue: pending documents before put() blocks
+            upsert_key: when set, documents are upserted by this field instead of inserted
+            is_async: whether collection methods return awaitables; detected
+                from the collection type when omitted
+        """
+        self.collection = collection
+        self.name = getattr(collection, 'name', 'unknown')
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.upsert_key = upsert_key
+        if is_async is None:
+            is_async = type(collection).__module__.split('.')[0] in ('motor', 'mongomock_motor')
+        self.is_async = is_async
+        self._queue: Optional[asyncio.Queue] = None
+        self._max_queue = max_queue
+        self._flusher: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        # Created lazily so the buffer binds to the loop that actually uses it
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, document: Dict):
+        """Buffer one document, waiting if the buffer is full"""
+        self._ensure_started()
+        await self._queue.put(document)
+        write_behind_queue.labels(collection=self.name).set(self._queue.qsize())
+
+    async def _next_batch(self) -> List[Dict]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                write_behind_queue.labels(collection=self.name).set(self._queue.qsize())
+
+    async def _call(self, method, *args, **kwargs):
+        if self.is_async:
+            return await method(*args, **kwargs)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def _write(self, batch: List[Dict]):
+        write_behind_batch.observe(len(batch))
+        try:
+            if self.upsert_key:
+                requests = [
+                    UpdateOne({self.upsert_key: doc[self.upsert_key]}, {'$set': doc}, upsert=True)
+                    for doc in batch
+                ]
+                await self._call(self.collection.bulk_write, requests, ordered=False)
+            else:
+                await self._call(self.collection.insert_many, batch, ordered=False)
+            write_behind_docs.labels(collection=self.name, status='written').inc(len(batch))
+        except BulkWriteError as e:
+            # Unordered: everything except the failed documents was written
+            failed = len(e.details.get('writeErrors', []))
+            write_behind_docs.labels(collection=self.name, status='written').inc(len(batch) - failed)
+            write_behind_docs.labels(collection=self.name, status='error').inc(failed)
+            logging.error(f"Bulk write to {self.name}: {failed}/{len(batch)} documents failed")
+        except Exception as e:
+            write_behind_docs.labels(collection=self.name, status='error').inc(len(batch))
+            logging.error(f"Bulk write to {self.name} failed: {str(e)}")
+
+    async def flush(self):
+        """Wait until every buffered document has been written"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        """Flush and stop the background writer"""
+        await self.flush()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
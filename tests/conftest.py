@@ -0,0 +1,27 @@
+import os
+import sys
+import fitz
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def page_marker(page: int) -> str:
+    """Text written on 0-based page `page` of the multi_page_pdf fixture"""
+    return f"Marker text for page {page + 1}"
+
+
+def write_pdf(path, pages: int) -> str:
+    """Write a real PDF with one page_marker line per page"""
+    doc = fitz.open()
+    for page in range(pages):
+        doc.new_page().insert_text((72, 72), page_marker(page), fontsize=12)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def multi_page_pdf(tmp_path):
+    """A real 7-page PDF with one marker line per page"""
+    return write_pdf(tmp_path / "multi_page.pdf", 7)
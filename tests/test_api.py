@@ -0,0 +1,139 @@
+import importlib
+import os
+import threading
+import time
+import fakeredis
+import pytest
+import redis
+import redis.asyncio
+import uvicorn
+from fastapi.testclient import TestClient
+from llama_index.core.schema import TextNode
+from src import pdf_worker
+from src.ingestion import embed_nodes, upsert_nodes
+from src.local_provider import LocalEmbedding
+from src.sharding import ClusterMembership
+
+
+@pytest.fixture
+def load_api(tmp_path, monkeypatch):
+    """Import src.api against fakeredis and local providers, with saves/ under tmp_path"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", lambda *args, **kwargs: fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(
+        redis.asyncio.Redis, "from_url", lambda *args, **kwargs: fakeredis.FakeAsyncRedis(server=server)
+    )
+    monkeypatch.setattr(pdf_worker, "ROOT_DIR", str(tmp_path))
+
+    def load(**config):
+        config = {"LLM_PROVIDER": "local", "EMBEDDINGS_PROVIDER": "local", **config}
+        monkeypatch.setattr(pdf_worker, "load_worker_config", lambda: dict(config))
+        from src import api
+        return importlib.reload(api)
+
+    return load
+
+
+@pytest.fixture
+def serve():
+    """Serve an app over HTTP in a thread, for the nodes a sharded query fans out to"""
+    servers = []
+
+    def start(app):
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        servers.append((server, thread))
+        host, port = server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    yield start
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join()
+
+
+def write_index(tmp_path, name, texts):
+    nodes = embed_nodes([TextNode(text=text) for text in texts], LocalEmbedding())
+    upsert_nodes(nodes, os.path.join(tmp_path, "saves", name), LocalEmbedding())
+    return [node.node_id for node in nodes]
+
+
+def retrieve(client, name, question):
+    response = client.post(f"/indexes/{name}/query", json={"question": question, "mode": "retrieve", "top_k": 1})
+    assert response.status_code == 200, response.text
+    return response.json()["hits"][0]["text"]
+
+
+def test_index_is_reloaded_after_a_worker_writes_to_it(load_api, tmp_path):
+    api = load_api()
+    write_index(tmp_path, "docs", ["termination requires thirty days notice"])
+    client = TestClient(api.app)
+    assert retrieve(client, "docs", "termination notice") == "termination requires thirty days notice"
+
+    write_index(tmp_path, "docs", ["invoices are payable within sixty days"])
+
+    assert retrieve(client, "docs", "invoices payable") == "invoices are payable within sixty days"
+
+
+def test_index_being_written_keeps_serving_the_loaded_copy(load_api, tmp_path):
+    api = load_api()
+    write_index(tmp_path, "docs", ["termination requires thirty days notice"])
+    client = TestClient(api.app)
+    retrieve(client, "docs", "termination notice")
+
+    index_dir = os.path.join(tmp_path, "saves", "docs")
+    lock = redis.Redis.from_url("redis://").lock(f"index_lock:{index_dir}", timeout=60)
+    with lock:
+        write_index(tmp_path, "docs", ["invoices are payable within sixty days"])
+        assert retrieve(client, "docs", "invoices payable") == "termination requires thirty days notice"
+    assert retrieve(client, "docs", "invoices payable") == "invoices are payable within sixty days"
+
+
+embed_calls = []
+
+
+class CountingEmbedding(LocalEmbedding):
+    async def _aget_query_embeddings(self, queries):
+        embed_calls.append(("query", len(queries)))
+        return await super()._aget_query_embeddings(queries)
+
+    async def _aget_text_embeddings(self, texts):
+        embed_calls.append(("text", len(texts)))
+        return await super()._aget_text_embeddings(texts)
+
+
+def test_batch_questions_are_embedded_as_queries_in_one_call(load_api, tmp_path):
+    api = load_api()
+    write_index(tmp_path, "docs", ["termination requires thirty days notice"])
+    api.embed_model = CountingEmbedding(embed_batch_size=256)
+    questions = [f"question {i}" for i in range(40)]
+
+    response = TestClient(api.app).post(
+        "/indexes/docs/query/batch", json={"questions": questions, "mode": "retrieve"}
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 40
+    assert embed_calls == [("query", 40)]
+
+
+def test_sharded_chat_retrieves_from_every_node(load_api, tmp_path, serve):
+    api = load_api(SHARDING="1")
+    node_ids = write_index(tmp_path, "docs/a", ["Termination of this agreement requires thirty days written notice."])
+    node_ids += write_index(tmp_path, "docs/b", ["Invoices issued under this agreement are payable within sixty days."])
+    address = serve(api.app)
+    for node_id in ("a", "b"):
+        ClusterMembership(redis.Redis.from_url("redis://"), node_id=node_id, address=address).heartbeat()
+
+    with TestClient(api.app).websocket_connect("/indexes/docs/chat") as websocket:
+        assert websocket.receive_json()["type"] == "session"
+        websocket.send_json({"type": "message", "content": "termination notice and invoices"})
+        message = websocket.receive_json()
+        while message["type"] == "token":
+            message = websocket.receive_json()
+
+    assert message["type"] == "done"
+    assert sorted(source["node_id"] for source in message["sources"]) == sorted(node_ids)
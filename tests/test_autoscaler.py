@@ -0,0 +1,164 @@
+import threading
+import time
+from datetime import datetime
+from src.autoscaler import PipelineAutoscaler, ScalableThreadPool, parse_autoscale_bounds
+
+
+class FakeMonitor:
+    def __init__(self, cpu=10.0, memory=10.0):
+        self.cpu = cpu
+        self.memory = memory
+
+    @property
+    def latest_readings(self):
+        return {'cpu': self.cpu, 'memory': self.memory, 'timestamp': datetime.utcnow().isoformat()}
+
+
+class FakePipeline:
+    """One stage whose counters advance by one tick of the given load per snapshot"""
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.resizes = []
+        self.stats = {'processed': 0, 'errors': 0, 'busy_seconds': 0.0, 'worker_seconds': 0.0}
+        self.load(backlog=False, utilization=0.5)
+
+    def load(self, backlog, utilization, latency=1.0):
+        self.backlog = backlog
+        self.utilization = utilization
+        self.latency = latency
+
+    def snapshot(self):
+        busy = self.workers * self.utilization
+        self.stats['busy_seconds'] += busy
+        self.stats['worker_seconds'] += self.workers
+        self.stats['processed'] += max(1, round(busy / self.latency))
+        return {'embed': dict(
+            self.stats,
+            workers=self.workers,
+            queue_depth=8 if self.backlog else 0,
+            queue_size=8,
+            done=False,
+        )}
+
+    def resize(self, name, workers):
+        self.resizes.append(workers)
+        self.workers = workers
+
+
+def make_scaler(pipeline, monitor=None, **kwargs):
+    return PipelineAutoscaler(pipeline, {'embed': (1, 6)}, monitor=monitor or FakeMonitor(), **kwargs)
+
+
+def test_stage_grows_only_after_patience_ticks_of_backlog():
+    pipeline = FakePipeline()
+    scaler = make_scaler(pipeline, patience=2)
+    pipeline.load(backlog=True, utilization=1.0)
+
+    scaler.tick()  # first snapshot: nothing to compare with
+    scaler.tick()
+    assert pipeline.resizes == []
+    scaler.tick()
+    assert pipeline.resizes == [4]
+
+
+def test_alternating_load_does_not_flap():
+    pipeline = FakePipeline(workers=3)
+    scaler = make_scaler(pipeline, patience=2)
+    scaler.tick()
+    for _ in range(6):
+        pipeline.load(backlog=True, utilization=1.0)
+        scaler.tick()
+        pipeline.load(backlog=False, utilization=0.0)
+        scaler.tick()
+    assert pipeline.resizes == []
+
+
+def test_no_change_during_cooldown_after_a_resize():
+    pipeline = FakePipeline()
+    scaler = make_scaler(pipeline, patience=1, cooldown=3)
+    pipeline.load(backlog=True, utilization=1.0)
+    scaler.tick()
+
+    scaler.tick()
+    assert pipeline.resizes == [4]
+    for _ in range(3):
+        scaler.tick()
+    assert pipeline.resizes == [4]
+    scaler.tick()
+    assert pipeline.resizes == [4, 6]
+    # At the upper bound
+    for _ in range(5):
+        scaler.tick()
+    assert pipeline.resizes == [4, 6]
+
+
+def test_idle_stage_shrinks_to_its_lower_bound():
+    pipeline = FakePipeline(workers=3)
+    scaler = make_scaler(pipeline, patience=2, cooldown=0)
+    pipeline.load(backlog=False, utilization=0.0)
+    for _ in range(10):
+        scaler.tick()
+    assert pipeline.resizes == [2, 1]
+
+
+def test_growth_is_held_under_memory_pressure_and_rising_latency():
+    pipeline = FakePipeline()
+    monitor = FakeMonitor(memory=95.0)
+    scaler = make_scaler(pipeline, monitor=monitor, patience=1)
+    pipeline.load(backlog=True, utilization=1.0)
+    scaler.tick()
+    scaler.tick()
+    # Memory above the limit shrinks instead
+    assert pipeline.resizes == [1]
+
+    pipeline = FakePipeline()
+    scaler = make_scaler(pipeline, patience=1)
+    pipeline.load(backlog=True, utilization=1.0, latency=1.0)
+    scaler.tick()
+    pipeline.load(backlog=True, utilization=1.0, latency=0.1)
+    scaler.tick()
+    pipeline.resizes.clear()
+    for _ in range(5):
+        pipeline.load(backlog=True, utilization=1.0, latency=2.0)
+        scaler.tick()
+    assert pipeline.resizes == []
+
+
+def test_scalable_thread_pool_resizes_while_running():
+    pool = ScalableThreadPool(1)
+    release = threading.Event()
+    running = []
+
+    def task(i):
+        running.append(i)
+        release.wait()
+        return i
+
+    futures = [pool.submit(task, i) for i in range(4)]
+    time.sleep(0.1)
+    assert len(running) == 1
+    assert pool.snapshot()['pool']['queue_depth'] == 3
+
+    pool.resize('pool', 4)
+    time.sleep(0.1)
+    assert len(running) == 4
+    release.set()
+    assert [f.result(timeout=5) for f in futures] == [0, 1, 2, 3]
+
+    pool.resize('pool', 1)
+    time.sleep(0.1)
+    snapshot = pool.snapshot()['pool']
+    assert (snapshot['workers'], snapshot['processed']) == (1, 4)
+    assert snapshot['busy_seconds'] > 0
+    # Idle surplus workers have exited
+    assert len(pool._threads) == 1
+    pool.shutdown()
+
+
+def test_parse_autoscale_bounds():
+    assert parse_autoscale_bounds('parse=1-4; embed=2-16;upsert=1') == {
+        'parse': (1, 4), 'embed': (2, 16), 'upsert': (1, 1)
+    }
+    assert parse_autoscale_bounds('parse=4-1;embed=x') == {}
+    assert parse_autoscale_bounds('') == {}
@@ -0,0 +1,87 @@
+import fakeredis
+import pytest
+from src.checkpoint import CheckpointedIngestion, LocalCheckpointStore, RedisCheckpointStore
+from src.ingestion import chunk_documents
+from conftest import page_marker
+
+
+def keep_pages(docs):
+    return list(docs), {'chunks': len(docs)}
+
+
+def test_run_parses_every_page_of_a_real_pdf(tmp_path, multi_page_pdf):
+    ingestion = CheckpointedIngestion(LocalCheckpointStore(str(tmp_path / 'checkpoints')), shard_pages=3)
+
+    result = ingestion.run(multi_page_pdf, keep_pages)
+
+    assert result['pages'] == 7
+    assert [(s['start'], s['end'], s['pages']) for s in result['shards']] == [(0, 3, 3), (3, 6, 3), (6, 7, 1)]
+    assert [n.metadata['page'] for n in result['nodes']] == list(range(1, 8))
+    for page, node in enumerate(result['nodes']):
+        assert page_marker(page) in node.text
+        assert node.metadata['total_pages'] == 7
+
+
+def test_run_resumes_after_a_failed_upsert(tmp_path, multi_page_pdf):
+    ingestion = CheckpointedIngestion(LocalCheckpointStore(str(tmp_path / 'checkpoints')), shard_pages=3)
+    upserted = []
+
+    def fail_on_last_shard(nodes):
+        if nodes[0].metadata['page'] == 7:
+            raise RuntimeError('index unavailable')
+        upserted.append([n.metadata['page'] for n in nodes])
+
+    with pytest.raises(RuntimeError):
+        ingestion.run(multi_page_pdf, keep_pages, fail_on_last_shard)
+    assert upserted == [[1, 2, 3], [4, 5, 6]]
+
+    parsed = []
+
+    def record_parse(path, start, end):
+        parsed.append((start, end))
+        return []
+
+    ingestion.parse = record_parse
+    result = ingestion.run(multi_page_pdf, keep_pages, lambda nodes: upserted.append([n.metadata['page'] for n in nodes]))
+
+    # Upserted shards are skipped and the failed one reuses its checkpointed pages
+    assert parsed == []
+    assert result['resumed'] == 3
+    assert upserted[-1] == [7]
+    assert page_marker(6) in result['nodes'][0].text
+
+
+@pytest.mark.parametrize('store', ['local', 'redis'])
+def test_chunked_nodes_round_trip_through_the_store(tmp_path, multi_page_pdf, store):
+    checkpoints = (
+        LocalCheckpointStore(str(tmp_path / 'checkpoints')) if store == 'local'
+        else RedisCheckpointStore(fakeredis.FakeRedis())
+    )
+    ingestion = CheckpointedIngestion(checkpoints, shard_pages=4)
+
+    def chunk(docs):
+        nodes = chunk_documents(docs)
+        return nodes, {'chunks': len(nodes)}
+
+    def fail(nodes):
+        raise RuntimeError('index unavailable')
+
+    # Chunks keep relationships to their page, keyed by NodeRelationship
+    with pytest.raises(RuntimeError):
+        ingestion.run(multi_page_pdf, chunk, fail)
+    result = ingestion.run(multi_page_pdf, chunk)
+
+    assert result['resumed'] == 1
+    assert all(node.ref_doc_id for node in result['nodes'])
+
+
+def test_page_range_runs_only_its_own_shards(tmp_path, multi_page_pdf):
+    ingestion = CheckpointedIngestion(LocalCheckpointStore(str(tmp_path / 'checkpoints')), shard_pages=3)
+    progress = []
+
+    result = ingestion.run(multi_page_pdf, keep_pages, pages=(3, 7), progress=lambda *p: progress.append(p))
+
+    assert [n.metadata['page'] for n in result['nodes']] == [4, 5, 6, 7]
+    assert progress == [(3, 4), (4, 4)]
+    with pytest.raises(ValueError):
+        ingestion.run(multi_page_pdf, keep_pages, pages=(2, 5))
@@ -0,0 +1,187 @@
+import time
+import fakeredis
+import pytest
+from src.distributed_processor import DistributedPDFProcessor
+from src.pdf_worker import PDFWorker
+from conftest import write_pdf
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+def make_processor(redis, **config):
+    return DistributedPDFProcessor({'SPOOL_DIR': 'unused', **config}, redis=redis)
+
+
+def batch_status(processor, batch_id):
+    return processor.parse_batch_status(batch_id, processor.redis.hgetall(processor.batch_prefix + batch_id))
+
+
+def test_completed_job_counts_once_in_its_batch(redis):
+    processor = make_processor(redis)
+    batch_id = processor.process_pdf_batch(['/data/a.pdf', '/data/b.pdf'])
+
+    job = processor.claim_job()
+    assert processor.complete_job(job) == 'done'
+    assert batch_status(processor, batch_id)['status'] == 'processing'
+
+    assert processor.complete_job(processor.claim_job()) == 'done'
+    status = batch_status(processor, batch_id)
+    assert status['status'] == 'completed'
+    assert status['processed'] == 2
+    assert processor.claim_job() is None
+
+
+def test_expired_lease_is_requeued_and_late_completion_is_stale(redis):
+    processor = make_processor(redis, VISIBILITY_TIMEOUT=1)
+    batch_id = processor.process_pdf_batch(['/data/a.pdf'])
+
+    first = processor.claim_job()
+    assert processor.requeue_expired() == 0
+    time.sleep(1.2)
+    assert processor.requeue_expired() == 1
+    assert processor.extend_lease(first) is False
+
+    second = processor.claim_job()
+    assert second['job_id'] == first['job_id']
+    assert second['attempts'] == '1'
+
+    # The first worker comes back after its lease was handed over
+    assert processor.complete_job(first) == 'stale'
+    assert batch_status(processor, batch_id)['processed'] == 0
+
+    assert processor.complete_job(second) == 'done'
+    assert batch_status(processor, batch_id)['processed'] == 1
+
+
+def test_failed_job_is_retried_then_marked_failed(redis):
+    processor = make_processor(redis, MAX_RETRIES=2)
+    batch_id = processor.process_pdf_batch(['/data/a.pdf'])
+
+    assert processor.fail_job(processor.claim_job(), 'parse error') == 'retry'
+    assert batch_status(processor, batch_id)['status'] == 'processing'
+
+    job = processor.claim_job()
+    assert processor.fail_job(job, 'parse error') == 'failed'
+    assert processor.claim_job() is None
+
+    status = batch_status(processor, batch_id)
+    assert status['status'] == 'completed'
+    assert status['failed'] == 1
+    assert status['documents'][0]['status'] == 'failed'
+    assert processor.get_status()['failed'] == 1
+
+
+def test_lease_expiring_on_the_last_attempt_fails_the_job(redis):
+    processor = make_processor(redis, VISIBILITY_TIMEOUT=1, MAX_RETRIES=1)
+    batch_id = processor.process_pdf_batch(['/data/a.pdf'])
+
+    processor.claim_job()
+    time.sleep(1.2)
+    assert processor.requeue_expired() == 1
+    assert processor.claim_job() is None
+    assert batch_status(processor, batch_id)['failed'] == 1
+
+
+def test_heartbeat_keeps_a_long_job_leased(redis):
+    processor = make_processor(redis, VISIBILITY_TIMEOUT=3)
+    batch_id = processor.process_pdf_batch(['/data/a.pdf'])
+
+    def slow_handler(job):
+        time.sleep(4)
+        # Another worker reaping meanwhile must not take the job away
+        assert processor.requeue_expired() == 0
+        return {}
+
+    assert PDFWorker(processor, slow_handler).run_once() is True
+    assert batch_status(processor, batch_id)['processed'] == 1
+
+
+def test_worker_reports_handler_errors_as_retries(redis):
+    processor = make_processor(redis, MAX_RETRIES=3)
+    batch_id = processor.process_pdf_batch(['/data/a.pdf'])
+
+    def broken_handler(job):
+        raise RuntimeError('embedding service down')
+
+    worker = PDFWorker(processor, broken_handler)
+    assert worker.run_once() is True
+    job = processor.claim_job()
+    assert job['attempts'] == '1'
+    assert job['error'] == 'embedding service down'
+    assert batch_status(processor, batch_id)['status'] == 'processing'
+
+
+def claim_order(processor):
+    order = []
+    while (job := processor.claim_job()) is not None:
+        order.append(job)
+        processor.complete_job(job)
+    return order
+
+
+def test_long_pdf_is_split_into_page_range_jobs(redis, tmp_path):
+    processor = make_processor(redis, CHECKPOINT_SHARD_PAGES=10)
+    batch_id = processor.process_pdf_batch([write_pdf(tmp_path / 'long.pdf', 25)])
+
+    jobs = claim_order(processor)
+
+    assert [(j['start'], j['end']) for j in jobs] == [('0', '10'), ('10', '20'), ('20', '25')]
+    assert len({j['doc_id'] for j in jobs}) == 1
+    status = batch_status(processor, batch_id)
+    assert status['processed'] == 1
+    assert status['pages_total'] == 25
+    assert status['documents'][0]['ranges_done'] == 3
+
+
+def test_small_uploads_do_not_wait_behind_a_long_backfill(redis, tmp_path):
+    processor = make_processor(redis, CHECKPOINT_SHARD_PAGES=10)
+    processor.process_pdf_batch([write_pdf(tmp_path / 'backfill.pdf', 200)], tenant='backfill')
+    small = [write_pdf(tmp_path / f'small_{i}.pdf', 2) for i in range(5)]
+    processor.process_pdf_batch(small, tenant='acme')
+
+    first_claims = [processor.claim_job()['filename'] for _ in range(6)]
+
+    # At most one backfill range goes ahead of the five small uploads
+    assert sum(name.startswith('small_') for name in first_claims) == 5
+
+
+def test_document_counts_in_its_batch_once_every_range_is_done(redis, tmp_path):
+    processor = make_processor(redis, CHECKPOINT_SHARD_PAGES=10, MAX_RETRIES=1)
+    batch_id = processor.process_pdf_batch([write_pdf(tmp_path / 'long.pdf', 30)])
+
+    first, second, third = (processor.claim_job() for _ in range(3))
+    processor.report_progress(first, 10, 10)
+    processor.complete_job(first)
+    processor.report_progress(second, 4, 10)
+    processor.fail_job(second, 'parse error')
+
+    status = batch_status(processor, batch_id)
+    assert status['status'] == 'processing'
+    assert status['pages_done'] == 14
+    assert status['documents'][0]['pages_done'] == 14
+
+    processor.report_progress(third, 10, 10)
+    processor.complete_job(third)
+    status = batch_status(processor, batch_id)
+    assert status['status'] == 'completed'
+    assert (status['processed'], status['failed']) == (0, 1)
+    assert status['documents'][0]['status'] == 'failed'
+
+
+def test_finished_jobs_and_completed_batches_expire(redis, tmp_path):
+    processor = make_processor(redis, CHECKPOINT_SHARD_PAGES=10, JOB_RETENTION=600)
+    batch_id = processor.process_pdf_batch([write_pdf(tmp_path / 'long.pdf', 20), '/data/b.pdf'])
+    batch_key = processor.batch_prefix + batch_id
+
+    first = processor.claim_job()
+    processor.complete_job(first)
+    assert 0 < redis.ttl(processor.job_prefix + first['job_id']) <= 600
+    assert redis.ttl(batch_key) == -1
+
+    for job in (processor.claim_job(), processor.claim_job()):
+        processor.complete_job(job)
+    assert batch_status(processor, batch_id)['status'] == 'completed'
+    assert 0 < redis.ttl(batch_key) <= 600
@@ -0,0 +1,60 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import threading
+import orjson
+import pytest
+from src.rate_limit import aget_query_embeddings
+from src.work_nvidia import EMBED_BATCH_SIZE, NVIDIABatchEmbedding
+
+
+@pytest.fixture
+def embeddings_server():
+    """Local OpenAI-style /v1/embeddings endpoint recording (input_type, inputs) per request"""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, payload):
+            body = orjson.dumps(payload)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._reply({'data': [{'id': 'stub-embed', 'object': 'model'}]})
+
+        def do_POST(self):
+            payload = orjson.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            requests.append((payload.get('input_type'), len(payload['input'])))
+            self._reply({
+                'object': 'list',
+                'model': 'stub-embed',
+                'data': [
+                    {'object': 'embedding', 'index': i, 'embedding': [float(i), 1.0]}
+                    for i in range(len(payload['input']))
+                ],
+                'usage': {'prompt_tokens': 1, 'total_tokens': 1},
+            })
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v1", requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_nvidia_questions_are_embedded_as_queries_per_batch(embeddings_server):
+    base_url, requests = embeddings_server
+    embed_model = NVIDIABatchEmbedding(
+        model='stub-embed', base_url=base_url, truncate='END', embed_batch_size=EMBED_BATCH_SIZE
+    )
+
+    embeddings = asyncio.run(aget_query_embeddings(embed_model, [f"q{i}" for i in range(300)]))
+
+    assert len(embeddings) == 300
+    assert embeddings[256] == [0.0, 1.0]
+    assert requests == [('query', 256), ('query', 44)]
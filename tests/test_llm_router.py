@@ -0,0 +1,135 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+import orjson
+import pytest
+from llama_index.core.llms import ChatMessage
+from llama_index.llms.openai import OpenAI
+from src.llm_router import RoutingLLM
+
+
+class StubProvider:
+    """Local HTTP server answering OpenAI chat completions after `delay` seconds"""
+
+    def __init__(self, name: str, delay: float = 0.0, status: int = 200):
+        self.name = name
+        self.delay = delay
+        self.status = status
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.calls += 1
+                time.sleep(stub.delay)
+                body = orjson.dumps({
+                    'id': 'chatcmpl-stub',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': 'gpt-4',
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': f"answer from {stub.name}"},
+                        'finish_reason': 'stop',
+                    }],
+                    'usage': {'prompt_tokens': 1, 'completion_tokens': 3, 'total_tokens': 4},
+                } if stub.status == 200 else {'error': {'message': 'stub failure', 'type': 'server_error'}})
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def llm(self) -> OpenAI:
+        return OpenAI(
+            model='gpt-4',
+            api_key='stub',
+            api_base=f"http://127.0.0.1:{self.server.server_port}/v1",
+            max_retries=0,
+            timeout=10,
+        )
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    created = []
+
+    def make(name, delay=0.0, status=200):
+        created.append(StubProvider(name, delay, status))
+        return created[-1]
+
+    yield make
+    for stub in created:
+        stub.close()
+
+
+def ask(router: RoutingLLM) -> str:
+    return router.chat([ChatMessage(role='user', content='hello')]).message.content
+
+
+def test_hedges_to_the_backup_when_the_primary_is_slow(stubs):
+    slow, fast = stubs('slow', delay=2.0), stubs('fast')
+    router = RoutingLLM({'slow': slow.llm(), 'fast': fast.llm()}, default_hedge_delay=0.2)
+
+    start = time.perf_counter()
+    answer = ask(router)
+
+    assert answer == 'answer from fast'
+    assert time.perf_counter() - start < 1.5
+    assert slow.calls == 1 and fast.calls == 1
+
+
+def test_fast_primary_is_not_hedged(stubs):
+    primary, backup = stubs('primary'), stubs('backup')
+    router = RoutingLLM({'primary': primary.llm(), 'backup': backup.llm()}, default_hedge_delay=1.0)
+
+    assert ask(router) == 'answer from primary'
+    assert backup.calls == 0
+
+
+def test_fails_over_when_the_primary_errors(stubs):
+    broken, healthy = stubs('broken', status=500), stubs('healthy')
+    router = RoutingLLM({'broken': broken.llm(), 'healthy': healthy.llm()}, default_hedge_delay=5.0)
+
+    assert ask(router) == 'answer from healthy'
+    assert router.get_stats()['broken']['samples'] == 1
+
+
+def test_routes_to_the_fastest_provider_once_warmed_up(stubs):
+    slower, faster = stubs('slower', delay=0.15), stubs('faster', delay=0.0)
+    router = RoutingLLM(
+        {'slower': slower.llm(), 'faster': faster.llm()}, min_samples=3, default_hedge_delay=5.0
+    )
+    # Warm both up directly so each has enough latency samples
+    for _ in range(3):
+        router._timed_call('slower', lambda llm: llm.chat([ChatMessage(role='user', content='hi')]))
+        router._timed_call('faster', lambda llm: llm.chat([ChatMessage(role='user', content='hi')]))
+
+    assert router._ranked_providers()[0] == 'faster'
+    assert ask(router) == 'answer from faster'
+
+
+def test_unhealthy_provider_is_skipped_until_its_cooldown_expires(stubs):
+    broken, healthy = stubs('broken', status=500), stubs('healthy')
+    router = RoutingLLM(
+        {'broken': broken.llm(), 'healthy': healthy.llm()},
+        min_samples=2, max_error_rate=0.4, cooldown=60, default_hedge_delay=5.0,
+    )
+    for _ in range(2):
+        ask(router)
+    calls = broken.calls
+
+    assert router.get_stats()['broken']['healthy'] is False
+    assert ask(router) == 'answer from healthy'
+    assert broken.calls == calls
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import fakeredis
+import pytest
+from conftest import page_marker, write_pdf
+from src import pdf_worker
+from src.distributed_processor import DistributedPDFProcessor
+
+
+CONFIG = {"INDEX_NAME": "test", "EMBEDDINGS_PROVIDER": "local", "CHECKPOINT_SHARD_PAGES": 3}
+
+
+@pytest.fixture
+def redis(tmp_path, monkeypatch):
+    redis = fakeredis.FakeRedis()
+    monkeypatch.setattr(pdf_worker, "ROOT_DIR", str(tmp_path))
+    monkeypatch.setattr(pdf_worker.Redis, "from_url", lambda *args, **kwargs: redis)
+    return redis
+
+
+@pytest.fixture
+def handler(redis):
+    return pdf_worker.make_index_handler(CONFIG)
+
+
+def stored(tmp_path):
+    index_dir = os.path.join(tmp_path, "saves", "test")
+    with open(os.path.join(index_dir, "docstore.json"), encoding="utf-8") as f:
+        docs = {k: v["__data__"] for k, v in json.load(f)["docstore/data"].items()}
+    with open(os.path.join(index_dir, "default__vector_store.json"), encoding="utf-8") as f:
+        embeddings = json.load(f)["embedding_dict"]
+    return docs, embeddings
+
+
+def test_repeated_document_is_stored_as_references_to_the_original(handler, multi_page_pdf, tmp_path):
+    first = handler({"job_id": "1", "path": multi_page_pdf, "filename": "v1.pdf"})
+    second = handler({"job_id": "2", "path": multi_page_pdf, "filename": "v2.pdf"})
+
+    assert first["duplicate_chunks"] == 0
+    assert second["duplicate_chunks"] == second["nodes"] == first["nodes"]
+
+    docs, embeddings = stored(tmp_path)
+    originals = {k for k, d in docs.items() if d["metadata"]["filename"] == "v1.pdf"}
+    references = {k: d for k, d in docs.items() if d["metadata"]["filename"] == "v2.pdf"}
+    assert len(references) == len(originals)
+    for node_id, node in references.items():
+        original = node["metadata"]["duplicate_of"]
+        assert original in originals
+        # Retrievable for the new document with the original's embedding
+        assert embeddings[node_id] == embeddings[original]
+
+
+def test_page_range_jobs_of_one_pdf_fill_the_index_and_its_progress(redis, multi_page_pdf, tmp_path):
+    processor = DistributedPDFProcessor(CONFIG, redis=redis)
+    worker = pdf_worker.PDFWorker(processor, pdf_worker.make_index_handler(CONFIG, processor=processor))
+    batch_id = processor.process_pdf_batch([multi_page_pdf])
+
+    while worker.run_once():
+        pass
+
+    status = processor.parse_batch_status(batch_id, redis.hgetall(processor.batch_prefix + batch_id))
+    assert status["status"] == "completed"
+    assert status["processed"] == 1
+    assert (status["pages_done"], status["pages_total"]) == (7, 7)
+    assert status["documents"][0]["ranges_done"] == 3
+    docs, _ = stored(tmp_path)
+    text = "\n".join(d["text"] for d in docs.values())
+    for page in range(7):
+        assert page_marker(page) in text
+    # Each range cleared its own checkpoints
+    assert not os.listdir(os.path.join(tmp_path, "saves", "checkpoints"))
+
+
+def test_pipelined_worker_runs_every_job_through_parse_embed_and_upsert(redis, tmp_path):
+    processor = DistributedPDFProcessor(CONFIG, redis=redis)
+    worker = pdf_worker.PDFWorker(
+        processor,
+        pdf_worker.make_index_handler(CONFIG, processor=processor),
+        poll_interval=0.05,
+        bounds={"parse": (2, 4), "embed": (2, 4)},
+        autoscale_interval=0.1,
+    )
+    paths = [write_pdf(tmp_path / f"doc{i}.pdf", 7) for i in range(3)]
+    batch_id = processor.process_pdf_batch(paths)
+
+    def status():
+        return processor.parse_batch_status(batch_id, redis.hgetall(processor.batch_prefix + batch_id))
+
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    try:
+        pipeline = worker.build_pipeline()
+        assert [stage.workers for stage in pipeline.stages] == [2, 2, 1]
+        while status()["status"] != "completed":
+            assert thread.is_alive()
+            thread.join(0.1)
+    finally:
+        worker.stop()
+        thread.join()
+
+    assert (status()["processed"], status()["pages_done"]) == (3, 21)
+    docs, embeddings = stored(tmp_path)
+    assert set(docs) == set(embeddings)
+    for path in paths:
+        text = "\n".join(d["text"] for d in docs.values() if d["metadata"]["filename"] == os.path.basename(path))
+        for page in range(7):
+            assert page_marker(page) in text
+    assert not os.listdir(os.path.join(tmp_path, "saves", "checkpoints"))
@@ -0,0 +1,33 @@
+import fakeredis
+import pytest
+from src import performance
+
+
+@pytest.fixture
+def make_optimizer(monkeypatch):
+    redis = fakeredis.FakeRedis()
+    monkeypatch.setattr(performance.Redis, "from_url", lambda *args, **kwargs: redis)
+    created = []
+
+    def make(**config):
+        created.append(performance.PerformanceOptimizer(config))
+        return created[-1]
+
+    yield make
+    for optimizer in created:
+        if hasattr(optimizer.cache, "close"):
+            optimizer.cache.close()
+
+
+@pytest.mark.parametrize("local_entries", [0, 100])
+def test_metrics_report_hit_rate_and_average_batch_time(make_optimizer, local_entries):
+    optimizer = make_optimizer(CACHE_LOCAL_MAX_ENTRIES=local_entries, BATCH_SIZE=2)
+
+    assert optimizer.get_performance_metrics()["processing_time_avg"] == 0.0
+    optimizer.batch_process_documents(["a", "b"])
+    optimizer.batch_process_documents(["a", "b", "c", "d"])
+
+    metrics = optimizer.get_performance_metrics()
+    assert metrics["cache_hit_rate"]["overall"] == pytest.approx(2 / 6)
+    assert metrics["processing_time_avg"] > 0.0
+    assert optimizer.stats["batches"] == 3
@@ -0,0 +1,118 @@
+import asyncio
+import time
+import fakeredis
+import pytest
+from src.local_provider import LocalEmbedding
+from src.rate_limit import (
+    BULK,
+    INTERACTIVE,
+    RateLimitedEmbedding,
+    TokenBucketRateLimiter,
+    aget_query_embeddings,
+    make_rate_limiter,
+    parse_rate_limits,
+)
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("openai:gpt-4=500/300000; nvidia=60/;bad;local=/1000") == {
+        "openai:gpt-4": (500, 300000),
+        "nvidia": (60, None),
+        "local": (None, 1000),
+    }
+
+
+def test_make_rate_limiter_reads_the_shared_config(redis):
+    assert make_rate_limiter({}, redis) is None
+
+    limiter = make_rate_limiter({"RATE_LIMITS": "nvidia=60/", "RATE_LIMIT_BULK_RESERVE": "0.5"}, redis)
+    assert limiter.limits == {"nvidia": (60, None)}
+    assert limiter.bulk_reserve == 0.5
+
+
+def test_bucket_grants_up_to_capacity_then_asks_to_wait(redis):
+    limiter = TokenBucketRateLimiter(redis, {"nvidia": (60, None)}, bulk_reserve=0.0)
+    buckets = limiter._buckets("nvidia", "embed", 1)
+
+    grants = [limiter._try_acquire(buckets, INTERACTIVE) for _ in range(60)]
+    wait = limiter._try_acquire(buckets, INTERACTIVE)
+
+    assert grants == [0.0] * 60
+    # 60 requests/min refill one request per second
+    assert 0.5 < wait <= 1.0
+
+
+def test_provider_wide_limit_is_shared_by_its_models(redis):
+    limiter = TokenBucketRateLimiter(redis, {"nvidia": (2, None), "openai:gpt-4": (2, None)})
+
+    assert limiter._buckets("nvidia", "a", 1)[0][0] == limiter._buckets("nvidia", "b", 1)[0][0]
+    assert limiter._buckets("openai", "gpt-4", 1)[0][0] == "ratelimit:openai:gpt-4:rpm"
+
+    limiter.acquire("nvidia", "a")
+    limiter.acquire("nvidia", "b")
+    assert limiter._try_acquire(limiter._buckets("nvidia", "c", 1), INTERACTIVE) > 0
+
+
+def test_bulk_callers_leave_the_reserve_to_interactive_ones(redis):
+    limiter = TokenBucketRateLimiter(redis, {"nvidia": (None, 100)}, bulk_reserve=0.2)
+
+    assert limiter._try_acquire(limiter._buckets("nvidia", "m", 80), BULK) == 0.0
+    # 20 tokens left: all of them are reserved for interactive traffic
+    assert limiter._try_acquire(limiter._buckets("nvidia", "m", 10), BULK) > 0
+    assert limiter._try_acquire(limiter._buckets("nvidia", "m", 10), INTERACTIVE) == 0.0
+
+
+def test_acquire_waits_for_refill_instead_of_failing(redis):
+    limiter = TokenBucketRateLimiter(redis, {"local": (None, 600)}, bulk_reserve=0.0)
+    limiter.acquire("local", "m", tokens=600)
+
+    start = time.monotonic()
+    limiter.acquire("local", "m", tokens=5)
+
+    # 600 tokens/min refill 10 per second
+    assert 0.4 < time.monotonic() - start < 2.0
+
+
+def test_limiter_instances_share_buckets_through_redis(redis):
+    first = TokenBucketRateLimiter(redis, {"nvidia": (3, None)})
+    second = TokenBucketRateLimiter(redis, {"nvidia": (3, None)})
+
+    first.acquire("nvidia", "m")
+    second.acquire("nvidia", "m")
+    first.acquire("nvidia", "m")
+
+    assert second._try_acquire(second._buckets("nvidia", "m", 1), INTERACTIVE) > 0
+
+
+def test_debit_charges_tokens_without_waiting(redis):
+    limiter = TokenBucketRateLimiter(redis, {"nvidia": (None, 100)}, bulk_reserve=0.0)
+    limiter.debit("nvidia", "m", 150)
+
+    assert limiter._try_acquire(limiter._buckets("nvidia", "m", 1), INTERACTIVE) > 0
+
+
+def test_rate_limited_embedding_takes_quota_per_call(redis):
+    limiter = TokenBucketRateLimiter(redis, {"local": (5, None)})
+    embed_model = RateLimitedEmbedding(LocalEmbedding(), limiter, provider="local")
+
+    embed_model.get_text_embedding_batch(["a", "b", "c"])
+    embed_model.get_query_embedding("question")
+
+    level = float(redis.hget("ratelimit:local:rpm", "tokens"))
+    assert 2.9 < level < 3.5
+
+
+def test_rate_limited_query_batch_is_one_interactive_call(redis):
+    limiter = TokenBucketRateLimiter(redis, {"local": (5, None)}, bulk_reserve=0.8)
+    embed_model = RateLimitedEmbedding(LocalEmbedding(), limiter, provider="local")
+
+    embeddings = asyncio.run(aget_query_embeddings(embed_model, ["a", "b", "c"]))
+
+    assert len(embeddings) == 3
+    level = float(redis.hget("ratelimit:local:rpm", "tokens"))
+    assert 3.9 < level < 4.5
@@ -0,0 +1,134 @@
+import multiprocessing
+import threading
+import time
+import fakeredis
+import pytest
+from fakeredis import TcpFakeServer
+from redis import Redis
+from src.sharding import ClusterMembership, HashRing, ShardRouter
+
+KEYS = [f"doc-{i}" for i in range(5000)]
+
+
+def owners(ring):
+    return {key: ring.owner(key) for key in KEYS}
+
+
+def test_joining_node_only_takes_keys_and_leaving_node_only_gives_its_own():
+    ring = HashRing(["a", "b", "c"])
+    before = owners(ring)
+
+    ring.add("d")
+    joined = owners(ring)
+    moved = {key for key in KEYS if joined[key] != before[key]}
+    assert moved and all(joined[key] == "d" for key in moved)
+    # Roughly its fair share, not a reshuffle
+    assert len(moved) < len(KEYS) / 2
+
+    ring.remove("b")
+    left = owners(ring)
+    moved = {key for key in KEYS if left[key] != joined[key]}
+    assert moved == {key for key in KEYS if joined[key] == "b"}
+
+
+def test_every_node_gets_a_share_of_the_keys():
+    ring = HashRing(["a", "b", "c", "d"])
+    counts = {}
+    for node in owners(ring).values():
+        counts[node] = counts.get(node, 0) + 1
+    assert set(counts) == {"a", "b", "c", "d"}
+    assert min(counts.values()) > len(KEYS) / 8
+
+
+@pytest.fixture
+def redis_server():
+    """fakeredis over TCP, so separate processes share it"""
+    server = TcpFakeServer(("127.0.0.1", 0))
+    # Connection threads must not keep the test process alive
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def run_node(address, node_id, ttl, joined, stop, results):
+    membership = ClusterMembership(Redis(*address), node_id=node_id, address=f"http://{node_id}", ttl=ttl)
+    membership.join()
+    joined.release()
+    # Each node computes ownership from the shared members on its own
+    while len(membership.members()) < 3:
+        time.sleep(0.05)
+    ring = membership.ring()
+    results.put((node_id, {key: ring.owner(key) for key in KEYS[:500]}))
+    stop.wait()
+    membership.leave()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_nodes_in_separate_processes_agree_on_the_ring(redis_server):
+    ctx = multiprocessing.get_context("fork")
+    joined, results = ctx.Semaphore(0), ctx.Queue()
+    # One stop event per node: killing a node waiting on a shared one would break it
+    stops = {node_id: ctx.Event() for node_id in ("a", "b", "c")}
+    nodes = {
+        node_id: ctx.Process(target=run_node, args=(redis_server, node_id, 3, joined, stop, results))
+        for node_id, stop in stops.items()
+    }
+    for process in nodes.values():
+        process.start()
+    try:
+        for _ in nodes:
+            assert joined.acquire(timeout=30)
+        router = ClusterMembership(Redis(*redis_server), ttl=3)
+        assert router.members() == ["a", "b", "c"]
+        assert router.addresses() == {"a": "http://a", "b": "http://b", "c": "http://c"}
+
+        views = dict(results.get(timeout=30) for _ in nodes)
+        ring = router.ring()
+        expected = {key: ring.owner(key) for key in KEYS[:500]}
+        assert all(view == expected for view in views.values())
+
+        # A node that dies without leaving drops out once its heartbeat expires
+        nodes["c"].kill()
+        nodes["c"].join()
+        wait_for(lambda: router.members() == ["a", "b"])
+        assert set(router.ring().nodes) == {"a", "b"}
+
+        # Leaving removes a node at once
+        for node_id in ("a", "b"):
+            stops[node_id].set()
+            nodes[node_id].join(timeout=10)
+        assert router.members() == []
+    finally:
+        for process in nodes.values():
+            if process.is_alive():
+                process.kill()
+
+
+def test_fan_out_merges_hits_by_score_and_skips_failed_nodes():
+    redis = fakeredis.FakeRedis()
+    for node_id in ("a", "b", "c"):
+        ClusterMembership(redis, node_id=node_id, address=f"http://{node_id}").heartbeat()
+    router = ShardRouter(ClusterMembership(redis))
+    hits = {
+        "a": [{"id": "a1", "score": 0.9}, {"id": "a2", "score": 0.3}],
+        "b": [{"id": "b1", "score": 0.7}],
+    }
+
+    def call(node, address):
+        assert address == f"http://{node}"
+        if node == "c":
+            raise ConnectionError("node down")
+        return hits[node]
+
+    merged = router.fan_out(call, top_k=2)
+
+    assert [(hit["id"], hit["node"]) for hit in merged] == [("a1", "a"), ("b1", "b")]
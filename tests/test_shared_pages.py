@@ -0,0 +1,40 @@
+from multiprocessing import shared_memory
+import pytest
+from src.pdf_utils import parse_pdf_pages
+from src.shared_pages import SharedMemoryPageParser, SharedPageArena, write_pages_to_shared_memory
+from conftest import page_marker
+
+
+def test_arena_round_trips_page_text(multi_page_pdf):
+    handle = write_pages_to_shared_memory(multi_page_pdf, 2, 5)
+    arena = SharedPageArena(handle)
+
+    assert len(arena) == 3
+    for i, page in enumerate(range(2, 5)):
+        assert page_marker(page) in arena[i].text
+        assert bytes(arena.text_view(i)).decode('utf-8') == arena[i].text
+        assert arena[i].metadata['page'] == page + 1
+
+    arena.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=handle['name'])
+
+
+def test_parser_matches_in_process_parsing(multi_page_pdf):
+    parser = SharedMemoryPageParser(processes=1)
+    try:
+        with parser(multi_page_pdf, 0, 7) as arena:
+            expected = parse_pdf_pages(multi_page_pdf, 0, 7)
+            assert [doc.text for doc in arena] == [doc.text for doc in expected]
+            assert [doc.metadata for doc in arena] == [doc.metadata for doc in expected]
+    finally:
+        parser.close()
+
+
+def test_parser_raises_when_parsing_fails(tmp_path):
+    parser = SharedMemoryPageParser(processes=1)
+    try:
+        with pytest.raises(Exception):
+            parser(str(tmp_path / 'missing.pdf'), 0, 1)
+    finally:
+        parser.close()
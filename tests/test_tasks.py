@@ -0,0 +1,52 @@
+import json
+import os
+import pytest
+from conftest import page_marker
+
+# The graph runs in-process with the in-memory broker
+os.environ.setdefault("CELERY_EAGER", "1")
+
+from src import tasks  # noqa: E402
+from src.local_provider import LocalEmbedding  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def local_embeddings(monkeypatch):
+    monkeypatch.setattr(tasks, "_embed_model", LocalEmbedding())
+
+
+def stored_nodes(index_dir):
+    with open(os.path.join(index_dir, "docstore.json"), encoding="utf-8") as f:
+        return list(json.load(f)["docstore/data"].values())
+
+
+def test_graph_merges_every_shard_into_the_index(multi_page_pdf, tmp_path):
+    index_dir = str(tmp_path / "index")
+
+    result = tasks.ingest_pdf(multi_page_pdf, index_dir=index_dir, shard_pages=3).get()
+
+    assert tasks.EAGER
+    assert result["shards"] == 3
+    assert result["nodes"] > 0
+    text = "\n".join(node["__data__"]["text"] for node in stored_nodes(index_dir))
+    for page in range(7):
+        assert page_marker(page) in text
+    # Staged shards are removed once merged
+    assert not os.listdir(os.path.join(index_dir, "_staging"))
+
+
+def test_second_pdf_is_merged_into_the_existing_index(multi_page_pdf, tmp_path):
+    index_dir = str(tmp_path / "index")
+
+    first = tasks.ingest_pdf(multi_page_pdf, index_dir=index_dir, shard_pages=4).get()
+    second = tasks.ingest_pdf(multi_page_pdf, index_dir=index_dir, shard_pages=7).get()
+
+    assert len(stored_nodes(index_dir)) == first["nodes"] + second["nodes"]
+
+
+def test_parse_error_fails_the_task_instead_of_storing_nothing(tmp_path):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+
+    with pytest.raises(Exception):
+        tasks.parse_shard.delay(str(broken), 0, 1, "broken.pdf").get()
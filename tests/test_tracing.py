@@ -0,0 +1,50 @@
+import time
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMChatStartEvent
+from llama_index.core.llms import ChatMessage, ChatResponse
+from src.tracing import LlamaIndexSpanHandler, trace
+
+
+def chat_start(span_id):
+    return LLMChatStartEvent(messages=[], additional_kwargs={}, model_dict={}, span_id=span_id)
+
+
+def chat_end(span_id):
+    return LLMChatEndEvent(
+        messages=[], response=ChatResponse(message=ChatMessage(content="done")), span_id=span_id
+    )
+
+
+def test_matched_events_become_a_finished_span():
+    handler = LlamaIndexSpanHandler()
+
+    with trace('chat') as t:
+        handler.handle(chat_start('s1'))
+        handler.handle(chat_end('s1'))
+
+    assert [s.name for s in t.spans] == ['llm.chat', 'chat']
+    assert not handler._open
+
+
+def test_span_without_end_is_abandoned_when_its_trace_ends():
+    handler = LlamaIndexSpanHandler()
+
+    with trace('chat') as t:
+        # A streamed answer cancelled before its end event
+        handler.handle(chat_start('s1'))
+
+    assert not handler._open
+    chat = next(s for s in t.spans if s.name == 'llm.chat')
+    assert chat.attrs == {'unfinished': True}
+    assert chat.end is not None
+    # A late end event is ignored
+    handler.handle(chat_end('s1'))
+
+
+def test_span_without_end_outside_a_trace_is_dropped_after_max_age():
+    handler = LlamaIndexSpanHandler(max_age=0.05)
+
+    handler.handle(chat_start('s1'))
+    time.sleep(0.1)
+    handler.handle(chat_start('s2'))
+
+    assert list(handler._open) == [('llm.chat', 's2')]
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+import mongomock
+from src.write_behind import AsyncWriteBehindBuffer
+
+
+class RecordingCollection:
+    """mongomock collection that records the size of every bulk call"""
+
+    def __init__(self, delay: float = 0.0):
+        self.collection = mongomock.MongoClient().db.records
+        self.name = self.collection.name
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def insert_many(self, documents, ordered=True):
+        with self.lock:
+            self.calls.append(len(documents))
+        time.sleep(self.delay)
+        return self.collection.insert_many(documents, ordered=ordered)
+
+    def bulk_write(self, requests, ordered=True):
+        with self.lock:
+            self.calls.append(len(requests))
+        # mongomock's bulk_write predates UpdateOne(sort=...); apply them one by one
+        for request in requests:
+            self.collection.update_one(request._filter, request._doc, upsert=request._upsert)
+
+
+def test_documents_are_written_in_batches_of_max_batch():
+    records = RecordingCollection()
+
+    async def main():
+        buffer = AsyncWriteBehindBuffer(records, max_batch=500, flush_interval=0.5)
+        for i in range(1200):
+            await buffer.put({'n': i})
+        await buffer.close()
+
+    asyncio.run(main())
+
+    assert records.calls == [500, 500, 200]
+    assert records.collection.count_documents({}) == 1200
+
+
+def test_partial_batch_is_written_after_flush_interval():
+    records = RecordingCollection()
+
+    async def main():
+        buffer = AsyncWriteBehindBuffer(records, max_batch=500, flush_interval=0.1)
+        await buffer.put({'n': 1})
+        await buffer.put({'n': 2})
+        await asyncio.sleep(0.5)
+        # Written without flush() or close()
+        assert records.collection.count_documents({}) == 2
+        await buffer.close()
+
+    asyncio.run(main())
+    assert records.calls == [2]
+
+
+def test_upsert_key_updates_instead_of_inserting():
+    records = RecordingCollection()
+
+    async def main():
+        buffer = AsyncWriteBehindBuffer(records, max_batch=10, flush_interval=0.05, upsert_key='user')
+        await buffer.put({'user': 'a', 'logins': 1})
+        await buffer.flush()
+        await buffer.put({'user': 'a', 'logins': 2})
+        await buffer.put({'user': 'b', 'logins': 1})
+        await buffer.close()
+
+    asyncio.run(main())
+
+    assert records.collection.count_documents({}) == 2
+    assert records.collection.find_one({'user': 'a'})['logins'] == 2
+
+
+def test_unordered_batch_keeps_documents_after_a_failed_one():
+    records = RecordingCollection()
+    records.collection.insert_one({'_id': 'taken'})
+
+    async def main():
+        buffer = AsyncWriteBehindBuffer(records, max_batch=10, flush_interval=0.05)
+        for doc in ({'_id': 'first'}, {'_id': 'taken'}, {'_id': 'last'}):
+            await buffer.put(doc)
+        await buffer.close()
+
+    asyncio.run(main())
+
+    assert {d['_id'] for d in records.collection.find()} == {'taken', 'first', 'last'}
+
+
+def test_full_buffer_makes_put_wait_for_the_writer():
+    records = RecordingCollection(delay=0.3)
+
+    async def main():
+        buffer = AsyncWriteBehindBuffer(records, max_batch=2, flush_interval=0.01, max_queue=2)
+        await buffer.put({'n': 0})
+        await buffer.put({'n': 1})
+        await asyncio.sleep(0.05)
+        # The writer holds the first batch; two more fill the queue
+        await buffer.put({'n': 2})
+        await buffer.put({'n': 3})
+        start = time.perf_counter()
+        await buffer.put({'n': 4})
+        waited = time.perf_counter() - start
+        await buffer.close()
+        return waited
+
+    waited = asyncio.run(main())
+
+    assert waited > 0.15
+    assert records.collection.count_documents({}) == 5